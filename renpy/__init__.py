@@ -83,6 +83,7 @@ name_blacklist = {
     "renpy.loadsave.autosave_not_running",
     "renpy.python.unicode_re",
     "renpy.python.string_re",
+    "renpy.python.REACHED_ATOMIC_TYPES",
     "renpy.text.text.VERT_FORWARD",
     "renpy.text.text.VERT_REVERSE",
     "renpy.savelocation.scan_thread_condition",
@@ -92,6 +93,8 @@ name_blacklist = {
     "renpy.display.render.blit_lock",
     "renpy.display.render.IDENTITY",
     "renpy.loader.auto_lock",
+    "renpy.loader.RPA4_ENTRY",
+    "renpy.loader.RPA4_SCRIPT",
     "renpy.display.screen.cprof",
     }
 
@@ -304,6 +307,7 @@ def import_all():
     import renpy.display.dragdrop #@UnresolvedImport
     import renpy.display.imagemap #@UnresolvedImport
     import renpy.display.predict #@UnresolvedImport
+    import renpy.display.frametime #@UnresolvedImport
     import renpy.display.emulator # @UnresolvedImport
     import renpy.display.tts # @UnresolvedImport
 
@@ -327,12 +331,14 @@ def import_all():
 
     import renpy.lint #@UnresolvedImport
     import renpy.warp #@UnresolvedImport
+    import renpy.playthrough #@UnresolvedImport
 
     import renpy.editor #@UnresolvedImport
     import renpy.exports #@UnresolvedImport
     import renpy.character # depends on exports. @UnresolvedImport
 
     import renpy.dump #@UnresolvedImport
+    import renpy.benchmark #@UnresolvedImport
 
     import renpy.config # depends on lots. @UnresolvedImport
     import renpy.minstore # depends on lots. @UnresolvedImport
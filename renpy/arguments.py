@@ -216,6 +216,15 @@ def pre_init():
     register_command("compile", compile)
     register_command("rmpersistent", rmpersistent)
     register_command("quit", quit)
+    register_command("playthrough", renpy.playthrough.command)
+    register_command("compile_benchmark", renpy.benchmark.compile_benchmark)
+    register_command("archive_benchmark", renpy.benchmark.archive_benchmark)
+    register_command("reachable_benchmark", renpy.benchmark.reachable_benchmark)
+    register_command("rollback_benchmark", renpy.benchmark.rollback_benchmark)
+    register_command("glyph_benchmark", renpy.benchmark.glyph_benchmark)
+    register_command("sw_draw_benchmark", renpy.benchmark.sw_draw_benchmark)
+    register_command("sprite_benchmark", renpy.benchmark.sprite_benchmark)
+    register_command("text_layout_benchmark", renpy.benchmark.text_layout_benchmark)
 
 
 def post_init():
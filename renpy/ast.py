@@ -717,6 +717,81 @@ class Label(Node):
         callback(self.block)
 
 
+class LazyLabel(Node):
+    """
+    Stands in for a top-level label whose statements are stored in a
+    separate part of the .rpyc file, and have not been loaded yet. The
+    label is loaded when this node is executed or predicted, or when one
+    of the statements it contains is looked up.
+    """
+
+    __slots__ = [
+        'names',
+        'offset',
+        'length',
+        'rpyc',
+        'base',
+        'block',
+        ]
+
+    def __setstate__(self, state):
+        self.rpyc = None
+        self.base = 0
+        self.block = None
+        Node.__setstate__(self, state)
+
+    def __init__(self, loc, names, offset, length):
+        """
+        `names`
+            A list of the names of all statements inside the label.
+
+        `offset`, `length`
+            The location of the pickled label, relative to the end of the
+            first part of the .rpyc file.
+        """
+
+        super(LazyLabel, self).__init__(loc)
+
+        self.names = names
+        self.offset = offset
+        self.length = length
+
+        # The name of the .rpyc file and the offset of the end of its first
+        # part. These are filled in when the .rpyc is loaded.
+        self.rpyc = None
+        self.base = 0
+
+        # The loaded block, once the label has been loaded.
+        self.block = None
+
+    def diff_info(self):
+        return (LazyLabel, self.name)
+
+    def chain(self, next): #@ReservedAssignment
+        self.next = next
+
+        if self.block is not None:
+            chain_block(self.block, next)
+
+    def load(self):
+        """
+        Loads the label, if necessary, and returns its first node.
+        """
+
+        return renpy.game.script.load_lazy(self)[0]
+
+    def execute(self):
+        next_node(self.load())
+
+    def predict(self):
+        return [ self.load() ]
+
+    def scry(self):
+        rv = Scry()
+        rv._next = self.load() # W0201
+        return rv
+
+
 class Python(Node):
 
     __slots__ = [
@@ -0,0 +1,714 @@
+# Copyright 2004-2014 Tom Rothamel <pytom@bishoujo.us>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# This file contains commands that benchmark parts of Ren'Py against the
+# current game, printing a short report to standard output.
+
+import renpy
+import os
+import time
+
+
+def report(name, seconds, baseline=None):
+    """
+    Prints a line giving the time taken by `name`. If `baseline` is
+    given, the speedup relative to it is printed as well.
+    """
+
+    if baseline is not None and seconds:
+        print "%-30s %9.3fs  (%.2fx)" % (name, seconds, baseline / seconds)
+    else:
+        print "%-30s %9.3fs" % (name, seconds)
+
+
+def compile_benchmark():
+    """
+    Compares the time it takes to parse all of the game's .rpy files
+    serially with the time it takes to parse them in a pool of worker
+    processes. This is the part of a cold start that parallel compilation
+    speeds up.
+    """
+
+    import multiprocessing
+
+    ap = renpy.arguments.ArgumentParser(description="Compares serial and parallel parsing of the game's script.")
+    ap.add_argument("--processes", type=int, default=multiprocessing.cpu_count(), help="The number of worker processes to use.")
+    ap.add_argument("--repeat", type=int, default=3, help="The number of times to repeat each measurement.")
+    args = ap.parse_args()
+
+    filenames = [ ]
+
+    for fn, dir in sorted(renpy.game.script.script_files): #@ReservedAssignment
+        if dir is None:
+            continue
+
+        fn = dir + "/" + fn + ".rpy"
+
+        if os.path.exists(fn):
+            filenames.append(fn)
+
+    print "Parsing %d files, best of %d." % (len(filenames), args.repeat)
+
+    serial = None
+    parallel = None
+
+    for _i in range(args.repeat):
+
+        start = time.time()
+
+        for fn in filenames:
+            renpy.script.parse_worker(fn)
+
+        duration = time.time() - start
+
+        if serial is None or duration < serial:
+            serial = duration
+
+        start = time.time()
+        renpy.script.parse_files(filenames, args.processes)
+        duration = time.time() - start
+
+        if parallel is None or duration < parallel:
+            parallel = duration
+
+    report("serial", serial)
+    report("parallel (%d processes)" % args.processes, parallel, serial)
+
+    return False
+
+
+def archive_benchmark():
+    """
+    Measures the time it takes to load the index of each of the given
+    archives, and the throughput of reading every file in them. Building
+    the same files into an RPA-3.0 and an RPA-4.0 archive lets the two
+    formats be compared.
+    """
+
+    ap = renpy.arguments.ArgumentParser(description="Measures archive index load time and read throughput.")
+    ap.add_argument("archives", nargs="+", help="The .rpa files to benchmark.")
+    ap.add_argument("--repeat", type=int, default=3, help="The number of times to repeat each measurement.")
+    args = ap.parse_args()
+
+    for fn in args.archives:
+
+        index_time = None
+        read_time = None
+
+        for _i in range(args.repeat):
+
+            start = time.time()
+
+            archive = renpy.loader.open_archive(os.path.splitext(fn)[0], fn)
+            names = list(archive.names())
+
+            for name in names:
+                name in archive #@NoEffect
+
+            duration = time.time() - start
+
+            if index_time is None or duration < index_time:
+                index_time = duration
+
+            size = 0
+
+            start = time.time()
+
+            for name in names:
+                size += len(archive.load(name).read())
+
+            duration = time.time() - start
+
+            if read_time is None or duration < read_time:
+                read_time = duration
+
+        print "%s (%s, %d files, %.1f MB)" % (fn, archive.header[:7], len(names), size / 1048576.0)
+        report("index load and lookup", index_time)
+        report("read all files", read_time)
+
+        if read_time:
+            print "%-30s %9.1f MB/s" % ("read throughput", size / 1048576.0 / read_time)
+
+        print
+
+    return False
+
+
+def reached_recursive(obj, reachable):
+    """
+    The recursive form of renpy.python.reached that was used before it
+    became iterative, kept as a baseline for reachable_benchmark.
+    """
+
+    idobj = id(obj)
+
+    if idobj in reachable:
+        return
+
+    if isinstance(obj, renpy.python.NoRollback):
+        reachable[idobj] = 0
+        return
+
+    reachable[idobj] = 1
+
+    if isinstance(obj, renpy.python.StoreModule):
+        return
+
+    try:
+        for v in vars(obj).itervalues():
+            reached_recursive(v, reachable)
+    except:
+        pass
+
+    try:
+        if not isinstance(obj, basestring):
+            for v in obj.__iter__():
+                reached_recursive(v, reachable)
+    except:
+        pass
+
+    try:
+        for v in obj.itervalues():
+            reached_recursive(v, reachable)
+    except:
+        pass
+
+
+def synthetic_store(count):
+    """
+    Returns a dict that looks like a large store, containing `count`
+    revertable objects held in lists and dicts.
+    """
+
+    objects = renpy.python.RevertableList()
+    index = renpy.python.RevertableDict()
+
+    for i in range(count):
+        o = renpy.python.RevertableObject()
+        o.number = i
+        o.name = "object %d" % i
+        o.flags = renpy.python.RevertableList([ i, i + 1, i + 2 ])
+        o.parent = objects[i // 2] if objects else None
+
+        objects.append(o)
+        index[o.name] = o
+
+    return { "objects" : objects, "index" : index }
+
+
+def reachable_benchmark():
+    """
+    Times renpy.python.reached, which is used to find the objects that
+    need to be kept when the rollback log is saved or loaded, on synthetic
+    stores of increasing size. The recursive walk it replaced is timed as
+    a baseline.
+    """
+
+    ap = renpy.arguments.ArgumentParser(description="Times the reachability walk used by rollback.")
+    ap.add_argument("--objects", type=int, default=100000, help="The number of objects in the largest store.")
+    ap.add_argument("--repeat", type=int, default=3, help="The number of times to repeat each measurement.")
+    args = ap.parse_args()
+
+    sizes = [ args.objects // 100, args.objects // 10, args.objects ]
+
+    for count in sizes:
+
+        store = synthetic_store(count)
+
+        iterative = None
+        recursive = None
+
+        for _i in range(args.repeat):
+
+            start = time.time()
+            renpy.python.reached_vars(store, { }, None)
+            duration = time.time() - start
+
+            if iterative is None or duration < iterative:
+                iterative = duration
+
+            start = time.time()
+
+            reachable = { }
+            for v in store.itervalues():
+                reached_recursive(v, reachable)
+
+            duration = time.time() - start
+
+            if recursive is None or duration < recursive:
+                recursive = duration
+
+        print "Store with %d objects." % count
+        report("recursive", recursive)
+        report("iterative", iterative, recursive)
+        print
+
+    # A linked list deeper than the recursion limit.
+    head = None
+
+    for _i in range(args.objects):
+        o = renpy.python.RevertableObject()
+        o.next = head
+        head = o
+
+    start = time.time()
+    renpy.python.reached(head, { }, None)
+    report("linked list of %d objects" % args.objects, time.time() - start)
+
+    return False
+
+
+def rollback_benchmark():
+    """
+    Simulates a game that changes a large list and dict a little on each
+    statement, and compares the memory used by the rollback log and the
+    time taken to record and roll back the changes when full copies and
+    deltas are stored.
+    """
+
+    ap = renpy.arguments.ArgumentParser(description="Compares full copy and delta rollback storage.")
+    ap.add_argument("--size", type=int, default=100000, help="The number of items in the list and dict.")
+    ap.add_argument("--steps", type=int, default=renpy.config.rollback_length, help="The number of statements to simulate.")
+    args = ap.parse_args()
+
+    old_log = renpy.game.log
+    old_contexts = renpy.game.contexts[:]
+    old_deltas = renpy.config.rollback_deltas
+
+    full = None
+
+    try:
+
+        for deltas in (False, True):
+
+            renpy.config.rollback_deltas = deltas
+            log = renpy.game.log = renpy.python.RollbackLog()
+
+            items = renpy.python.RevertableList(range(args.size))
+            index = renpy.python.RevertableDict((i, i) for i in range(args.size))
+
+            start = time.time()
+
+            for i in range(args.steps):
+
+                # What RollbackLog.begin does, without needing a context
+                # that supports rollback.
+                log.current = renpy.python.Rollback()
+                log.log.append(log.current)
+                log.mutated = { }
+
+                items.append(i)
+                items[i] = -i
+                index[i] = -i
+
+                log.complete()
+
+            record = time.time() - start
+            stats = log.get_stats()
+
+            start = time.time()
+
+            for rb in reversed(log.log):
+                rb.rollback()
+
+            rollback = time.time() - start
+
+            correct = (list(items) == range(args.size)) and (index == dict((i, i) for i in range(args.size)))
+
+            name = "deltas" if deltas else "full copies"
+
+            print "%s: %d states, %.1f MB (%.1f MB as full copies)%s" % (
+                name, stats["objects"], stats["size"] / 1048576.0, stats["full_size"] / 1048576.0,
+                "" if correct else ", ROLLBACK INCORRECT")
+
+            if full is None:
+                full = (record, rollback)
+                report("record", record)
+                report("rollback", rollback)
+            else:
+                report("record", record, full[0])
+                report("rollback", rollback, full[1])
+
+            print
+
+    finally:
+        renpy.game.log = old_log
+        renpy.game.contexts[:] = old_contexts
+        renpy.config.rollback_deltas = old_deltas
+
+    return False
+
+
+def glyph_benchmark():
+    """
+    Lays out and draws a long paragraph of CJK text with a truetype font,
+    reporting the time taken and the hit rate of the font's glyph cache at
+    several cache sizes.
+    """
+
+    import random
+    import pygame
+
+    ap = renpy.arguments.ArgumentParser(description="Measures the glyph cache on a long paragraph of CJK text.")
+    ap.add_argument("font", help="A font file that contains CJK characters.")
+    ap.add_argument("--size", type=int, default=28, help="The size of the font.")
+    ap.add_argument("--characters", type=int, default=3000, help="The number of distinct characters in the paragraph.")
+    ap.add_argument("--length", type=int, default=20000, help="The number of characters in the paragraph.")
+    args = ap.parse_args()
+
+    r = random.Random(0)
+    chars = [ unichr(0x4e00 + i) for i in range(args.characters) ]
+    text = u"".join(r.choice(chars) for _i in range(args.length))
+
+    face = renpy.text.font.load_face(args.font)
+
+    # The paragraph is drawn 40 characters to a line, one line at a time.
+    surf = pygame.Surface((args.size * 50, args.size * 2), pygame.SRCALPHA, 32)
+
+    sizes = sorted(set([ 256, renpy.config.font_glyph_cache_size, args.characters * 2 ]))
+    baseline = None
+
+    for cache_size in sizes:
+
+        font = renpy.text.ftfont.FTFont(face, args.size, 0, False, 0, True, False, cache_size)
+
+        start = time.time()
+
+        for i in range(0, len(text), 40):
+            glyphs = font.glyphs(text[i:i + 40])
+            renpy.text.textsupport.place_horizontal(glyphs, 0, 0, 0)
+
+            for g in glyphs:
+                g.y = font.ascent
+
+            font.draw(surf, 0, 0, (255, 255, 255, 255), glyphs, False, False, None)
+
+        duration = time.time() - start
+
+        lookups = font.cache_hits + font.cache_misses
+
+        print "Cache of %d glyphs: %d lookups, %.1f%% hits." % (cache_size, lookups, 100.0 * font.cache_hits / (lookups or 1))
+        report("layout and draw", duration, baseline)
+        print
+
+        if baseline is None:
+            baseline = duration
+
+    return False
+
+
+def sw_draw_benchmark():
+    """
+    Draws frames of a scene of rotating, zooming, translucent sprites over a
+    background with the software renderer, first on one thread and then
+    split into bands drawn by several threads, and reports the frame rate
+    of each.
+    """
+
+    import math
+    import random
+    import pygame
+
+    ap = renpy.arguments.ArgumentParser(description="Measures the frame rate of the software renderer with several threads.")
+    ap.add_argument("--width", type=int, default=1920, help="The width of the screen.")
+    ap.add_argument("--height", type=int, default=1080, help="The height of the screen.")
+    ap.add_argument("--sprites", type=int, default=16, help="The number of transformed sprites.")
+    ap.add_argument("--frames", type=int, default=60, help="The number of frames drawn with each number of threads.")
+    ap.add_argument("--threads", default="2,4,8", help="A comma-separated list of thread counts to try.")
+    args = ap.parse_args()
+
+    swdraw = renpy.display.swdraw
+    Render = renpy.display.render.Render
+    Matrix2D = renpy.display.render.Matrix2D
+
+    width = args.width
+    height = args.height
+
+    r = random.Random(0)
+
+    def noise(w, h, alpha):
+        """
+        Returns a surface filled with randomly-colored rectangles.
+        """
+
+        rv = swdraw.surface(w, h, alpha)
+
+        for _i in range(200):
+            color = (r.randint(0, 255), r.randint(0, 255), r.randint(0, 255), r.randint(128, 255))
+            rv.fill(color, (r.randint(0, w), r.randint(0, h), r.randint(8, w // 4), r.randint(8, h // 4)))
+
+        return rv
+
+    background = noise(width, height, False)
+    sprite = noise(400, 400, True)
+
+    def frame(n):
+        """
+        Returns the render of frame `n`.
+        """
+
+        rv = Render(width, height)
+        rv.blit(background, (0, 0))
+
+        for i in range(args.sprites):
+            angle = (n * 3 + i * 40) * math.pi / 180
+            zoom = 1.0 + 0.5 * math.sin((n + i * 10) * math.pi / 30)
+
+            sin = math.sin(angle)
+            cos = math.cos(angle)
+
+            child = Render(0, 0)
+            child.reverse = Matrix2D(zoom * cos, -zoom * sin, zoom * sin, zoom * cos)
+            child.forward = Matrix2D(cos / zoom, sin / zoom, -sin / zoom, cos / zoom)
+            child.alpha = 0.8
+            child.blit(sprite, (-200, -200))
+
+            x = (i * 397) % width
+            y = (i * 211) % height
+
+            rv.blit(child, (x, y))
+
+        return rv
+
+    window = pygame.Surface((width, height), 0, 32)
+
+    def run(drawer):
+        start = time.time()
+
+        for i in range(args.frames):
+            if drawer is None:
+                swdraw.draw(window, None, frame(i), 0, 0, True)
+            else:
+                drawer.draw(window, frame(i), 0, 0)
+
+        return time.time() - start
+
+    single = run(None)
+
+    print "%dx%d, %d sprites, %d frames." % (width, height, args.sprites, args.frames)
+    report("1 thread (%.1f fps)" % (args.frames / single), single)
+
+    for threads in args.threads.split(","):
+        threads = int(threads)
+        duration = run(swdraw.TileDrawer(threads))
+        report("%d threads (%.1f fps)" % (threads, args.frames / duration), duration, single)
+
+    return False
+
+
+def sprite_benchmark():
+    """
+    Renders a SpriteManager containing increasing numbers of moving sprites,
+    and sends it mouse events, reporting how the time per frame and per
+    event scales with the number of sprites. Each measurement is made
+    once with the sprites sorted and filtered every frame, and once with
+    hit testing disabled, to give a baseline. The same number of sprites
+    is also rendered with a SpritePool.
+    """
+
+    import random
+    import pygame
+
+    ap = renpy.arguments.ArgumentParser(description="Measures how SpriteManager scales with the number of sprites.")
+    ap.add_argument("--counts", default="100,1000,5000,10000", help="A comma-separated list of sprite counts to try.")
+    ap.add_argument("--frames", type=int, default=60, help="The number of frames rendered for each count.")
+    ap.add_argument("--events", type=int, default=1000, help="The number of mouse events sent for each count.")
+    args = ap.parse_args()
+
+    width = 1280
+    height = 720
+
+    class Dot(renpy.display.core.Displayable):
+        """
+        A small displayable that ignores events.
+        """
+
+        def render(self, width, height, st, at):
+            return renpy.display.render.Render(8, 8)
+
+        def event(self, ev, x, y, st):
+            return None
+
+    dot = Dot()
+
+    def manager(count, hit_test):
+        r = random.Random(0)
+
+        sm = renpy.display.particle.SpriteManager(hit_test=hit_test)
+
+        for i in range(count):
+            s = sm.create(dot)
+            s.x = r.randint(0, width)
+            s.y = r.randint(0, height)
+            s.zorder = r.randint(0, 10)
+            s.events = (i % 10 == 0)
+
+        return sm
+
+    def frames(sm, resort):
+        start = time.time()
+
+        for i in range(args.frames):
+            for s in sm.children:
+                s.x = (s.x + 1) % width
+
+            if resort:
+                sm.sorted = False
+                sm.dead_child = True
+
+            sm.render(width, height, i / 60.0, i / 60.0)
+            renpy.display.render.mark_sweep()
+
+        return time.time() - start
+
+    def pool_frames(count):
+        r = random.Random(0)
+
+        pool = renpy.display.particle.SpritePool(dot)
+
+        for _i in range(count):
+            pool.add(r.randint(0, width), r.randint(0, height), 60, 0, 0)
+
+        start = time.time()
+
+        for i in range(args.frames):
+            pool.render(width, height, i / 60.0, i / 60.0)
+            renpy.display.render.mark_sweep()
+
+        return time.time() - start
+
+    def events(sm):
+        r = random.Random(1)
+        sm.render(width, height, 0, 0)
+        renpy.display.render.mark_sweep()
+
+        evs = [ pygame.event.Event(pygame.MOUSEMOTION, pos=(0, 0), rel=(0, 0), buttons=(0, 0, 0)) for _i in range(args.events) ]
+        points = [ (r.randint(0, width), r.randint(0, height)) for _i in range(args.events) ]
+
+        start = time.time()
+
+        for ev, (x, y) in zip(evs, points):
+            sm.event(ev, x, y, 0)
+
+        return time.time() - start
+
+    print "%d frames and %d mouse events for each sprite count." % (args.frames, args.events)
+
+    for count in args.counts.split(","):
+        count = int(count)
+
+        baseline = frames(manager(count, False), True)
+        report("%d sprites, sort every frame" % count, baseline)
+        report("%d sprites, render" % count, frames(manager(count, False), False), baseline)
+        report("%d sprites, sprite pool" % count, pool_frames(count), baseline)
+
+        baseline = events(manager(count, False))
+        report("%d sprites, event scan" % count, baseline)
+        report("%d sprites, event hit test" % count, events(manager(count, True)), baseline)
+
+    return False
+
+
+def text_layout_benchmark():
+    """
+    Renders a history screen - a vbox containing a name and a line of
+    dialogue for each of hundreds of entries - and reports the time it
+    takes. The texts are first rendered one at a time without sharing
+    layouts, as they were when the leftover height was part of the layout
+    key, then one at a time, and then by rendering the vbox, which lays
+    them out in one pass with renpy.text.text.layout_texts.
+
+    This needs a display. Set RENPY_RENDERER to null to run it without one.
+    """
+
+    import random
+
+    ap = renpy.arguments.ArgumentParser(description="Measures rendering a history screen with many entries.")
+    ap.add_argument("--entries", type=int, default=250, help="The number of entries in the history.")
+    ap.add_argument("--width", type=int, default=600, help="The width of the history screen.")
+    ap.add_argument("--repeat", type=int, default=10, help="The number of times the history is rendered.")
+    args = ap.parse_args()
+
+    if not renpy.game.interface:
+        renpy.display.core.Interface()
+
+    Text = renpy.text.text.Text
+    render = renpy.display.render.render
+
+    names = [ u"Eileen", u"Lucy", u"Sylvie", u"Narrator" ]
+    words = u"the quick brown fox jumps over a lazy dog while we wait for the rain to stop".split()
+
+    width = args.width
+    height = 1000000
+
+    def history():
+        """
+        Returns a vbox containing the texts of the history entries.
+        """
+
+        r = random.Random(0)
+        rv = renpy.display.layout.MultiBox(layout="vertical")
+
+        for _i in range(args.entries):
+            rv.add(Text(r.choice(names), style="say_label", substitute=False))
+            rv.add(Text(u" ".join(r.choice(words) for _j in range(r.randint(5, 40))), style="say_dialogue", substitute=False))
+
+        return rv
+
+    def one_at_a_time(box, shared):
+        """
+        Renders the texts in `box` the way the box does, but one at a time.
+        """
+
+        remheight = height
+
+        for t in box.children:
+            if not shared:
+                renpy.text.text.layout_cache.clear()
+
+            surf = render(t, width, remheight, 0, 0)
+            remheight -= surf.get_size()[1] + box.style.spacing
+
+    def run(f):
+        rv = 0.0
+
+        for _i in range(args.repeat):
+            box = history()
+
+            renpy.text.text.layout_cache_clear()
+            renpy.display.render.mark_sweep()
+
+            start = time.time()
+            f(box)
+            rv += time.time() - start
+
+        return rv
+
+    baseline = run(lambda box : one_at_a_time(box, False))
+    single = run(lambda box : one_at_a_time(box, True))
+    batch = run(lambda box : render(box, width, height, 0, 0))
+
+    print "%d texts, rendered %d times." % (args.entries * 2, args.repeat)
+    report("one at a time, unshared", baseline)
+    report("one at a time", single, baseline)
+    report("vbox, laid out together", batch, baseline)
+
+    return False
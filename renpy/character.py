@@ -399,6 +399,7 @@ def display_say(
     # If we're committed to skipping this statement, disable slow.
     elif (renpy.config.skipping and
           (renpy.game.preferences.skip_unseen or
+           renpy.playthrough.enabled or
            renpy.game.context().seen_current(True))):
         slow = False
 
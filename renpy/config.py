@@ -63,6 +63,11 @@ rollback_enabled = True
 # If the rollback is longer than this, we may trim it.
 rollback_length = 128
 
+# If true, the rollback information for revertable lists, dicts, and sets
+# is stored as the difference from the object's state at the end of each
+# step, rather than as a full copy.
+rollback_deltas = False
+
 # If set to True, clicking while in rollback will keep the roll forward
 # buffer if the data has not changed.
 keep_rollback_data = False
@@ -86,13 +91,28 @@ underlay = [ ]
 # True to enable profiling.
 profile = False
 
+# The number of frames the frame profiler keeps timing information for,
+# or 0 to disable the frame profiler.
+frame_profile = 0
+
 # The directory save files will be saved to.
 savedir = None
 
+# If not None, changes to the persistent data are appended to a journal,
+# which is compacted once it grows larger than this many bytes.
+persistent_journal_size = None
+
 # The number of screens worth of images that are allowed to
 # live in the image cache at once.
 image_cache_size = 8
 
+# The number of threads that load images in the background.
+preload_threads = 1
+
+# The maximum size of the on-disk cache of images produced by image
+# operators, in megabytes. 0 disables the on-disk cache.
+image_disk_cache_size = 0
+
 # The number of statements we will analyze when doing predictive
 # loading. Please note that this is a total number of statements in a
 # BFS along all paths, rather than the depth along any particular
@@ -215,6 +235,14 @@ auto_choice_delay = None
 # version of an italic font.
 font_replacement_map = { }
 
+# The number of rendered glyphs each truetype font (at a given size and
+# style) keeps in its cache.
+font_glyph_cache_size = 1024
+
+# The number of text layouts that are kept in the shared layout cache, so
+# they can be reused by Text objects with the same text and style.
+text_layout_cache_size = 100
+
 # A callback that is called when a with statement (but not
 # the with clause of a say or menu statement) executes. If not None,
 # it's called with a single argument, the transition supplied to the
@@ -140,6 +140,7 @@ DragGroup = renpy.display.dragdrop.DragGroup
 
 Sprite = renpy.display.particle.Sprite
 SpriteManager = renpy.display.particle.SpriteManager
+SpritePool = renpy.display.particle.SpritePool
 
 
 # Currying things.
@@ -533,7 +533,7 @@ class SayBehavior(renpy.display.layout.Null):
         if renpy.config.allow_skipping and renpy.config.skipping:
 
             if st >= skip_delay:
-                if renpy.game.preferences.skip_unseen:
+                if renpy.game.preferences.skip_unseen or renpy.playthrough.enabled:
                     return True
                 elif renpy.config.skipping == "fast":
                     return True
@@ -1377,6 +1377,11 @@ class Interface(object):
         except:
             pass
 
+        # The null renderer doesn't need a display, so make sure SDL doesn't
+        # try to open one.
+        if os.environ.get("RENPY_RENDERER", renpy.game.preferences.renderer) == "null":
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
         # pygame.font.init()
         renpy.audio.audio.init()
         renpy.display.joystick.init()
@@ -1541,6 +1546,7 @@ class Interface(object):
 
         make_draw("gl", "renpy.gl.gldraw", "GLDraw", not has_angle)
         make_draw("sw", "renpy.display.swdraw", "SWDraw")
+        make_draw("null", "renpy.display.nulldraw", "NullDraw")
 
         rv = [ ]
 
@@ -1665,21 +1671,44 @@ class Interface(object):
 
     def draw_screen(self, root_widget, fullscreen_video, draw):
 
+        if renpy.playthrough.enabled:
+            start = get_time()
+
+        frametime = renpy.display.frametime
+
+        if frametime.enabled:
+            render_start = get_time()
+
         surftree = renpy.display.render.render_screen(
             root_widget,
             renpy.config.screen_width,
             renpy.config.screen_height,
             )
 
+        if frametime.enabled:
+            draw_start = get_time()
+            frametime.add(frametime.RENDER, render_start, draw_start)
+
         if draw:
             renpy.display.draw.draw_screen(surftree, fullscreen_video)
 
+        if frametime.enabled:
+            gc_start = get_time()
+            frametime.add(frametime.DRAW, draw_start, gc_start)
+
         renpy.display.render.mark_sweep()
+
+        if frametime.enabled:
+            frametime.add(frametime.GC, gc_start, get_time())
+
         renpy.display.focus.take_focuses()
 
         self.surftree = surftree
         self.fullscreen_video = fullscreen_video
 
+        if renpy.playthrough.enabled:
+            renpy.playthrough.add(renpy.playthrough.RENDER, get_time() - start)
+
 
     def take_screenshot(self, scale, background=False):
         """
@@ -2141,9 +2170,15 @@ class Interface(object):
 
             repeat = True
 
+            if renpy.playthrough.enabled:
+                start = get_time()
+
             while repeat:
                 repeat, rv = self.interact_core(preloads=preloads, **kwargs)
 
+            if renpy.playthrough.enabled:
+                renpy.playthrough.add(renpy.playthrough.INTERACT, get_time() - start)
+
             return rv
 
         finally:
@@ -2380,6 +2415,9 @@ class Interface(object):
 
         del add_layer
 
+        # Start or stop the frame profiler, as config.frame_profile says.
+        renpy.display.frametime.update()
+
         prediction_coroutine = renpy.display.predict.prediction_coroutine(root_widget)
         prediction_coroutine.send(None)
 
@@ -2471,6 +2509,9 @@ class Interface(object):
                     if not self.interact_time:
                         self.interact_time = self.frame_time
 
+                    if renpy.display.frametime.enabled:
+                        renpy.display.frametime.begin_frame(self.frame_time)
+
                     self.draw_screen(root_widget, fullscreen_video, (not fullscreen_video) or video_frame_drawn)
 
                     if first_pass:
@@ -2579,7 +2620,19 @@ class Interface(object):
                     # Can we do expensive prediction?
                     expensive_predict = not (needs_redraw or self.event_peek() or renpy.audio.music.is_playing("movie"))
 
-                    result = prediction_coroutine.send(expensive_predict)
+                    if renpy.playthrough.enabled or renpy.display.frametime.enabled:
+                        start = get_time()
+                        result = prediction_coroutine.send(expensive_predict)
+                        end = get_time()
+
+                        if renpy.playthrough.enabled:
+                            renpy.playthrough.add(renpy.playthrough.PREDICT, end - start)
+
+                        if renpy.display.frametime.enabled:
+                            renpy.display.frametime.add(renpy.display.frametime.PREDICT, start, end)
+
+                    else:
+                        result = prediction_coroutine.send(expensive_predict)
 
                     if not result:
                         prediction_coroutine = None
@@ -2588,6 +2641,9 @@ class Interface(object):
                     if not expensive_predict:
                         break
 
+                # Load textures for images the preload threads loaded.
+                renpy.display.im.cache.load_pending_textures()
+
                 # If we need to redraw again, do it if we don't have an
                 # event going on.
                 if (prediction_coroutine or needs_redraw) and not self.event_peek():
@@ -2638,7 +2694,13 @@ class Interface(object):
                     if renpy.config.periodic_callback:
                         renpy.config.periodic_callback()
 
-                    renpy.audio.audio.periodic()
+                    if renpy.display.frametime.enabled:
+                        start = get_time()
+                        renpy.audio.audio.periodic()
+                        renpy.display.frametime.add(renpy.display.frametime.AUDIO, start, get_time())
+                    else:
+                        renpy.audio.audio.periodic()
+
                     renpy.display.tts.periodic()
                     continue
 
@@ -2753,6 +2815,10 @@ class Interface(object):
                     # set correctly.
                     self.post_time_event()
 
+                finally:
+                    if renpy.display.frametime.enabled:
+                        renpy.display.frametime.add(renpy.display.frametime.EVENT, end_time, get_time())
+
 
                 # Check again after handling the event.
                 needs_redraw |= renpy.display.render.process_redraws()
@@ -93,10 +93,116 @@ def get_grab():
 # The current list of focuses that we know about.
 focus_list = [ ]
 
+# The size of the cells in a FocusIndex, in pixels.
+FOCUS_GRID_SIZE = 64
+
+class FocusIndex(object):
+    """
+    A spatial index of the focus list, built after the screen has been
+    drawn. This makes it possible to find the focus at a point without
+    walking the render tree, and the current focus without searching the
+    focus list.
+    """
+
+    def __init__(self, focuses):
+
+        # A map from (cellx, celly) to a list of the focuses that overlap
+        # that cell, in focus list order.
+        self.grid = { }
+
+        # A map from widget to the focuses of that widget.
+        self.by_widget = { }
+
+        grid = self.grid
+
+        for f in focuses:
+
+            self.by_widget.setdefault(f.widget, [ ]).append(f)
+
+            if f.x is None:
+                continue
+
+            x0 = int(f.x // FOCUS_GRID_SIZE)
+            y0 = int(f.y // FOCUS_GRID_SIZE)
+            x1 = int((f.x + f.w) // FOCUS_GRID_SIZE)
+            y1 = int((f.y + f.h) // FOCUS_GRID_SIZE)
+
+            for cy in range(y0, y1 + 1):
+                for cx in range(x0, x1 + 1):
+                    cell = grid.get((cx, cy), None)
+
+                    if cell is None:
+                        grid[cx, cy] = [ f ]
+                    else:
+                        cell.append(f)
+
+    def at_point(self, x, y):
+        """
+        Returns the uppermost focus containing `x`, `y`, or None if no
+        focus contains the point.
+        """
+
+        cell = self.grid.get((int(x // FOCUS_GRID_SIZE), int(y // FOCUS_GRID_SIZE)), None)
+
+        if not cell:
+            return None
+
+        for f in reversed(cell):
+            if f.x <= x < f.x + f.w and f.y <= y < f.y + f.h:
+                return f
+
+        return None
+
+    def find(self, widget, arg):
+        """
+        Returns the first focus for `widget` with `arg`, or None if there
+        isn't one.
+        """
+
+        for f in self.by_widget.get(widget, ( )):
+            if f.widget is widget and f.arg == arg:
+                return f
+
+        return None
+
+# The FocusIndex for focus_list, or None if it hasn't been built yet.
+focus_index = None
+
+def get_focus_index():
+    """
+    Returns the FocusIndex for focus_list, building it if necessary.
+    """
+
+    global focus_index
+
+    if focus_index is None:
+        focus_index = FocusIndex(focus_list)
+
+    return focus_index
+
+def focus_at_point(x, y):
+    """
+    Returns a focus object corresponding to the uppermost displayable at
+    `x`, `y`, or None if nothing focusable is there.
+
+    When the focus list exactly describes the screen, this is answered from
+    the focus index. Otherwise, we ask the render tree.
+    """
+
+    render = renpy.display.render
+
+    if render.focuses_exact and render.focuses_render is render.screen_render:
+        return get_focus_index().at_point(x, y)
+
+    return render.focus_at_point(x, y)
+
 # This takes in a focus list from the rendering system.
 def take_focuses():
     global focus_list
+    global focus_index
+
     focus_list = [ ]
+    focus_index = None
 
     renpy.display.render.take_focuses(focus_list)
 
@@ -245,7 +351,7 @@ def mouse_handler(ev, x, y, default=False):
         if ev.type not in (pygame.MOUSEMOTION, pygame.MOUSEBUTTONUP, pygame.MOUSEBUTTONDOWN):
             return
 
-    new_focus = renpy.display.render.focus_at_point(x, y)
+    new_focus = focus_at_point(x, y)
 
     if new_focus is None:
         new_focus = default_focus
@@ -358,11 +464,9 @@ def focus_nearest(from_x0, from_y0, from_x1, from_y1,
         return
 
     # Find the current focus.
-    for f in focus_list:
-        if f.widget is current and f.arg == argument:
-            from_focus = f
-            break
-    else:
+    from_focus = get_focus_index().find(current, argument)
+
+    if from_focus is None:
         # If we can't pick something.
         change_focus(focus_list[0])
         return
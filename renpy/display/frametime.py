@@ -0,0 +1,205 @@
+# Copyright 2004-2014 Tom Rothamel <pytom@bishoujo.us>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# This file contains code that records how long each frame spends in the
+# phases of the interaction loop, so that slow and dropped frames can be
+# found.
+
+import collections
+import json
+
+import renpy.display
+
+# The phases a frame is broken up into, in the order they're displayed.
+EVENT = "event"
+RENDER = "render"
+DRAW = "draw"
+GC = "gc"
+PREDICT = "predict"
+AUDIO = "audio"
+
+PHASES = [ EVENT, RENDER, DRAW, GC, PREDICT, AUDIO ]
+
+# True if frame profiling is enabled. This is checked by the interaction
+# loop before it times a phase.
+enabled = False
+
+# The ring buffer of frames that have been recorded.
+frames = collections.deque(maxlen=1)
+
+# The frame that phases are being added to, or None if no frame has been
+# started yet.
+current = None
+
+# The number of frames that have been started.
+count = 0
+
+
+class Frame(object):
+    """
+    The timing information for a single frame. A frame begins when the
+    screen is redrawn, and lasts until the next redraw begins.
+    """
+
+    def __init__(self, number, start):
+
+        # The number of this frame.
+        self.number = number
+
+        # The time the frame began.
+        self.start = start
+
+        # The time the next frame began, or None if this is the current
+        # frame.
+        self.end = None
+
+        # A map from phase to the total time spent in that phase.
+        self.phases = dict.fromkeys(PHASES, 0.0)
+
+        # A list of (phase, start, duration) tuples.
+        self.spans = [ ]
+
+    def busy(self):
+        """
+        Returns the total time spent in all phases of this frame.
+        """
+
+        return sum(self.phases.itervalues())
+
+
+def update():
+    """
+    Called at the start of each interaction to make the profiler match
+    config.frame_profile.
+    """
+
+    global enabled
+    global frames
+    global current
+
+    size = renpy.config.frame_profile
+
+    if not size:
+        enabled = False
+        current = None
+        return
+
+    if frames.maxlen != size:
+        frames = collections.deque(frames, maxlen=size)
+
+    enabled = True
+
+
+def begin_frame(start):
+    """
+    Begins a new frame, at time `start`.
+    """
+
+    global current
+    global count
+
+    if current is not None:
+        current.end = start
+
+    count += 1
+    current = Frame(count, start)
+    frames.append(current)
+
+
+def add(phase, start, end):
+    """
+    Records that `phase` ran from `start` to `end`, in the current frame.
+    """
+
+    if current is None:
+        return
+
+    duration = end - start
+
+    current.phases[phase] += duration
+    current.spans.append((phase, start, duration))
+
+
+def get_frames():
+    """
+    Returns a list of the frames in the ring buffer, oldest first.
+    """
+
+    return list(frames)
+
+
+def clear():
+    """
+    Discards the recorded frames.
+    """
+
+    global current
+
+    frames.clear()
+    current = None
+
+
+def trace_events():
+    """
+    Returns a list of Chrome trace events describing the recorded frames.
+    """
+
+    def us(t):
+        return int(t * 1000000)
+
+    rv = [ ]
+
+    for f in get_frames():
+
+        if f.end is not None:
+            rv.append({
+                "name" : "frame %d" % f.number,
+                "cat" : "frame",
+                "ph" : "X",
+                "ts" : us(f.start),
+                "dur" : us(f.end - f.start),
+                "pid" : 1,
+                "tid" : 1,
+                "args" : { k : us(v) for k, v in f.phases.iteritems() },
+                })
+
+        for phase, start, duration in f.spans:
+            rv.append({
+                "name" : phase,
+                "cat" : "phase",
+                "ph" : "X",
+                "ts" : us(start),
+                "dur" : us(duration),
+                "pid" : 1,
+                "tid" : 2,
+                })
+
+    return rv
+
+
+def write_trace(filename):
+    """
+    Writes the recorded frames to `filename`, in the Chrome trace event
+    format.
+    """
+
+    with open(filename, "wb") as f:
+        json.dump({ "traceEvents" : trace_events(), "displayTimeUnit" : "ms" }, f)
@@ -30,12 +30,18 @@ import zipfile
 import cStringIO
 import threading
 import time
+import heapq
+import os
+import md5
+import mmap
+import struct
+import pygame
 
 
 # This is an entry in the image cache.
 class CacheEntry(object):
 
-    def __init__(self, what, surf):
+    def __init__(self, what, surf, load_time=0):
 
         # The object that is being cached (which needs to be
         # hashable and comparable).
@@ -48,8 +54,273 @@ class CacheEntry(object):
         w, h = surf.get_size()
         self.size = w * h
 
-        # The time when this cache entry was last used.
-        self.time = 0
+        # The number of bytes taken up by this image.
+        self.bytes = self.size * surf.get_bytesize()
+
+        # The time when this cache entry was last used. (-1 if it hasn't
+        # been placed in a generation yet.)
+        self.time = -1
+
+        # The number of seconds it took to load this image.
+        self.load_time = load_time
+
+    def cost(self):
+        """
+        Returns the cost of evicting this entry, relative to the memory
+        that evicting it frees. Entries with a lower cost are evicted
+        first.
+        """
+
+        return self.load_time / (self.bytes or 1)
+
+def is_chain(image):
+    """
+    Returns true if `image` is an image operator that's applied to at
+    least one other image.
+    """
+
+    def contains_image(o):
+        if isinstance(o, ImageBase):
+            return True
+
+        if isinstance(o, (tuple, list)):
+            return any(contains_image(i) for i in o)
+
+        return False
+
+    return contains_image(image.identity[1:])
+
+
+class DiskCache(object):
+    """
+    A cache of decoded images, stored on disk. This stores the result of
+    chains of image operators, so the chain only needs to be computed once,
+    rather than each time the image is loaded.
+
+    Each image is stored as raw RGBA data in a file named after a digest of
+    the image's identity and the modification times of the files it's
+    loaded from. The files are memory-mapped when read. When the cache
+    grows larger than config.image_disk_cache_size, the least recently
+    used files are removed.
+    """
+
+    # The header of a cache file, giving the width and height.
+    HEADER = struct.Struct("<4sII")
+
+    MAGIC = "RIC1"
+
+    def __init__(self):
+
+        # The directory the cache is stored in, or None if the cache is
+        # disabled.
+        self.directory = None
+
+        # The maximum size of the cache, in bytes.
+        self.limit = 0
+
+        # The approximate size of the cache, in bytes.
+        self.size = 0
+
+        # A stamp that changes when any archive changes. (As get_mtime
+        # returns 0 for archived files.)
+        self.stamp = None
+
+        self.lock = threading.Lock()
+
+    def init(self):
+        """
+        Enables or disables the disk cache, based on config settings.
+        """
+
+        self.directory = None
+        self.limit = int(renpy.config.image_disk_cache_size * 1024 * 1024)
+
+        if self.limit <= 0 or renpy.config.savedir is None:
+            return
+
+        directory = os.path.join(renpy.config.savedir, "cache", "images")
+
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+        except:
+            return
+
+        stamp = [ ]
+
+        for archive in renpy.loader.archives:
+            try:
+                stamp.append((archive.fn, os.path.getmtime(archive.fn), os.path.getsize(archive.fn)))
+            except:
+                pass
+
+        self.stamp = repr(stamp)
+        self.directory = directory
+
+        self.cleanout()
+
+    def filename(self, image):
+        """
+        Returns the filename image is stored under, or None if the image
+        can't be stored in the disk cache.
+        """
+
+        if self.directory is None:
+            return None
+
+        if not is_chain(image):
+            return None
+
+        identity = repr(image.identity)
+
+        # Objects without a stable repr can't be cached.
+        if " at 0x" in identity:
+            return None
+
+        mtimes = [ renpy.loader.get_mtime(i) for i in image.predict_files() ]
+
+        key = identity + repr(mtimes) + self.stamp
+
+        return os.path.join(self.directory, md5.md5(key).hexdigest() + ".rgba")
+
+    def load(self, image):
+        """
+        Returns the surface for `image`, loading it from the cache if
+        possible. Otherwise, the image is loaded and stored in the cache.
+        """
+
+        try:
+            fn = self.filename(image)
+        except:
+            fn = None
+
+        if fn is None:
+            return image.load()
+
+        surf = self.read(fn)
+
+        if surf is not None:
+            return surf
+
+        surf = image.load()
+        self.write(fn, surf)
+
+        return surf
+
+    def read(self, fn):
+        """
+        Reads the surface stored in `fn`, or returns None if that isn't
+        possible.
+        """
+
+        try:
+            f = open(fn, "rb")
+        except:
+            return None
+
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            try:
+                magic, width, height = self.HEADER.unpack_from(data)
+
+                if magic != self.MAGIC:
+                    return None
+
+                if len(data) != self.HEADER.size + width * height * 4:
+                    return None
+
+                pixels = pygame.image.frombuffer(buffer(data, self.HEADER.size), (width, height), "RGBA")
+                surf = renpy.display.pgrender.copy_surface_unscaled(pixels)
+
+                del pixels
+
+            finally:
+                data.close()
+
+        except:
+            return None
+
+        finally:
+            f.close()
+
+        # Mark the file as recently used.
+        try:
+            os.utime(fn, None)
+        except:
+            pass
+
+        return surf
+
+    def write(self, fn, surf):
+        """
+        Writes `surf` to `fn`, then cleans out the cache if it's grown too
+        large.
+        """
+
+        width, height = surf.get_size()
+
+        try:
+            tmp = fn + ".%d.tmp" % threading.current_thread().ident
+
+            with open(tmp, "wb") as f:
+                f.write(self.HEADER.pack(self.MAGIC, width, height))
+                f.write(pygame.image.tostring(surf, "RGBA"))
+
+            if os.path.exists(fn):
+                os.unlink(fn)
+
+            os.rename(tmp, fn)
+
+        except:
+            return
+
+        with self.lock:
+            self.size += self.HEADER.size + width * height * 4
+
+            if self.size <= self.limit:
+                return
+
+        self.cleanout()
+
+    def cleanout(self):
+        """
+        Removes the least recently used files from the cache until it's
+        three quarters of its maximum size.
+        """
+
+        with self.lock:
+
+            files = [ ]
+            size = 0
+
+            for i in os.listdir(self.directory):
+                fn = os.path.join(self.directory, i)
+
+                try:
+                    st = os.stat(fn)
+                except:
+                    continue
+
+                files.append((st.st_mtime, st.st_size, fn))
+                size += st.st_size
+
+            if size > self.limit:
+
+                files.sort()
+
+                for _mtime, filesize, fn in files:
+                    if size <= self.limit * .75:
+                        break
+
+                    try:
+                        os.unlink(fn)
+                        size -= filesize
+                    except:
+                        pass
+
+            self.size = size
+
 
 # This is the singleton image cache.
 class Cache(object):
@@ -63,9 +334,30 @@ class Cache(object):
         # A map from Image object to CacheEntry.
         self.cache = { }
 
-        # A list of Image objects that we want to preload.
+        # A map from time to a map from Image object to CacheEntry, for the
+        # entries that were last used at that time. This lets cleanout find
+        # the least recently used entries without sorting the whole cache.
+        self.generations = { }
+
+        # A heap of (priority, serial, Image) tuples, giving the Image
+        # objects that we want to preload. Lower priorities are loaded
+        # first.
         self.preloads = [ ]
 
+        # The serial number of the next preload, used to keep preloads
+        # with the same priority in the order they were predicted.
+        self.preload_serial = 0
+
+        # A map from Image object to a threading.Event, for images that
+        # are being loaded. This prevents two threads from loading the
+        # same image at once.
+        self.loading = { }
+
+        # A list of (Image object, surface) pairs that were loaded on a
+        # preload thread, and need to be loaded as textures on the main
+        # thread.
+        self.pending_textures = [ ]
+
         # False if this is not the first preload in this tick.
         self.first_preload_in_tick = True
 
@@ -75,6 +367,16 @@ class Cache(object):
         # The total size of everything in the cache.
         self.total_cache_size = 0
 
+        # The total number of bytes used by everything in the cache.
+        self.total_cache_bytes = 0
+
+        # Statistics about how the cache has been used. These are returned
+        # by get_stats.
+        self.hits = 0
+        self.misses = 0
+        self.preloaded = 0
+        self.evictions = 0
+
         # A lock that must be held when updating the cache.
         self.lock = threading.Condition()
 
@@ -94,10 +396,13 @@ class Cache(object):
         # The size of the cache, in pixels.
         self.cache_limit = 0
 
-        # The preload thread.
-        self.preload_thread = threading.Thread(target=self.preload_thread_main, name="preloader")
-        self.preload_thread.setDaemon(True)
-        self.preload_thread.start()
+        # The on-disk cache of images.
+        self.disk_cache = DiskCache()
+
+        # The preload threads. The first is started now, and the rest
+        # when init is called.
+        self.preload_threads = [ ]
+        self.start_preload_thread()
 
         # Have we been added this tick?
         self.added = set()
@@ -120,15 +425,35 @@ class Cache(object):
 
         self.cache_limit = renpy.config.image_cache_size * renpy.config.screen_width * renpy.config.screen_height
 
+        self.disk_cache.init()
+
+        while self.keep_preloading and len(self.preload_threads) < renpy.config.preload_threads:
+            self.start_preload_thread()
+
+    def start_preload_thread(self):
+        """
+        Starts a new preload thread. Only the first preload thread loads
+        pinned images.
+        """
+
+        pin = not self.preload_threads
+
+        t = threading.Thread(target=self.preload_thread_main, args=(pin,), name="preloader")
+        t.setDaemon(True)
+        t.start()
+
+        self.preload_threads.append(t)
+
     def quit(self): #@ReservedAssignment
-        if not self.preload_thread.isAlive():
+        if not any(i.isAlive() for i in self.preload_threads):
             return
 
         with self.preload_lock:
             self.keep_preloading = False
-            self.preload_lock.notify()
+            self.preload_lock.notify_all()
 
-        self.preload_thread.join()
+        for i in self.preload_threads:
+            i.join()
 
         self.clear()
 
@@ -139,11 +464,14 @@ class Cache(object):
         self.lock.acquire()
 
         self.preloads = [ ]
+        self.pending_textures = [ ]
         self.pin_cache = { }
         self.cache = { }
+        self.generations = { }
         self.first_preload_in_tick = True
         self.size_of_current_generation = 0
         self.total_cache_size = 0
+        self.total_cache_bytes = 0
 
         self.added.clear()
 
@@ -188,24 +516,105 @@ class Cache(object):
         # First try to grab the image out of the cache without locking it.
         ce = self.cache.get(image, None)
 
+        # Hits are counted without the lock, as only the main thread gets
+        # images without predicting them.
+        if ce is not None:
+            if not predict:
+                self.hits += 1
+
         # Otherwise, we load the image ourselves.
-        if ce is None:
+        else:
+            ce = self.load_entry(image, predict)
 
-            try:
-                if image in self.pin_cache:
-                    surf = self.pin_cache[image]
-                else:
-                    surf = image.load()
 
-            except:
-                raise
+        # Move it into the current generation. This only takes the lock
+        # the first time an entry is used in a generation.
+
+        if ce.time != self.time:
+
+            with self.lock:
+
+                # Check that the entry wasn't killed or moved while we were
+                # waiting for the lock.
+                if ce.time != self.time and self.cache.get(image, None) is ce:
+
+                    generation = self.generations.get(ce.time, None)
+
+                    if generation is not None:
+                        generation.pop(image, None)
+
+                        if not generation:
+                            del self.generations[ce.time]
+
+                    ce.time = self.time
+                    self.size_of_current_generation += ce.size
+
+                    self.generations.setdefault(self.time, { })[image] = ce
+
+        # Done... return the surface.
+        return ce.surf
+
+
+    def load_entry(self, image, predict):
+        """
+        Loads `image`, adds it to the cache, and returns the new CacheEntry.
+        If another thread is already loading `image`, this waits for that
+        thread to finish rather than loading the image a second time.
+        """
+
+        with self.lock:
+            ce = self.cache.get(image, None)
+
+            if ce is not None:
+                return ce
+
+            loading = self.loading.get(image, None)
+
+            if loading is None:
+                self.loading[image] = threading.Event()
+
+        if loading is not None:
+            loading.wait()
+
+            ce = self.cache.get(image, None)
+
+            if ce is not None:
+                if not predict:
+                    with self.lock:
+                        self.hits += 1
+
+                return ce
+
+            # The other thread failed to load the image, so we try
+            # again, to report the error.
+
+        try:
+
+            start = time.time()
+
+            if image in self.pin_cache:
+                surf = self.pin_cache[image]
+            else:
+                surf = self.disk_cache.load(image)
+
+            load_time = time.time() - start
 
             with self.lock:
 
-                ce = CacheEntry(image, surf)
+                if predict:
+                    self.preloaded += 1
+                else:
+                    self.misses += 1
+
+                ce = CacheEntry(image, surf, load_time)
+
+                old = self.cache.get(image, None)
+
+                if old is not None:
+                    self.kill(old)
 
-                if image not in self.cache:
-                    self.total_cache_size += ce.size
+                self.total_cache_size += ce.size
+                self.total_cache_bytes += ce.bytes
 
                 self.cache[image] = ce
 
@@ -218,21 +627,45 @@ class Cache(object):
                     else:
                         renpy.display.ic_log.write("Total Miss %r", ce.what)
 
-                renpy.display.draw.load_texture(ce.surf)
+            self.load_texture(image, ce.surf)
 
+        finally:
+            if loading is None:
+                with self.lock:
+                    self.loading.pop(image).set()
 
-        # Move it into the current generation. This isn't protected by
-        # a lock, so in certain circumstances we could have an
-        # inaccurate size - but that will be cured at the end of the
-        # current generation.
+        return ce
 
-        if ce.time != self.time:
-            ce.time = self.time
-            self.size_of_current_generation += ce.size
+    def load_texture(self, image, surf):
+        """
+        Loads `surf`, the surface for `image`, as a texture. Textures are
+        only loaded on the main thread, so when this is called from a
+        preload thread, the surface is queued up to be loaded by
+        load_pending_textures.
+        """
 
-        # Done... return the surface.
-        return ce.surf
+        if threading.current_thread() in self.preload_threads:
+            self.pending_textures.append((image, surf))
+        else:
+            renpy.display.draw.load_texture(surf)
+
+    def load_pending_textures(self):
+        """
+        Called on the main thread to load the textures for surfaces that
+        were loaded by the preload threads, and are still in use.
+        """
+
+        while self.pending_textures:
+
+            try:
+                image, surf = self.pending_textures.pop(0)
+            except IndexError:
+                break
+
+            ce = self.cache.get(image, None)
 
+            if (ce is not None and ce.surf is surf) or (self.pin_cache.get(image, None) is surf):
+                renpy.display.draw.load_texture(surf)
 
     # This kills off a given cache entry.
     def kill(self, ce):
@@ -242,8 +675,17 @@ class Cache(object):
             self.size_of_current_generation -= ce.size
 
         self.total_cache_size -= ce.size
+        self.total_cache_bytes -= ce.bytes
         del self.cache[ce.what]
 
+        generation = self.generations.get(ce.time, None)
+
+        if generation is not None:
+            generation.pop(ce.what, None)
+
+            if not generation:
+                del self.generations[ce.time]
+
         if renpy.config.debug_image_cache:
             renpy.display.ic_log.write("Removed %r", ce.what)
 
@@ -259,24 +701,47 @@ class Cache(object):
             return True
 
         # If we're outside the cache limit, we need to go and start
-        # killing off some of the entries until we're back inside it.
+        # killing off some of the entries until we're back inside it. We
+        # go through the generations from oldest to newest, and within a
+        # generation kill the entries that are cheapest to reload first.
 
-        for ce in sorted(self.cache.itervalues(), key=lambda a : a.time):
+        for t in sorted(self.generations):
 
-            if ce.time == self.time:
+            if t == self.time:
                 # If we're bigger than the limit, and there's nothing
                 # to remove, we should stop the preloading right away.
                 return False
 
-            # Otherwise, kill off the given cache entry.
-            self.kill(ce)
+            for ce in sorted(self.generations[t].values(), key=CacheEntry.cost):
 
-            # If we're in the limit, we're done.
-            if self.total_cache_size <= self.cache_limit:
-                break
+                # Otherwise, kill off the given cache entry.
+                self.kill(ce)
+                self.evictions += 1
+
+                # If we're in the limit, we're done.
+                if self.total_cache_size <= self.cache_limit:
+                    return True
 
         return True
 
+    def get_stats(self):
+        """
+        Returns a dictionary containing statistics about the cache. See
+        renpy.get_image_cache_stats for the keys.
+        """
+
+        with self.lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                preloaded=self.preloaded,
+                evictions=self.evictions,
+                entries=len(self.cache),
+                size=self.total_cache_size,
+                bytes=self.total_cache_bytes,
+                limit=self.cache_limit,
+                )
+
 
     # Called to report that a given image would like to be preloaded.
     def preload_image(self, im):
@@ -292,10 +757,11 @@ class Cache(object):
             self.added.add(im)
 
             if im in self.cache:
-                self.get(im)
+                self.get(im, True)
                 in_cache = True
             else:
-                self.preloads.append(im)
+                heapq.heappush(self.preloads, (renpy.display.predict.priority, self.preload_serial, im))
+                self.preload_serial += 1
                 in_cache = False
 
         if not in_cache:
@@ -316,7 +782,13 @@ class Cache(object):
         with self.preload_lock:
             self.preload_lock.notify()
 
-    def preload_thread_main(self):
+    def preload_thread_main(self, pin):
+        """
+        The main function of a preload thread. Each thread takes the image
+        with the lowest priority off the preload heap and loads it, until
+        the heap is empty. If `pin` is true, this thread also loads pinned
+        images when there's nothing else to preload.
+        """
 
         while self.keep_preloading:
 
@@ -324,39 +796,39 @@ class Cache(object):
             self.preload_lock.wait()
             self.preload_lock.release()
 
-            while self.preloads and self.keep_preloading:
+            while self.keep_preloading:
 
                 # If the size of the current generation is bigger than the
                 # total cache size, stop preloading.
                 with self.lock:
 
+                    if not self.preloads:
+                        break
+
                     # If the cache is overfull, clean it out.
                     if not self.cleanout():
 
                         if renpy.config.debug_image_cache:
-                            for i in self.preloads:
+                            for _priority, _serial, i in self.preloads:
                                 renpy.display.ic_log.write("Overfull %r", i)
 
                         self.preloads = [ ]
 
                         break
 
-                try:
-                    image = self.preloads.pop(0)
+                    _priority, _serial, image = heapq.heappop(self.preloads)
 
-                    if image not in self.preload_blacklist:
-                        try:
-                            self.get(image, True)
-                        except:
-                            self.preload_blacklist.add(image)
-                except:
-                    pass
+                if image not in self.preload_blacklist:
+                    try:
+                        self.get(image, True)
+                    except:
+                        self.preload_blacklist.add(image)
 
             with self.lock:
                 self.cleanout()
 
             # If we have time, preload pinned images.
-            if self.keep_preloading and not renpy.game.less_memory:
+            if pin and self.keep_preloading and not renpy.game.less_memory:
 
                 workset = set(renpy.store._cache_pin_set)
 
@@ -385,7 +857,7 @@ class Cache(object):
                     try:
                         surf = image.load()
                         self.pin_cache[image] = surf
-                        renpy.display.draw.load_texture(surf)
+                        self.load_texture(image, surf)
                     except:
                         self.preload_blacklist.add(image)
 
@@ -394,7 +866,7 @@ class Cache(object):
         if not renpy.config.developer:
             return
 
-        preload = (threading.current_thread() is self.preload_thread)
+        preload = (threading.current_thread() in self.preload_threads)
 
         self.load_log.insert(0, (time.time(), filename, preload))
 
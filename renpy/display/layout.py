@@ -756,6 +756,11 @@ class MultiBox(Container):
             line = [ ]
             remheight = height
 
+            # Every child is rendered at the full width, so the texts among
+            # them can be laid out together.
+            if not box_wrap:
+                renpy.text.text.layout_texts(children, width, height)
+
             for d, padding, cst, cat in zip(children, spacings, csts, cats):
 
                 if box_wrap:
@@ -0,0 +1,141 @@
+# Copyright 2004-2014 Tom Rothamel <pytom@bishoujo.us>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+# This is a renderer that draws into a surface in memory, using the software
+# renderer, rather than to a window on the screen.
+
+import renpy.display
+import pygame
+import hashlib
+import os
+
+from renpy.display.swdraw import SWDraw, do_draw_screen
+
+
+class NullDraw(SWDraw):
+    """
+    This draws the screen with the software renderer, to a surface that
+    isn't shown. It uses SDL's dummy video driver, so it doesn't need a
+    display, and it doesn't limit the frame rate. This is meant for
+    running games on servers without a display, for automated testing,
+    and for benchmarking.
+
+    When the RENPY_NULL_FRAMES environment variable gives a directory,
+    each frame that is drawn is saved to it as a png. When the
+    RENPY_NULL_CHECKSUMS environment variable gives a file, a line giving
+    the frame number, the current statement, and a checksum of the frame
+    is written to it for each frame.
+    """
+
+    def __init__(self):
+
+        # The number of frames that have been drawn.
+        self.frame = 0
+
+        self.frames_directory = os.environ.get("RENPY_NULL_FRAMES", None)
+
+        if self.frames_directory is not None:
+            if not os.path.isdir(self.frames_directory):
+                os.makedirs(self.frames_directory)
+
+        checksums = os.environ.get("RENPY_NULL_CHECKSUMS", None)
+
+        if checksums is not None:
+            self.checksums = file(checksums, "w")
+        else:
+            self.checksums = None
+
+        # If the display was initialized with a real video driver, switch
+        # to the dummy one.
+        if os.environ.get("SDL_VIDEODRIVER", None) != "dummy":
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+            pygame.display.quit()
+
+        super(NullDraw, self).__init__()
+
+    def reset(self):
+
+        super(NullDraw, self).reset()
+
+        self.info["renderer"] = "null"
+
+    def set_mode(self, virtual_size, physical_size, fullscreen):
+
+        # Reset before resize.
+        renpy.display.interface.kill_textures_and_surfaces()
+        self.reset()
+
+        self.scale_factor = 1.0
+
+        self.screen = pygame.display.set_mode(virtual_size, 0, 32)
+        self.window = self.screen
+
+        renpy.display.pgrender.set_rgba_masks()
+
+        self.full_redraw = True
+        self.fullscreen_surface = self.screen
+
+        return True
+
+    def should_redraw(self, needs_redraw, first_pass):
+        return needs_redraw
+
+    def update_mouse(self):
+        return
+
+    def draw_screen(self, surftree, fullscreen_video):
+
+        if fullscreen_video:
+            self.full_redraw = True
+            return
+
+        damage = do_draw_screen(surftree, self.full_redraw, self)
+
+        self.full_redraw = False
+
+        if damage:
+            self.frame += 1
+            self.dump_frame()
+
+    def dump_frame(self):
+        """
+        Saves the frame that was just drawn, and its checksum, if asked to.
+        """
+
+        if self.frames_directory is not None:
+            fn = os.path.join(self.frames_directory, "frame%06d.png" % self.frame)
+            pygame.image.save(self.window, fn)
+
+        if self.checksums is not None:
+            filename, line = renpy.exports.get_filename_line()
+            checksum = hashlib.md5(pygame.image.tostring(self.window, "RGB")).hexdigest()
+
+            self.checksums.write("%d %s:%d %s\n" % (self.frame, filename, line, checksum))
+            self.checksums.flush()
+
+    def quit(self): #@ReservedAssignment
+
+        if self.checksums is not None:
+            self.checksums.close()
+            self.checksums = None
+
+        super(NullDraw, self).quit()
@@ -25,6 +25,18 @@ from renpy.display.render import render, BLIT
 
 import renpy.display
 import random
+import operator
+import array
+import pygame
+
+from itertools import compress, imap, izip, repeat
+
+# The size of the cells of the grid used to find the sprites at a point.
+HIT_GRID_SIZE = 64
+
+# The mouse events that are only passed to the sprites under the mouse,
+# when hit testing is enabled.
+MOUSE_EVENTS = ( pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP )
 
 
 class SpriteCache(renpy.object.Object):
@@ -81,6 +93,34 @@ class Sprite(renpy.object.Object):
     # cache - the SpriteCache of child.
     # live - True if this sprite is still alive.
     # manager - A reference to the SpriteManager.
+    # _zorder, _events - The values of the zorder and events properties.
+
+    __version__ = 1
+
+    def after_upgrade(self, version):
+        if version < 1:
+            self._zorder = self.__dict__.pop("zorder", 0)
+            self._events = self.__dict__.pop("events", False)
+
+    def get_zorder(self):
+        return self._zorder
+
+    def set_zorder(self, value):
+        if value != self._zorder:
+            self._zorder = value
+            self.manager.sorted = False
+
+    zorder = property(get_zorder, set_zorder)
+
+    def get_events(self):
+        return self._events
+
+    def set_events(self, value):
+        if value != self._events:
+            self._events = value
+            self.manager.event_sprites = None
+
+    events = property(get_events, set_events)
 
     def set_child(self, d):
         """
@@ -126,7 +166,16 @@ class SpriteManager(renpy.display.core.Displayable):
     them at the fastest speed possible.
     """
 
-    def __init__(self, update=None, event=None, predict=None, ignore_time=False, **properties):
+    __version__ = 1
+
+    def after_upgrade(self, version):
+        if version < 1:
+            self.hit_test = False
+            self.sorted = False
+            self.event_sprites = None
+            self.hit_grid = None
+
+    def __init__(self, update=None, event=None, predict=None, ignore_time=False, hit_test=False, **properties):
         """
         `update`
             If not None, a function that is called each time a sprite
@@ -159,6 +208,14 @@ class SpriteManager(renpy.display.core.Displayable):
             it will keep all displayables used in memory for the life of the
             SpriteManager.
 
+        `hit_test`
+            If True, mouse events are only passed to a sprite with `events`
+            set if the mouse is over the area the sprite was last drawn in.
+            This lets the SpriteManager find the sprites an event should go
+            to without checking every sprite, which is much faster when
+            there are many sprites. Other events are passed to every sprite
+            with `events` set.
+
         After being rendered once (before the `update` function is called),
         SpriteManagers have the following fields:
 
@@ -176,6 +233,7 @@ class SpriteManager(renpy.display.core.Displayable):
         self.event_function = event
         self.predict_function = predict
         self.ignore_time = ignore_time
+        self.hit_test = hit_test
 
         # A map from a displayable to the SpriteDisplayable object
         # representing that displayable.
@@ -185,11 +243,20 @@ class SpriteManager(renpy.display.core.Displayable):
         # This is a list of Sprites.
         self.children = [ ]
 
+        # True if the children are known to be in zorder.
+        self.sorted = True
+
         # True if at least one child has been killed.
         self.dead_child = False
 
-        # True if at least one child responds to events.
-        self.events = False
+        # A list of the children that respond to events, from front to
+        # back, or None if it needs to be recomputed.
+        self.event_sprites = None
+
+        # If hit testing is enabled, a map from a grid cell to a list of
+        # (sprite, x, y, width, height) tuples, giving the children that
+        # respond to events and were drawn in that cell, from back to front.
+        self.hit_grid = None
 
         # The width and height.
         self.width = None
@@ -218,11 +285,16 @@ class SpriteManager(renpy.display.core.Displayable):
         s = Sprite()
         s.x = 0
         s.y = 0
-        s.zorder = 0
+        s._zorder = 0
         s.cache = sc
         s.live = True
         s.manager = self
-        s.events = False
+        s._events = False
+
+        # The new sprite goes at the end of the list, which is only out of
+        # order if a sprite before it has a zorder greater than 0.
+        if self.children and self.children[-1]._zorder > 0:
+            self.sorted = False
 
         self.children.append(s)
 
@@ -260,19 +332,27 @@ class SpriteManager(renpy.display.core.Displayable):
 
         if self.dead_child:
             self.children = [ i for i in self.children if i.live ]
+            self.dead_child = False
+            self.event_sprites = None
 
-        self.children.sort(key=lambda sc:sc.zorder)
+        # Sorting is stable, so there's no need to sort again until a zorder
+        # changes.
+        if not self.sorted:
+            self.children.sort(key=operator.attrgetter("_zorder"))
+            self.sorted = True
+            self.event_sprites = None
 
         caches = [ ]
 
         rv = renpy.display.render.Render(width, height)
 
-        events = False
+        if self.hit_test:
+            hit_grid = { }
+        else:
+            hit_grid = None
 
         for i in self.children:
 
-            events |= i.events
-
             cache = i.cache
             r = i.cache.render
             if cache.render is None:
@@ -299,19 +379,43 @@ class SpriteManager(renpy.display.core.Displayable):
             else:
                 rv.subpixel_blit(r, (i.x, i.y))
 
+            if i._events and (hit_grid is not None):
+                add_hit(hit_grid, i, i.x, i.y, r.width, r.height)
+
         for i in caches:
             i.render = None
 
+        self.hit_grid = hit_grid
+
         return rv
 
     def event(self, ev, x, y, st):
-        for i in xrange(len(self.children) -1, -1, -1):
-            s = self.children[i]
 
-            if s.events:
-                rv = s.cache.child.event(ev, x - s.x, y - s.y, st - s.cache.st)
-                if rv is not None:
-                    return rv
+        if self.hit_test and (ev.type in MOUSE_EVENTS) and (self.hit_grid is not None):
+
+            cell = self.hit_grid.get((int(x // HIT_GRID_SIZE), int(y // HIT_GRID_SIZE)), ())
+
+            for s, sx, sy, sw, sh in reversed(cell):
+
+                if not (sx <= x < sx + sw and sy <= y < sy + sh):
+                    continue
+
+                if s._events:
+                    rv = s.cache.child.event(ev, x - s.x, y - s.y, st - s.cache.st)
+                    if rv is not None:
+                        return rv
+
+        else:
+
+            if self.event_sprites is None:
+                self.event_sprites = [ i for i in reversed(self.children) if i._events ]
+
+            for s in self.event_sprites:
+
+                if s._events:
+                    rv = s.cache.child.event(ev, x - s.x, y - s.y, st - s.cache.st)
+                    if rv is not None:
+                        return rv
 
         if self.event_function is not None:
             return self.event_function(ev, x, y, st)
@@ -334,6 +438,230 @@ class SpriteManager(renpy.display.core.Displayable):
 
     def destroy_all(self):
         self.children = [ ]
+        self.sorted = True
+        self.event_sprites = None
+        self.hit_grid = None
+
+
+def add_hit(grid, sprite, x, y, width, height):
+    """
+    Adds `sprite`, drawn at `x`, `y` with the given `width` and `height`,
+    to each cell of the hit grid `grid` that it covers.
+    """
+
+    entry = (sprite, x, y, width, height)
+
+    x0 = int(x // HIT_GRID_SIZE)
+    y0 = int(y // HIT_GRID_SIZE)
+    x1 = int((x + width) // HIT_GRID_SIZE)
+    y1 = int((y + height) // HIT_GRID_SIZE)
+
+    for cy in xrange(y0, y1 + 1):
+        for cx in xrange(x0, x1 + 1):
+            cell = grid.get((cx, cy), None)
+
+            if cell is None:
+                grid[cx, cy] = [ entry ]
+            else:
+                cell.append(entry)
+
+class SpritePool(renpy.display.core.Displayable, renpy.python.NoRollback):
+    """
+    :doc: sprites class
+
+    This displayable shows many sprites that all show the same displayable,
+    with each sprite moving in a straight line at a constant speed for
+    a limited time. Rather than being kept in Sprite objects, the sprites
+    are stored in arrays, and their positions are computed in bulk each
+    time the pool is rendered. This lets a SpritePool show tens of
+    thousands of sprites, where a SpriteManager is limited to a few
+    thousand.
+    """
+
+    def __init__(self, d, update=None, **properties):
+        """
+        `d`
+            The displayable shown by each sprite.
+
+        `update`
+            If not None, a function that is called each time the pool is
+            rendered, before the positions of the sprites are computed. It
+            is called with one argument, the time in seconds since the
+            pool was first displayed, and may add and remove sprites.
+
+        SpritePools have the following methods:
+        """
+
+        super(SpritePool, self).__init__(**properties)
+
+        self.child = renpy.easy.displayable(d)
+        self.update_function = update
+
+        # Arrays giving the position of each sprite at the time it was
+        # added, its speed, the time it was added, and the number of
+        # seconds it is shown for. A lifetime of -1 marks an unused slot.
+        self.xstart = array.array('d')
+        self.ystart = array.array('d')
+        self.xspeed = array.array('d')
+        self.yspeed = array.array('d')
+        self.born = array.array('d')
+        self.lifetime = array.array('d')
+
+        # A list of the indexes of unused slots.
+        self.free = [ ]
+
+    def add(self, x, y, xspeed, yspeed, st, lifetime=None):
+        """
+        :doc: sprites method
+
+        Adds a sprite to this pool, and returns the index of the sprite.
+
+        `x`, `y`
+            The position of the upper-left corner of the sprite at time
+            `st`, relative to the pool.
+
+        `xspeed`, `yspeed`
+            The speed of the sprite, in pixels per second.
+
+        `st`
+            The time the sprite is added at, in seconds since the pool
+            was first displayed.
+
+        `lifetime`
+            The number of seconds the sprite is shown for, after which it
+            expires. If None, the sprite never expires.
+        """
+
+        if lifetime is None:
+            lifetime = float("inf")
+
+        if self.free:
+            i = self.free.pop()
+
+            self.xstart[i] = x
+            self.ystart[i] = y
+            self.xspeed[i] = xspeed
+            self.yspeed[i] = yspeed
+            self.born[i] = st
+            self.lifetime[i] = lifetime
+
+        else:
+            i = len(self.born)
+
+            self.xstart.append(x)
+            self.ystart.append(y)
+            self.xspeed.append(xspeed)
+            self.yspeed.append(yspeed)
+            self.born.append(st)
+            self.lifetime.append(lifetime)
+
+        return i
+
+    def remove(self, index):
+        """
+        :doc: sprites method
+
+        Removes the sprite with `index` from this pool.
+        """
+
+        if self.lifetime[index] < 0:
+            return
+
+        self.lifetime[index] = -1
+        self.free.append(index)
+
+    def expired(self, st):
+        """
+        :doc: sprites method
+
+        Returns a list of the indexes of the sprites that have expired by
+        time `st`, but have not been removed.
+        """
+
+        n = len(self.born)
+
+        ages = map(operator.sub, repeat(st, n), self.born)
+        done = imap(operator.ge, ages, self.lifetime)
+        used = imap(operator.ge, self.lifetime, repeat(0.0, n))
+
+        return list(compress(xrange(n), imap(operator.and_, done, used)))
+
+    def count(self):
+        """
+        :doc: sprites method
+
+        Returns the number of sprites in this pool.
+        """
+
+        return len(self.born) - len(self.free)
+
+    def clear(self):
+        """
+        :doc: sprites method
+
+        Removes all sprites from this pool.
+        """
+
+        for a in (self.xstart, self.ystart, self.xspeed, self.yspeed, self.born, self.lifetime):
+            del a[:]
+
+        self.free = [ ]
+
+    def update(self, st):
+        """
+        Called when the pool is rendered, to add and remove sprites.
+        """
+
+        if self.update_function is not None:
+            self.update_function(st)
+
+    def render(self, width, height, st, at):
+
+        self.update(st)
+
+        n = len(self.born)
+
+        # Compute the positions of the sprites that are being shown. These
+        # loops all run in C, rather than once per sprite in Python.
+        ages = map(operator.sub, repeat(st, n), self.born)
+
+        shown = map(operator.and_,
+                    imap(operator.ge, ages, repeat(0.0, n)),
+                    imap(operator.lt, ages, self.lifetime))
+
+        xs = map(int, compress(imap(operator.add, self.xstart, imap(operator.mul, ages, self.xspeed)), shown))
+        ys = map(int, compress(imap(operator.add, self.ystart, imap(operator.mul, ages, self.yspeed)), shown))
+
+        rv = renpy.display.render.Render(width, height)
+
+        r = render(self.child, width, height, st, at)
+        rv.depends_on(r)
+
+        count = len(xs)
+
+        if (r.operation == BLIT) and (r.forward is None) and (r.alpha == 1.0) and (r.over == 1.0):
+            for child, xo, yo, _focus, _main in r.children:
+                rv.children.extend(izip(
+                    repeat(child, count),
+                    imap(operator.add, xs, repeat(xo, count)),
+                    imap(operator.add, ys, repeat(yo, count)),
+                    repeat(False, count),
+                    repeat(False, count)))
+
+        else:
+            for x, y in izip(xs, ys):
+                rv.subpixel_blit(r, (x, y))
+
+        # Keep rendering while there are sprites to move, or while the
+        # update function may add more.
+        if (self.update_function is not None) or (n > len(self.free)):
+            renpy.display.render.redraw(self, 0)
+
+        return rv
+
+    def visit(self):
+        return [ self.child ]
+
 
 
 class Particles(renpy.display.core.Displayable, renpy.python.NoRollback):
@@ -555,6 +883,101 @@ class SnowBlossomParticle(renpy.python.NoRollback):
         else:
             return int(ypos), int(xpos), to + self.offset, self.image
 
+class SnowBlossomPool(SpritePool):
+    """
+    A SpritePool that implements the snowblossom effect.
+    """
+
+    def __init__(self, image, count, xspeed, yspeed, border, start, fast, rotate, **properties):
+
+        super(SnowBlossomPool, self).__init__(image, update=self.update_callback, **properties)
+
+        self.total = count
+        self.xrange = xspeed
+        self.yrange = yspeed
+        self.border = border
+        self.start = start
+        self.fast = fast
+        self.rotate = rotate
+
+        self.starts = [ random.uniform(0, start) for _i in xrange(0, count) ]
+        self.starts.sort()
+
+    def add_particle(self, st, fast):
+        """
+        Adds a single particle to the pool at time `st`. If `fast` is true,
+        the particle starts somewhere on the screen, rather than at the
+        edge.
+        """
+
+        def ranged(n):
+            if isinstance(n, tuple):
+                return random.uniform(n[0], n[1])
+            else:
+                return n
+
+        xspeed = ranged(self.xrange)
+        yspeed = ranged(self.yrange)
+        border = self.border
+
+        # safety.
+        if yspeed == 0:
+            yspeed = 1
+
+        if not self.rotate:
+            sh = renpy.config.screen_height
+            sw = renpy.config.screen_width
+        else:
+            sw = renpy.config.screen_height
+            sh = renpy.config.screen_width
+
+        if yspeed > 0:
+            ystart = -border
+            yend = sh + border
+        else:
+            ystart = sh + border
+            yend = -border
+
+        if fast:
+            ystart = random.uniform(-border, sh + border)
+            xstart = random.uniform(0, sw)
+
+        else:
+            travel_time = (2.0 * border + sh) / abs(yspeed)
+            xdist = xspeed * travel_time
+
+            x0 = min(-xdist, 0)
+            x1 = max(sw + xdist, sw)
+
+            xstart = random.uniform(x0, x1)
+
+        lifetime = (yend - ystart) / yspeed
+
+        if not self.rotate:
+            self.add(xstart, ystart, xspeed, yspeed, st, lifetime)
+        else:
+            self.add(ystart, xstart, yspeed, xspeed, st, lifetime)
+
+    def update_callback(self, st):
+
+        if st == 0:
+            self.clear()
+
+        for i in self.expired(st):
+            self.remove(i)
+
+        if self.fast and st == 0:
+            for _i in xrange(self.total):
+                self.add_particle(st, True)
+
+        # Like SnowBlossomFactory, add at most one particle each time
+        # we're rendered, so the particles are spread out.
+        count = self.count()
+
+        if (count < self.total) and (st >= self.starts[count]):
+            self.add_particle(st, False)
+
+
 def SnowBlossom(d,
                 count=10,
                 border=50,
@@ -562,7 +985,8 @@ def SnowBlossom(d,
                 yspeed=(100, 200),
                 start=0,
                 fast=False,
-                horizontal=False):
+                horizontal=False,
+                pool=False):
 
     """
     :doc: sprites_extra
@@ -598,12 +1022,26 @@ def SnowBlossom(d,
     `horizontal`
         If true, particles appear on the left or right side of the screen,
         rather than the top or bottom.
+
+    `pool`
+        If true, the particles are kept in a :class:`SpritePool`, which
+        makes it possible to display tens of thousands of them.
         """
 
     # If going horizontal, swap the xspeed and the yspeed.
     if horizontal:
         xspeed, yspeed = yspeed, xspeed
 
+    if pool:
+        return SnowBlossomPool(d,
+                               count=count,
+                               border=border,
+                               xspeed=xspeed,
+                               yspeed=yspeed,
+                               start=start,
+                               fast=fast,
+                               rotate=horizontal)
+
     return Particles(SnowBlossomFactory(image=d,
                                         count=count,
                                         border=border,
@@ -38,6 +38,11 @@ predicting = False
 # like to predict.
 screens = [ ]
 
+# The priority of the images being predicted. Images with a lower priority
+# are preloaded first. This is the number of statements between the
+# current statement and the statement being predicted.
+priority = 0
+
 def displayable(d):
     """
     Called to predict that the displayable `d` will be shown.
@@ -81,6 +86,7 @@ def prediction_coroutine(root_widget):
     """
 
     global predicting
+    global priority
 
     # Wait to be told to start.
     yield True
@@ -94,6 +100,7 @@ def prediction_coroutine(root_widget):
     image = renpy.display.im.cache.preload_image
 
     predicting = True
+    priority = 0
 
     # Predict displayables given to renpy.start_predict.
     for d in renpy.store._predict_set:
@@ -118,10 +125,14 @@ def prediction_coroutine(root_widget):
 
     for _i in renpy.game.context().predict():
 
+        priority += 1
+
         predicting = False
         yield True
         predicting = True
 
+    priority = renpy.config.predict_statements
+
     # If there's a parent context, predict we'll be returning to it
     # shortly. Otherwise, call the functions in
     # config.predict_callbacks.
@@ -29,7 +29,8 @@ cdef class Matrix2D:
 
 cdef class Render:
 
-    cdef public bint mark, cache_killed
+    cdef public bint live, cache_killed
+    cdef public int refcount
 
     cdef public float width, height
     cdef public object layer_name
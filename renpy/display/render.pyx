@@ -42,9 +42,24 @@ redraw_queue = [ ]
 # The render returned from render_screen.
 screen_render = None
 
-# A list of renders the system knows about, and thinks are still alive.
-cdef list live_renders
-live_renders = [ ]
+# The render that was the root of the screen the last time mark_sweep ran.
+swept_render = None
+
+# A list of renders that have been created since mark_sweep last ran.
+cdef list new_renders
+new_renders = [ ]
+
+# The number of renders that are alive, and the number of renders that
+# have been created and found in the render cache since mark_sweep last
+# ran.
+cdef int live_count, created_count, reused_count
+live_count = 0
+created_count = 0
+reused_count = 0
+
+# Statistics about the renders created, reused, killed, and visited during
+# the last frame.
+render_stats = dict(created=0, reused=0, killed=0, visited=0)
 
 # A copy of renpy.display.interface.frame_time, for speed reasons.
 cdef double frame_time
@@ -119,6 +134,8 @@ cpdef render(d, object widtho, object heighto, double st, double at):
     cdef dict render_cache_d
     cdef Render rv
 
+    global reused_count
+
     orig_wh = (widtho, heighto, frame_time-st, frame_time-at)
 
     id_d = id(d)
@@ -126,6 +143,7 @@ cpdef render(d, object widtho, object heighto, double st, double at):
     rv = render_cache_d.get(orig_wh, None)
 
     if rv is not None:
+        reused_count += 1
         return rv
 
     orig_width = width = widtho
@@ -159,6 +177,7 @@ cpdef render(d, object widtho, object heighto, double st, double at):
         rv = render_cache_d.get(wh, None)
 
         if rv is not None:
+            reused_count += 1
             return rv
 
     else:
@@ -314,11 +333,37 @@ cdef class Matrix2D:
 
 IDENTITY = Matrix2D(1, 0, 0, 1)
 
+cdef bint is_identity(Matrix2D m):
+    """
+    Returns true if `m` is None or the identity matrix.
+    """
+
+    if m is None:
+        return True
+
+    return m.xdx == 1 and m.xdy == 0 and m.ydx == 0 and m.ydy == 1
+
+# True if the focus regions found by the last call to take_focuses are
+# exactly the areas in which focus_at_point finds each focus, so the
+# regions can be searched instead of the render tree. This is False if
+# a focus is masked, transformed, or clipped in a way the regions can't
+# represent.
+focuses_exact = True
+
+# The render take_focuses was last called on.
+focuses_render = None
+
 def take_focuses(focuses):
     """
     Adds a list of rectangular focus regions to the focuses list.
     """
 
+    global focuses_exact
+    global focuses_render
+
+    focuses_exact = True
+    focuses_render = screen_render
+
     screen_render.take_focuses(
         0, 0, screen_render.width, screen_render.height,
         IDENTITY, 0, 0, focuses)
@@ -375,40 +420,111 @@ def render_screen(root, width, height):
 
 def mark_sweep():
     """
-    This performs mark-and-sweep garbage collection on the live_renders
-    list.
+    This removes renders that are no longer reachable from the screen
+    from the render cache.
+
+    Rather than walking every render on the screen, this keeps a count
+    of the live renders that depend on each live render. Only the renders
+    created since the last call are walked to find the renders that have
+    become live, and only the renders whose count drops to zero are
+    walked to find the renders that have died. So the cost is
+    proportional to the part of the screen that changed. (This relies on
+    renders being built from the bottom up, so a render can never depend
+    on itself, even indirectly.)
     """
 
-    global live_renders
+    global swept_render
+    global new_renders
+    global live_count
+    global created_count
+    global reused_count
 
     cdef list worklist
-    cdef int i
     cdef Render r, j
+    cdef int killed_count = 0
+    cdef int visited_count = 0
 
+    # Find the renders that have become live. Live renders that were
+    # already live keep their children alive, so the walk stops at them.
     worklist = [ ]
 
     if screen_render is not None:
-        worklist.append(screen_render)
+        r = screen_render
+        r.refcount += 1
+
+        if not r.live:
+            r.live = True
+            worklist.append(r)
 
-    i = 0
+    # New renders, and renders that a live render has come to depend on.
+    for r in new_renders:
+        if r.refcount and not r.live:
+            r.live = True
+            worklist.append(r)
 
-    while i < len(worklist):
-        r = worklist[i]
+    while worklist:
+        r = worklist.pop()
+        visited_count += 1
+        live_count += 1
 
         for j in r.depends_on_list:
-            if not j.mark:
-                j.mark = True
+            j.refcount += 1
+
+            if not j.live:
+                j.live = True
                 worklist.append(j)
 
-        i += 1
+    # Find the renders that have died, starting with the old root.
+    if swept_render is not None:
+        r = swept_render
+        r.refcount -= 1
+
+        if r.refcount == 0 and r.live:
+            worklist.append(r)
+
+    while worklist:
+        r = worklist.pop()
+        visited_count += 1
+        live_count -= 1
+        killed_count += 1
+
+        r.live = False
+        r.kill_cache()
+
+        for j in r.depends_on_list:
+            j.refcount -= 1
+
+            if j.refcount == 0 and j.live:
+                worklist.append(j)
 
-    for r in live_renders:
-        if not r.mark:
+    # Renders that were created but never became live are removed from
+    # the cache, too.
+    for r in new_renders:
+        if not r.live and not r.cache_killed:
+            killed_count += 1
             r.kill_cache()
-        else:
-            r.mark = False
 
-    live_renders = worklist
+    render_stats["created"] = created_count
+    render_stats["reused"] = reused_count
+    render_stats["killed"] = killed_count
+    render_stats["visited"] = visited_count
+
+    new_renders = [ ]
+    created_count = 0
+    reused_count = 0
+    swept_render = screen_render
+
+
+def get_render_stats():
+    """
+    Returns a dictionary giving the number of renders that are alive, and
+    the number of renders created, reused from the render cache, killed,
+    and visited during the last frame.
+    """
+
+    rv = dict(render_stats)
+    rv["live"] = live_count
+    return rv
 
 def compute_subline(sx0, sw, cx0, cw):
     """
@@ -450,6 +566,22 @@ DISSOLVE = 1
 IMAGEDISSOLVE = 2
 PIXELLATE = 3
 
+cdef void add_dependency(Render parent, Render child):
+    """
+    Records that `parent` depends on `child`. If `parent` is already live,
+    this keeps `child` alive as well.
+    """
+
+    parent.depends_on_list.append(child)
+    child.parents.add(parent)
+
+    if parent.live:
+        child.refcount += 1
+
+        if not child.live:
+            new_renders.append(child)
+
+
 cdef class Render:
 
     def __init__(Render self, float width, float height, draw_func=None, layer_name=None, bint opaque=None): #@DuplicatedSignature
@@ -461,9 +593,11 @@ cdef class Render:
         layer.
         """
 
-        # The mark bit, used for mark/sweep-style garbage collection of
-        # renders.
-        self.mark = False
+        # Is this render reachable from the screen? And the number of
+        # live renders that depend on this one. These are used by
+        # mark_sweep to garbage collect renders.
+        self.live = False
+        self.refcount = 0
 
         # Is has this render been removed from the cache?
         self.cache_killed = False
@@ -552,7 +686,10 @@ cdef class Render:
         # Are we modal?
         self.modal = False
 
-        live_renders.append(self)
+        global created_count
+        created_count += 1
+
+        new_renders.append(self)
 
     def __repr__(self): #@DuplicatedSignature
         return "<Render %x of %r>" % (id(self), self.render_of)
@@ -591,8 +728,7 @@ cdef class Render:
             self.children.insert(index, (source, xo, yo, focus, main))
 
         if isinstance(source, Render):
-            self.depends_on_list.append(source)
-            source.parents.add(self)
+            add_dependency(self, source)
 
         return 0
 
@@ -618,8 +754,7 @@ cdef class Render:
             self.children.insert(index, (source, xo, yo, focus, main))
 
         if isinstance(source, Render):
-            self.depends_on_list.append(source)
-            source.parents.add(self)
+            add_dependency(self, source)
 
         return 0
 
@@ -780,8 +915,7 @@ cdef class Render:
         if source is self:
             raise Exception("Render depends on itself.")
 
-        self.depends_on_list.append(source)
-        source.parents.add(self)
+        add_dependency(self, source)
 
         if focus:
             if self.pass_focuses is None:
@@ -848,7 +982,7 @@ cdef class Render:
         else:
             self.focuses.append(t)
 
-    def take_focuses(self, cminx, cminy, cmaxx, cmaxy, reverse, x, y, focuses): #@DuplicatedSignature
+    def take_focuses(self, cminx, cminy, cmaxx, cmaxy, reverse, x, y, focuses, exact=True): #@DuplicatedSignature
         """
         This adds to focuses Focus objects corresponding to the focuses
         added to this object and its children, transformed into screen
@@ -858,14 +992,24 @@ cdef class Render:
         `reverse` - The transform from render to screen coordinates.
         `x`, `y` - The offset of the upper-left corner of the render.
         `focuses` - The list of focuses to add to.
+        `exact` - False if a parent of this render is transformed.
         """
 
+        global focuses_exact
+
         if self.modal:
             focuses[:] = [ ]
 
+            # A clipped modal render only blocks the focuses beneath it
+            # inside the clipping rectangle.
+            if self.clipping or cminx > 0 or cminy > 0 or cmaxx < focuses_render.width or cmaxy < focuses_render.height:
+                focuses_exact = False
+
         if self.reverse:
             reverse = reverse * self.reverse
 
+        exact = exact and is_identity(self.reverse) and is_identity(self.forward)
+
         if self.focuses:
 
             for (d, arg, xo, yo, w, h, mx, my, mask) in self.focuses:
@@ -874,6 +1018,13 @@ cdef class Render:
                     focuses.append(renpy.display.focus.Focus(d, arg, None, None, None, None))
                     continue
 
+                # focus_at_point clips our own focuses to this render, while
+                # the regions are only clipped by our parents.
+                if not exact or mx is not None:
+                    focuses_exact = False
+                elif self.clipping and (xo < 0 or yo < 0 or xo + w > self.width or yo + h > self.height):
+                    focuses_exact = False
+
                 x1, y1 = reverse.transform(xo, yo)
                 x2, y2 = reverse.transform(xo + w, yo + h)
 
@@ -896,18 +1047,18 @@ cdef class Render:
             cminx = max(cminx, x)
             cminy = max(cminy, y)
             cmaxx = min(cmaxx, x + self.width)
-            cmaxy = min(cmaxx, x + self.height)
+            cmaxy = min(cmaxy, y + self.height)
 
         for child, xo, yo, focus, main in self.children:
             if not focus or not isinstance(child, Render):
                 continue
 
             xo, yo = reverse.transform(xo, yo)
-            child.take_focuses(cminx, cminy, cmaxx, cmaxy, reverse, x + xo, y + yo, focuses)
+            child.take_focuses(cminx, cminy, cmaxx, cmaxy, reverse, x + xo, y + yo, focuses, exact)
 
         if self.pass_focuses:
             for child in self.pass_focuses:
-                child.take_focuses(cminx, cminy, cmaxx, cmaxy, reverse, x, y, focuses)
+                child.take_focuses(cminx, cminy, cmaxx, cmaxy, reverse, x, y, focuses, exact)
 
     def focus_at_point(self, x, y): #@DuplicatedSignature
         """
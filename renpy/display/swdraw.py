@@ -25,6 +25,9 @@ import math
 import weakref
 import time
 import os
+import sys
+import threading
+import Queue
 
 from renpy.display.render import blit_lock, IDENTITY, BLIT, DISSOLVE, IMAGEDISSOLVE, PIXELLATE
 
@@ -52,6 +55,13 @@ class Clipper(object):
         # The set of surfaces that have been mutated recently.
         self.mutated = set()
 
+        # Statistics: the number of frames, the number of pixels drawn, and
+        # the number of pixels not drawn that would have been drawn if only
+        # the rectangle bounding the changes was used.
+        self.frames = 0
+        self.pixels_drawn = 0
+        self.pixels_saved = 0
+
     def compute(self, full_redraw):
         """
         This returns a clipping rectangle, and a list of update rectangles
@@ -83,6 +93,7 @@ class Clipper(object):
         # Check to see if a full redraw has been forced, and return
         # early.
         if full_redraw:
+            self.count(sa, sa)
             return fullscreen, [ fullscreen ]
 
         # Quick checks to see if a dissolve is happening, or something like
@@ -90,6 +101,7 @@ class Clipper(object):
         changes = forced | old_forced
 
         if fullscreen in changes:
+            self.count(sa, sa)
             return fullscreen, [ fullscreen ]
 
         # Compute the differences between the two sets, and add those
@@ -154,83 +166,106 @@ class Clipper(object):
             area = w * h
 
             if area >= sa:
+                self.count(sa, sa)
                 return fullscreen, [ fullscreen ]
 
             sized.append((area, x0, y0, x1, y1))
 
-        sized.sort()
+        if not sized:
+            return None, [ ]
 
-        # The list of non-contiguous updates.
-        noncont = [ ]
+        rects = [ (int(x0), int(y0), int(math.ceil(x1)), int(math.ceil(y1))) for _area, x0, y0, x1, y1 in sized ]
+        rects = merge_rects(rects)
 
-        # The total area of noncont.
-        nca = 0
+        # The cost of drawing the rectangles separately, and of drawing the
+        # rectangle that bounds them all.
+        x0 = min(i[0] for i in rects)
+        y0 = min(i[1] for i in rects)
+        x1 = max(i[2] for i in rects)
+        y1 = max(i[3] for i in rects)
 
-        # Pick the largest area, merge with all overlapping smaller areas, repeat
-        # until no merge possible.
-        while sized:
-            area, x0, y0, x1, y1 = sized.pop()
+        separate = sum((ix1 - ix0) * (iy1 - iy0) for ix0, iy0, ix1, iy1 in rects) + len(rects) * UPDATE_COST
+        bounding = (x1 - x0) * (y1 - y0) + UPDATE_COST
 
+        if min(separate, bounding) >= sa + UPDATE_COST:
+            self.count(sa, sa)
+            return fullscreen, [ fullscreen ]
 
-            merged = False
+        if bounding <= separate:
+            rects = [ (x0, y0, x1, y1) ]
 
-            if nca + area >= sa:
-                return (0, 0, sw, sh), [ (0, 0, sw, sh) ]
+        # A list of (x, y, w, h) tuples for each update.
+        updates = [ (ix0, iy0, ix1 - ix0, iy1 - iy0) for ix0, iy0, ix1, iy1 in rects ]
 
-            i = 0
+        self.count(sum(w * h for _x, _y, w, h in updates), (x1 - x0) * (y1 - y0))
 
-            while i < len(sized):
-                _iarea, ix0, iy0, ix1, iy1 = sized[i]
+        return (x0, y0, x1 - x0, y1 - y0), updates
 
-                if (x0 <= ix0 <= x1 or x0 <= ix1 <= x1) and \
-                   (y0 <= iy0 <= y1 or y0 <= iy1 <= y1):
+    def count(self, drawn, bounding):
+        """
+        Updates the statistics, when `drawn` pixels will be drawn to update
+        the screen, in place of the `bounding` pixels in the rectangle that
+        bounds the changes.
+        """
 
-                    merged = True
-                    x0 = min(x0, ix0)
-                    x1 = max(x1, ix1)
-                    y0 = min(y0, iy0)
-                    y1 = max(y1, iy1)
+        self.frames += 1
+        self.pixels_drawn += drawn
+        self.pixels_saved += bounding - drawn
 
-                    area = (x1 - x0) * (y1 - y0)
+    def get_stats(self):
+        return {
+            "frames" : self.frames,
+            "pixels_drawn" : self.pixels_drawn,
+            "pixels_saved" : self.pixels_saved,
+            }
 
-                    sized.pop(i)
+# The cost, in pixels, of drawing an additional rectangle. This accounts for
+# walking the render tree once for each rectangle.
+UPDATE_COST = 128 * 128
 
-                else:
-                    i += 1
+def merge_rects(rects):
+    """
+    Takes a list of (x0, y0, x1, y1) rectangles, and returns a list of
+    non-overlapping rectangles that covers the same area. Rectangles that
+    overlap are merged, as are rectangles where drawing the rectangle that
+    bounds them costs no more than drawing them separately.
+    """
 
-            if merged:
-                sized.append((area, x0, y0, x1, y1))
-            else:
-                noncont.append((x0, y0, x1, y1))
-                nca += area
+    while True:
 
-        if not noncont:
-            return None, [ ]
+        merged = False
 
-        x0, y0, x1, y1 = noncont.pop()
-        x0 = int(x0)
-        y0 = int(y0)
-        x1 = int(math.ceil(x1))
-        y1 = int(math.ceil(y1))
+        rv = [ ]
 
-        # A list of (x, y, w, h) tuples for each update.
-        updates = [ (x0, y0, x1 - x0, y1 - y0) ]
+        # Sweep from left to right, merging each rectangle into the first
+        # rectangle it's worth merging with.
+        rects.sort()
 
-        for ix0, iy0, ix1, iy1 in noncont:
+        for r in rects:
+            x0, y0, x1, y1 = r
+            area = (x1 - x0) * (y1 - y0)
 
-            ix0 = int(ix0)
-            iy0 = int(iy0)
-            ix1 = int(math.ceil(ix1))
-            iy1 = int(math.ceil(iy1))
+            for i, (ox0, oy0, ox1, oy1) in enumerate(rv):
 
-            x0 = min(x0, ix0)
-            y0 = min(y0, iy0)
-            x1 = max(x1, ix1)
-            y1 = max(y1, iy1)
+                ux0 = min(x0, ox0)
+                uy0 = min(y0, oy0)
+                ux1 = max(x1, ox1)
+                uy1 = max(y1, oy1)
 
-            updates.append((ix0, iy0, ix1 - ix0, iy1 - iy0))
+                overlap = x0 < ox1 and ox0 < x1 and y0 < oy1 and oy0 < y1
 
-        return (x0, y0, x1 - x0, y1 - y0), updates
+                if overlap or (ux1 - ux0) * (uy1 - uy0) <= area + (ox1 - ox0) * (oy1 - oy0) + UPDATE_COST:
+                    rv[i] = (ux0, uy0, ux1, uy1)
+                    merged = True
+                    break
+
+            else:
+                rv.append(r)
+
+        if not merged:
+            return rv
+
+        rects = rv
 
 clippers = [ Clipper() ]
 
@@ -633,6 +668,136 @@ def draw_transformed(dest, clip, what, xo, yo, alpha, forward, reverse):
 
 
 
+def prepare_textures(what, reverse=None):
+    """
+    Renders the textures that draw would render while drawing `what`, so
+    that they're only rendered once when the screen is drawn in bands by
+    several threads. `reverse` is the reverse matrix if `what` is drawn by
+    draw_transformed, or None if it's drawn by draw.
+    """
+
+    if not isinstance(what, renpy.display.render.Render):
+        return
+
+    if reverse is None:
+
+        if what.operation == DISSOLVE:
+            what.children[0][0].render_to_texture(True)
+            what.children[1][0].render_to_texture(True)
+            return
+
+        elif what.operation == IMAGEDISSOLVE:
+            what.children[0][0].render_to_texture(True)
+            what.children[1][0].render_to_texture(True)
+            what.children[2][0].render_to_texture(True)
+            return
+
+        elif what.operation == PIXELLATE:
+            what.children[0][0].render_to_texture(False)
+            return
+
+        if what.alpha != 1 or what.over != 1.0 or (what.forward is not None and what.forward is not IDENTITY):
+            child_reverse = what.reverse or IDENTITY
+        else:
+            child_reverse = None
+
+        for child, _cxo, _cyo, _focus, _main in what.visible_children:
+            prepare_textures(child, child_reverse)
+
+        return
+
+    if what.clipping and (reverse.xdy or reverse.ydx):
+        what.pygame_surface(True)
+        return
+
+    if what.draw_func or what.operation != BLIT:
+        what.pygame_surface(True)
+        return
+
+    for child, _cxo, _cyo, _focus, _main in what.visible_children:
+
+        if what.forward:
+            child_reverse = what.reverse * reverse
+        else:
+            child_reverse = reverse
+
+        prepare_textures(child, child_reverse)
+
+# The minimum height of a band drawn by TileDrawer.
+MIN_BAND_HEIGHT = 32
+
+class TileDrawer(object):
+    """
+    Draws the screen in horizontal bands, one per thread. Only one thread
+    runs python code at a time, but the pixel operations in
+    renpy.display.module release the GIL, so transforms and dissolves in
+    different bands run in parallel.
+    """
+
+    def __init__(self, threads):
+
+        # The number of threads, including the one that calls draw.
+        self.threads = threads
+
+        # A queue of bands waiting to be drawn.
+        self.queue = Queue.Queue()
+
+        for _i in range(threads - 1):
+            t = threading.Thread(target=self.worker)
+            t.daemon = True
+            t.start()
+
+    def worker(self):
+
+        while True:
+            self.draw_band(*self.queue.get())
+
+    def draw_band(self, dest, what, xo, yo, done):
+        """
+        Draws a band, then puts None or the exception info on `done`.
+        """
+
+        try:
+            draw(dest, None, what, xo, yo, True)
+            done.put(None)
+        except:
+            done.put(sys.exc_info())
+
+    def draw(self, dest, what, xo, yo):
+        """
+        Draws the render `what` to the surface `dest`, at `xo`, `yo`.
+        """
+
+        w, h = dest.get_size()
+
+        bands = min(self.threads, h // MIN_BAND_HEIGHT)
+
+        if bands <= 1:
+            draw(dest, None, what, xo, yo, True)
+            return
+
+        prepare_textures(what)
+
+        done = Queue.Queue()
+        jobs = [ ]
+
+        for i in range(bands):
+            y0 = h * i // bands
+            y1 = h * (i + 1) // bands
+
+            jobs.append((dest.subsurface((0, y0, w, y1 - y0)), what, xo, yo - y0, done))
+
+        for i in jobs[1:]:
+            self.queue.put(i)
+
+        self.draw_band(*jobs[0])
+
+        errors = [ done.get() for _i in range(bands) ]
+
+        for i in errors:
+            if i is not None:
+                raise i[0], i[1], i[2]
+
 def do_draw_screen(screen_render, full_redraw, swdraw):
     """
     Draws the render produced by render_screen to the screen.
@@ -652,10 +817,17 @@ def do_draw_screen(screen_render, full_redraw, swdraw):
     if cliprect is None:
         return [ ]
 
-    x, y, _w, _h = cliprect
+    # Draw each of the updated rectangles.
+    for rect in updates:
+
+        x, y, _w, _h = rect
 
-    dest = swdraw.window.subsurface(cliprect)
-    draw(dest, None, screen_render, -x, -y, True)
+        dest = swdraw.window.subsurface(rect)
+
+        if swdraw.tile_drawer is not None:
+            swdraw.tile_drawer.draw(dest, screen_render, -x, -y)
+        else:
+            draw(dest, None, screen_render, -x, -y, True)
 
     return updates
 
@@ -668,6 +840,15 @@ class SWDraw(object):
     def __init__(self):
         self.display_info = None
 
+        # If more than one thread is requested, the object used to draw
+        # the screen in bands.
+        threads = int(os.environ.get("RENPY_SW_THREADS", "1"))
+
+        if threads > 1:
+            self.tile_drawer = TileDrawer(threads)
+        else:
+            self.tile_drawer = None
+
         self.reset()
 
     def reset(self):
@@ -77,6 +77,9 @@ def dump(error):
     if not args.json_dump:
         return
 
+    # Labels loaded on demand need to be loaded to be dumped.
+    renpy.game.script.load_all_lazy()
+
     def filter(name, filename): #@ReservedAssignment
         """
         Returns true if the name is included by the filter, or false if it is excluded.
@@ -291,7 +291,17 @@ class Context(renpy.object.Object):
             try:
                 try:
                     self.next_node = None
-                    node.execute()
+
+                    if renpy.playthrough.enabled:
+                        renpy.playthrough.begin(node)
+
+                        try:
+                            node.execute()
+                        finally:
+                            renpy.playthrough.end()
+
+                    else:
+                        node.execute()
 
                 except renpy.game.CONTROL_EXCEPTIONS, e:
 
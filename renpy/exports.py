@@ -791,8 +791,12 @@ def display_menu(items,
     # Auto choosing.
     if renpy.config.auto_choice_delay:
 
-        renpy.ui.pausebehavior(renpy.config.auto_choice_delay,
-                               random.choice(choices))
+        if renpy.playthrough.enabled:
+            choice = renpy.playthrough.choose(choices)
+        else:
+            choice = random.choice(choices)
+
+        renpy.ui.pausebehavior(renpy.config.auto_choice_delay, choice)
 
     # The location
     location=renpy.game.context().current
@@ -1291,6 +1295,10 @@ def get_all_labels():
         if isinstance(i, basestring):
             rv.append(i)
 
+    for i in renpy.game.script.lazy_names.iterkeys():
+        if isinstance(i, basestring):
+            rv.append(i)
+
     return renpy.python.RevertableSet(rv)
 
 
@@ -2583,6 +2591,211 @@ def get_image_load_log(age=None):
         yield i
 
 
+def get_image_cache_stats():
+    """
+    :doc: other
+
+    Returns a dictionary containing statistics about the image cache. The
+    dictionary has the following keys:
+
+    `hits`
+        The number of times an image was found in the cache.
+
+    `misses`
+        The number of times the game stalled to load an image that wasn't
+        in the cache.
+
+    `preloaded`
+        The number of images loaded by the preloader.
+
+    `evictions`
+        The number of images removed from the cache to keep it within its
+        size limit.
+
+    `entries`
+        The number of images currently in the cache.
+
+    `size`
+        The total size of the images in the cache, in pixels.
+
+    `bytes`
+        The total size of the images in the cache, in bytes.
+
+    `limit`
+        The size limit of the cache, in pixels.
+    """
+
+    return renpy.display.im.cache.get_stats()
+
+
+def get_glyph_cache_stats():
+    """
+    :doc: other
+
+    Returns a dictionary containing statistics about the caches of rendered
+    glyphs kept by each truetype font. The dictionary has the following
+    keys:
+
+    `fonts`
+        The number of fonts (at a given size and style) that are loaded.
+
+    `hits`
+        The number of times a glyph was found in a cache.
+
+    `misses`
+        The number of times a glyph had to be rendered.
+    """
+
+    return renpy.text.font.get_glyph_cache_stats()
+
+
+def get_text_layout_cache_stats():
+    """
+    :doc: other
+
+    Returns a dictionary containing statistics about the cache of text
+    layouts shared between text displayables. The dictionary has the
+    following keys:
+
+    `layouts`
+        The number of layouts in the cache.
+
+    `hits`
+        The number of times a layout was found in the cache.
+
+    `misses`
+        The number of times a layout had to be created.
+    """
+
+    return renpy.text.text.get_layout_cache_stats()
+
+
+def get_sw_draw_stats():
+    """
+    :doc: other
+
+    Returns a dictionary containing statistics about the screen updates
+    made by the software renderer. The dictionary has the following keys:
+
+    `frames`
+        The number of frames that have been drawn.
+
+    `pixels_drawn`
+        The number of pixels that have been drawn to update the screen.
+
+    `pixels_saved`
+        The number of pixels that did not need to be drawn, because the
+        changed areas of the screen were drawn separately rather than as
+        the one rectangle that bounds them.
+    """
+
+    import renpy.display.swdraw
+    return renpy.display.swdraw.clippers[0].get_stats()
+
+
+def get_render_stats():
+    """
+    :doc: other
+
+    Returns a dictionary containing statistics about the renders Ren'Py
+    uses to draw the screen. The dictionary has the following keys:
+
+    `live`
+        The number of renders that are part of the current screen.
+
+    `created`
+        The number of renders created during the last frame.
+
+    `reused`
+        The number of times a render was found in the render cache during
+        the last frame, rather than being created.
+
+    `killed`
+        The number of renders removed from the render cache during the
+        last frame.
+
+    `visited`
+        The number of renders examined to find the renders that became
+        part of the screen, or stopped being part of the screen, during
+        the last frame.
+    """
+
+    return renpy.display.render.get_render_stats()
+
+
+def get_frame_profile():
+    """
+    :doc: other
+
+    Returns a list of the frames recorded by the frame profiler, oldest
+    first. The profiler only runs when :var:`config.frame_profile` is
+    not zero.
+
+    Each frame is given as a dictionary. The "start" key gives the time
+    the frame began, and the "frame" key gives the number of seconds
+    until the next frame began, or None for the current frame. The
+    "event", "render", "draw", "gc", "predict", and "audio" keys give
+    the number of seconds spent in each phase of the frame.
+    """
+
+    rv = [ ]
+
+    for f in renpy.display.frametime.get_frames():
+        d = dict(f.phases)
+        d["start"] = f.start
+
+        if f.end is not None:
+            d["frame"] = f.end - f.start
+        else:
+            d["frame"] = None
+
+        rv.append(d)
+
+    return rv
+
+
+def write_frame_trace(filename):
+    """
+    :doc: other
+
+    Writes the frames recorded by the frame profiler to `filename`, in the
+    Chrome trace event format. The file can be loaded into the
+    chrome://tracing page of the Chrome web browser, or another trace
+    viewer, to find frames that took too long to draw.
+    """
+
+    renpy.display.frametime.write_trace(filename)
+
+
+def get_rollback_stats():
+    """
+    :doc: other
+
+    Returns a dictionary containing statistics about the memory used by
+    the rollback log to store the old states of revertable objects. The
+    dictionary has the following keys:
+
+    `entries`
+        The number of entries in the rollback log.
+
+    `objects`
+        The number of object states stored in the log.
+
+    `deltas`
+        The number of those states that are stored as differences from
+        a newer state, because :var:`config.rollback_deltas` is true.
+
+    `size`
+        The approximate number of bytes used to store the states.
+
+    `full_size`
+        The approximate number of bytes that would have been used if
+        every state was stored as a full copy.
+    """
+
+    return renpy.game.log.get_stats()
+
+
 def end_replay():
     """
     :doc: replay
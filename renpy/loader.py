@@ -21,6 +21,9 @@
 
 import renpy
 import os.path
+import mmap
+import struct
+import zlib
 from pickle import loads
 from cStringIO import StringIO
 import sys
@@ -61,6 +64,14 @@ except ImportError:
     apks = [ ]
     game_apks = [ ]
 
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
 # Files on disk should be checked before archives. Otherwise, among
 # other things, using a new version of bytecode.rpyb will break.
 archives = [ ]
@@ -69,18 +80,398 @@ archives = [ ]
 # run.
 old_config_archives = None
 
-# A map from lower-case filename to regular-case filename.
+# A map from lower-case filename to regular-case filename, for files that
+# aren't in archives. Archives look up names without regard to case
+# themselves.
 lower_map = { }
 
+
+# The format of an entry in the index of an RPA-4.0 archive. The fields
+# are the offset and length of the utf-8 encoded name in the name table,
+# the offset of the data, the length of the data as stored, the length of
+# the data once decompressed, the md5 digest of the decompressed data, and
+# the compression method. Entries are sorted by lower-case name, and then
+# by name.
+RPA4_ENTRY = struct.Struct("<IIQQQ16sB7x")
+
+# The number of an entry in the table of script entries in an RPA-4.0
+# archive.
+RPA4_SCRIPT = struct.Struct("<I")
+
+# The extensions of compiled scripts, which the script loader looks for in
+# archives.
+SCRIPT_EXTENSIONS = (".rpyc", ".rpymc")
+
+# RPA-4.0 compression methods.
+RPA4_STORED = 0
+RPA4_ZLIB = 1
+RPA4_LZMA = 2
+
+
+def open_archive(prefix, fn=None):
+    """
+    Returns an Archive object for the archive with `prefix`. If `fn` is
+    given, it's the full path to the archive file.
+    """
+
+    if fn is None:
+        fn = transfn(prefix + ".rpa")
+
+    f = file(fn, "rb")
+    header = f.readline()
+    f.close()
+
+    if header.startswith("RPA-4.0 "):
+        return SortedArchive(prefix, fn, header)
+
+    return Archive(prefix, fn, header)
+
+
+class Archive(object):
+    """
+    An archive file. The index of the archive is read the first time it's
+    needed, and the archive is memory-mapped the first time a file is
+    loaded from it. The mapping is shared by every file loaded from the
+    archive, so loading an archived file doesn't need to open the archive
+    again.
+    """
+
+    def __init__(self, prefix, fn, header):
+        self.prefix = prefix
+
+        # The full path to the archive file.
+        self.fn = fn
+
+        # The first line of the archive, which identifies its version.
+        self.header = header
+
+        # The index, a map from filename to a list of entries.
+        self._index = None
+
+        # A map from lower-case filename to filename, created the first time
+        # a name isn't found in the index as given.
+        self._lower = None
+
+        # The memory map of the archive, or False if it couldn't be mapped.
+        self.mapped = None
+
+        self.lock = threading.RLock()
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self.lock:
+                if self._index is None:
+                    self._index = self.read_index()
+
+        return self._index
+
+    def read_index(self):
+        """
+        Reads in and returns the index of the archive.
+        """
+
+        l = self.header
+
+        # 3.0 Branch.
+        if l.startswith("RPA-3.0 "):
+            offset = int(l[8:24], 16)
+            key = int(l[25:33], 16)
+
+            f = file(self.fn, "rb")
+            f.seek(offset)
+            index = loads(f.read().decode("zlib"))
+            f.close()
+
+            # Deobfuscate the index.
+
+            for k in index.keys():
+
+                if len(index[k][0]) == 2:
+                    index[k] = [ (offset ^ key, dlen ^ key) for offset, dlen in index[k] ]
+                else:
+                    index[k] = [ (offset ^ key, dlen ^ key, start) for offset, dlen, start in index[k] ]
+
+            return index
+
+        # 2.0 Branch.
+        if l.startswith("RPA-2.0 "):
+            offset = int(l[8:], 16)
+
+            f = file(self.fn, "rb")
+            f.seek(offset)
+            index = loads(f.read().decode("zlib"))
+            f.close()
+
+            return index
+
+        # 1.0 Branch.
+        fn = transfn(self.prefix + ".rpi")
+        return loads(file(fn, "rb").read().decode("zlib"))
+
+    def names(self):
+        """
+        Returns an iterator over the names of the files in this archive.
+        """
+
+        return self.index.iterkeys()
+
+    def script_names(self):
+        """
+        Returns an iterator over the names of the compiled scripts in this
+        archive.
+        """
+
+        return (i for i in self.names() if i.endswith(SCRIPT_EXTENSIONS))
+
+    def find(self, name):
+        """
+        Returns the name of the file in this archive that matches `name`
+        without regard to case, or None if there is no such file. A file
+        that matches `name` exactly is preferred.
+        """
+
+        index = self.index
+
+        if name in index:
+            return name
+
+        if self._lower is None:
+            with self.lock:
+                if self._lower is None:
+                    self._lower = dict((i.lower(), i) for i in self.names())
+
+        return self._lower.get(name.lower(), None)
+
+    def __contains__(self, name):
+        return self.find(name) is not None
+
+    def map(self):
+        """
+        Returns a read-only memory map of the archive, or None if the
+        archive couldn't be mapped.
+        """
+
+        if self.mapped is None:
+            with self.lock:
+                if self.mapped is None:
+
+                    try:
+                        f = file(self.fn, "rb")
+
+                        try:
+                            self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                        finally:
+                            f.close()
+
+                    except:
+                        self.mapped = False
+
+        return self.mapped or None
+
+    def load(self, name):
+        """
+        Returns a file-like object giving the contents of the file `name`
+        in this archive.
+        """
+
+        entries = self.index[name]
+        data = self.map()
+
+        # Direct path.
+        if len(entries) == 1:
+
+            t = entries[0]
+            if len(t) == 2:
+                offset, dlen = t
+                start = ''
+            else:
+                offset, dlen, start = t
+
+            if data is not None:
+                return MappedSubFile(data, offset, dlen, start)
+
+            return SubFile(file(self.fn, "rb"), offset, dlen, start)
+
+        # Compatibility path.
+        if data is not None:
+            return StringIO(''.join(data[offset:offset + dlen] for offset, dlen in entries))
+
+        f = file(self.fn, "rb")
+
+        rv = [ ]
+
+        for offset, dlen in entries:
+            f.seek(offset)
+            rv.append(f.read(dlen))
+
+        f.close()
+
+        return StringIO(''.join(rv))
+
+
+class SortedIndex(object):
+    """
+    The index of an RPA-4.0 archive. This is a table of fixed-width entries
+    sorted by lower-case name, followed by a table giving the numbers of the
+    entries for compiled scripts, followed by a table of names. It's searched
+    in place, so nothing is read until a name is looked up.
+    """
+
+    def __init__(self, data, offset, count, scripts):
+        self.data = data
+        self.offset = offset
+        self.count = count
+
+        # The offset of the table of script entries.
+        self.scripts_offset = offset + count * RPA4_ENTRY.size
+        self.scripts = scripts
+
+        # The offset of the name table.
+        self.names_offset = self.scripts_offset + scripts * RPA4_SCRIPT.size
+
+    def entry(self, i):
+        return RPA4_ENTRY.unpack_from(self.data, self.offset + i * RPA4_ENTRY.size)
+
+    def name(self, entry):
+        start = self.names_offset + entry[0]
+        return self.data[start:start + entry[1]].decode("utf-8")
+
+    def find(self, name):
+        """
+        Returns a (name, entry) tuple for the entry that matches `name`
+        without regard to case, or None if there is no such entry. An entry
+        that matches `name` exactly is preferred.
+        """
+
+        if not isinstance(name, unicode):
+            name = name.decode("utf-8")
+
+        lower = name.lower()
+
+        # Find the first entry with a lower-case name that isn't less than
+        # lower.
+        lo = 0
+        hi = self.count
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+
+            if self.name(self.entry(mid)).lower() < lower:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        rv = None
+
+        # Entries that only differ in case are adjacent.
+        for i in xrange(lo, self.count):
+            entry = self.entry(i)
+            n = self.name(entry)
+
+            if n.lower() != lower:
+                break
+
+            if n == name:
+                return n, entry
+
+            if rv is None:
+                rv = n, entry
+
+        return rv
+
+    def iterkeys(self):
+        for i in xrange(self.count):
+            yield self.name(self.entry(i))
+
+    def iterscripts(self):
+        for i in xrange(self.scripts):
+            number, = RPA4_SCRIPT.unpack_from(self.data, self.scripts_offset + i * RPA4_SCRIPT.size)
+            yield self.name(self.entry(number))
+
+
+class SortedArchive(Archive):
+    """
+    An RPA-4.0 archive. Entries may be compressed with zlib or lzma, and
+    carry an md5 digest of their contents, which lets the archiver store
+    files with identical contents once.
+    """
+
+    def read_index(self):
+        l = self.header
+
+        offset = int(l[8:24], 16)
+        count = int(l[25:33], 16)
+        scripts = int(l[34:42], 16)
+
+        data = self.map()
+
+        if data is None:
+            f = file(self.fn, "rb")
+            f.seek(offset)
+            data = f.read()
+            f.close()
+
+            offset = 0
+
+        return SortedIndex(data, offset, count, scripts)
+
+    def script_names(self):
+        return self.index.iterscripts()
+
+    def find(self, name):
+
+        rv = self.index.find(name)
+
+        if rv is None:
+            return None
+
+        return rv[0]
+
+    def load(self, name):
+
+        _name, entry = self.index.find(name)
+        _name_offset, _name_length, offset, stored, length, _digest, method = entry
+
+        data = self.map()
+
+        if method == RPA4_STORED:
+
+            if data is not None:
+                return MappedSubFile(data, offset, length, '')
+
+            return SubFile(file(self.fn, "rb"), offset, length, '')
+
+        if data is not None:
+            raw = data[offset:offset + stored]
+        else:
+            f = file(self.fn, "rb")
+            f.seek(offset)
+            raw = f.read(stored)
+            f.close()
+
+        if method == RPA4_ZLIB:
+            return StringIO(zlib.decompress(raw))
+
+        if method == RPA4_LZMA:
+            if lzma is None:
+                raise Exception("Loading %r from %s requires lzma support." % (name, self.fn))
+
+            return StringIO(lzma.decompress(raw))
+
+        raise Exception("Unknown compression method %d for %r in %s." % (method, name, self.fn))
+
+
 def index_archives():
     """
-    Loads in the indexes for the archive files. Also updates the lower_map.
+    Opens the archive files. Also updates the lower_map. The indexes of the
+    archives are read the first time they're needed.
     """
 
     # Update lower_map.
     lower_map.clear()
 
-    for dir, fn in listdirfiles(): #@ReservedAssignment
+    for dir, fn in listdirfiles(archived=False): #@ReservedAssignment
         lower_map[fn.lower()] = fn
 
     # Index the archives.
@@ -96,50 +487,7 @@ def index_archives():
     archives = [ ]
 
     for prefix in renpy.config.archives:
-
-        try:
-            fn = transfn(prefix + ".rpa")
-            f = file(fn, "rb")
-            l = f.readline()
-
-            # 3.0 Branch.
-            if l.startswith("RPA-3.0 "):
-                offset = int(l[8:24], 16)
-                key = int(l[25:33], 16)
-                f.seek(offset)
-                index = loads(f.read().decode("zlib"))
-
-                # Deobfuscate the index.
-
-                for k in index.keys():
-
-                    if len(index[k][0]) == 2:
-                        index[k] = [ (offset ^ key, dlen ^ key) for offset, dlen in index[k] ]
-                    else:
-                        index[k] = [ (offset ^ key, dlen ^ key, start) for offset, dlen, start in index[k] ]
-
-                archives.append((prefix, index))
-
-                f.close()
-                continue
-
-            # 2.0 Branch.
-            if l.startswith("RPA-2.0 "):
-                offset = int(l[8:], 16)
-                f.seek(offset)
-                index = loads(f.read().decode("zlib"))
-                archives.append((prefix, index))
-                f.close()
-                continue
-
-            # 1.0 Branch.
-            f.close()
-
-            fn = transfn(prefix + ".rpi")
-            index = loads(file(fn, "rb").read().decode("zlib"))
-            archives.append((prefix, index))
-        except:
-            raise
+        archives.append(open_archive(prefix))
 
 def walkdir(dir): #@ReservedAssignment
     rv = [ ]
@@ -160,10 +508,16 @@ def walkdir(dir): #@ReservedAssignment
     return rv
 
 
-def listdirfiles(common=True):
+def listdirfiles(common=True, archived=True):
     """
     Returns a list of directory, file tuples known to the system. If
     the file is in an archive, the directory is None.
+
+    `archived`
+        If true, the files in archives are listed. If "scripts", only the
+        compiled scripts in archives are listed, which doesn't require
+        reading the full index of an RPA-4.0 archive. If false, files in
+        archives aren't listed.
     """
 
     rv = [ ]
@@ -198,8 +552,17 @@ def listdirfiles(common=True):
                 rv.append((i, j))
                 seen.add(j)
 
-    for _prefix, index in archives:
-        for j in index.iterkeys():
+    if not archived:
+        return rv
+
+    for archive in archives:
+
+        if archived == "scripts":
+            names = archive.script_names()
+        else:
+            names = archive.names()
+
+        for j in names:
             if j not in seen:
                 rv.append((None, j))
                 seen.add(j)
@@ -339,6 +702,146 @@ class SubFile(object):
         raise Exception("Write not supported by SubFile")
 
 
+class MappedSubFile(object):
+    """
+    A file-like object that reads a range of a memory-mapped archive.
+    Unlike SubFile, this doesn't own a file handle, so any number of these
+    can share a single mapping, and reads don't need to seek or make a
+    system call.
+    """
+
+    def __init__(self, data, base, length, start):
+        self.data = data
+        self.base = base
+        self.offset = 0
+        self.length = length
+        self.start = start
+        self.name = None
+
+    def getbuffer(self):
+        """
+        Returns the contents of this file, as a read-only buffer that shares
+        memory with the archive where possible.
+        """
+
+        if self.start:
+            return self.start + self.data[self.base:self.base + self.length - len(self.start)]
+
+        return buffer(self.data, self.base, self.length)
+
+    def read(self, length=None):
+
+        maxlength = self.length - self.offset
+
+        if length is not None and length >= 0:
+            length = min(length, maxlength)
+        else:
+            length = maxlength
+
+        pos = self.offset
+        self.offset += length
+
+        startlen = len(self.start)
+
+        if pos >= startlen:
+            base = self.base + pos - startlen
+            return self.data[base:base + length]
+
+        rv = self.start[pos:pos + length]
+        length -= len(rv)
+
+        if length:
+            rv += self.data[self.base:self.base + length]
+
+        return rv
+
+    def readline(self, length=None):
+
+        maxlength = self.length - self.offset
+
+        if length is not None and length >= 0:
+            length = min(length, maxlength)
+        else:
+            length = maxlength
+
+        pos = self.offset
+        startlen = len(self.start)
+
+        if pos < startlen:
+            end = self.start.find('\n', pos, pos + length)
+
+            if end != -1:
+                return self.read(end + 1 - pos)
+
+            if pos + length <= startlen:
+                return self.read(length)
+
+            end = self.data.find('\n', self.base, self.base + pos + length - startlen)
+
+        else:
+            base = self.base + pos - startlen
+            end = self.data.find('\n', base, base + length)
+
+        if end == -1:
+            return self.read(length)
+
+        return self.read(end - self.base + startlen + 1 - pos)
+
+    def readlines(self, length=None):
+        rv = [ ]
+
+        while True:
+            l = self.readline(length)
+
+            if not l:
+                break
+
+            if length is not None:
+                length -= len(l)
+                if length <= 0:
+                    rv.append(l)
+                    break
+
+            rv.append(l)
+
+        return rv
+
+    def xreadlines(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def next(self): #@ReservedAssignment
+        rv = self.readline()
+
+        if not rv:
+            raise StopIteration()
+
+        return rv
+
+    def flush(self):
+        return
+
+    def seek(self, offset, whence=0):
+
+        if whence == 1:
+            offset = self.offset + offset
+        elif whence == 2:
+            offset = self.length + offset
+
+        self.offset = max(0, min(offset, self.length))
+
+    def tell(self):
+        return self.offset
+
+    def close(self):
+        self.data = None
+
+    def write(self, s):
+        raise Exception("Write not supported by MappedSubFile")
+
+
 def load_core(name):
     """
     Returns an open python file object of the given type.
@@ -369,36 +872,11 @@ def load_core(name):
             pass
 
     # Look for it in archive files.
-    for prefix, index in archives:
-        if not name in index:
-            continue
-
-        f = file(transfn(prefix + ".rpa"), "rb")
+    for archive in archives:
+        archived = archive.find(name)
 
-        data = [ ]
-
-        # Direct path.
-        if len(index[name]) == 1:
-
-            t = index[name][0]
-            if len(t) == 2:
-                offset, dlen = t
-                start = ''
-            else:
-                offset, dlen, start = t
-
-            rv = SubFile(f, offset, dlen, start)
-
-        # Compatibility path.
-        else:
-            for offset, dlen in index[name]:
-                f.seek(offset)
-                data.append(f.read(dlen))
-
-            rv = StringIO(''.join(data))
-            f.close()
-
-        return rv
+        if archived is not None:
+            return archive.load(archived)
 
     return None
 
@@ -455,8 +933,8 @@ def loadable_core(name):
     except:
         pass
 
-    for _prefix, index in archives:
-        if name in index:
+    for archive in archives:
+        if name in archive:
             loadable_cache[name] = True
             return True
 
@@ -355,6 +355,11 @@ def main():
                     restart = (renpy.config.end_game_transition, "_invoke_main_menu", "_main_menu")
                     renpy.persistent.update(True)
 
+                # A playthrough ends when the game does, rather than
+                # returning to the main menu.
+                if renpy.playthrough.enabled:
+                    break
+
             except game.FullRestartException, e:
                 restart = e.reason
 
@@ -368,6 +373,7 @@ def main():
 
     finally:
 
+        renpy.playthrough.finish()
         renpy.loader.auto_quit()
         renpy.savelocation.quit()
         renpy.translation.write_updated_strings()
@@ -22,12 +22,91 @@
 import os
 import copy
 import time
+import struct
+import zlib
 
 import renpy
 
 from renpy.loadsave import dump, loads
 from cPickle import dumps
 
+class TrackedDict(dict):
+    """
+    A dict that records the keys that have been changed, so the changes
+    to large persistent fields like _seen_ever can be found without
+    comparing the whole dict against a copy.
+    """
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+
+        # The set of keys that have been added, changed, or removed since
+        # the changes were last taken.
+        self.changed_keys = set()
+
+        # True if the dict has been cleared since the changes were last
+        # taken.
+        self.cleared = False
+
+    # This pickles as a plain dict, so persistent files stay readable by
+    # older versions of Ren'Py. Persistent._update converts it back.
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self.changed_keys.add(key)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self.changed_keys.add(key)
+
+    def clear(self):
+        dict.clear(self)
+        self.changed_keys.clear()
+        self.cleared = True
+
+    def pop(self, key, *args):
+        if key in self:
+            self.changed_keys.add(key)
+
+        return dict.pop(self, key, *args)
+
+    def popitem(self):
+        rv = dict.popitem(self)
+        self.changed_keys.add(rv[0])
+        return rv
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self.changed_keys.add(key)
+
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        other = dict(*args, **kwargs)
+        dict.update(self, other)
+        self.changed_keys.update(other)
+
+    def take_changes(self):
+        """
+        Returns a (cleared, keys) tuple, giving whether the dict was
+        cleared, and the set of keys that changed, since this was last
+        called.
+        """
+
+        rv = (self.cleared, self.changed_keys)
+
+        self.cleared = False
+        self.changed_keys = set()
+
+        return rv
+
+
+# The fields of the persistent object that are stored in TrackedDicts.
+tracked_fields = [ "_seen_ever", "_seen_images", "_chosen", "_seen_audio" ]
+
+
 # The class that's used to hold the persistent data.
 class Persistent(object):
 
@@ -96,6 +175,14 @@ class Persistent(object):
         if self._changed is None:
             self._changed = { }
 
+        # Track the changes to the large dicts, rather than comparing them
+        # against a backup.
+        for i in tracked_fields:
+            value = getattr(self, i)
+
+            if not isinstance(value, TrackedDict):
+                setattr(self, i, TrackedDict(value))
+
 
 
 renpy.game.Persistent = Persistent
@@ -124,14 +211,31 @@ def safe_deepcopy(o):
 
 
 # A map from field names to a backup of the field names in the persistent
-# object.
+# object. For a field holding a TrackedDict, the backup is the TrackedDict
+# itself, as its changes are tracked rather than found by comparison.
 backup = { }
 
+# A map from the name of a field that has changed since the persistent data
+# was last saved to the set of keys in that field that changed, or to None
+# if the whole field has changed.
+changes = { }
+
+def make_backup(value):
+    """
+    Returns the backup of `value`.
+    """
+
+    if isinstance(value, TrackedDict):
+        value.take_changes()
+        return value
+
+    return safe_deepcopy(value)
+
 def find_changes():
     """
     This finds changes in the persistent object. When it finds a change, it
-    backs up that changed, and puts the current time for that field into
-    persistent._changed.
+    backs up that changed, puts the current time for that field into
+    persistent._changed, and records the change in `changes`.
 
     This returns True if there was at least one change, and False
     otherwise.
@@ -154,10 +258,28 @@ def find_changes():
         old = backup.get(f, None)
         new = pvars.get(f, None)
 
-        if not (new == old):
+        if (old is new) and isinstance(new, TrackedDict):
+
+            cleared, keys = new.take_changes()
+
+            if cleared:
+                changes[f] = None
+            elif keys:
+                if f not in changes:
+                    changes[f] = keys
+                elif changes[f] is not None:
+                    changes[f] |= keys
+            else:
+                continue
 
             persistent._changed[f] = now
-            backup[f] = safe_deepcopy(new)
+            rv = True
+
+        elif not (new == old):
+
+            persistent._changed[f] = now
+            backup[f] = make_backup(new)
+            changes[f] = None
 
             rv = True
 
@@ -174,17 +296,151 @@ def load(filename):
     # Unserialize the persistent data.
     try:
         f = file(filename, "rb")
-        s = f.read().decode("zlib")
+        data = f.read()
         f.close()
-        persistent = loads(s)
+        persistent = loads(data.decode("zlib"))
     except:
         return None
 
+    # Apply the changes in the journal.
+    try:
+        for records in read_journal(filename + ".journal", data):
+            apply_journal(persistent, records)
+    except:
+        pass
+
     persistent._update()
 
     return persistent
 
 
+################################################################################
+# Journal
+################################################################################
+
+# The journal is a file that is kept next to the persistent file, and that
+# changes to the persistent data are appended to, so that saving doesn't
+# require the whole persistent object to be written out. It consists of a
+# header line identifying the persistent file the journal applies to,
+# followed by entries. Each entry is a 4-byte length followed by a
+# compressed, pickled list of records.
+
+JOURNAL_MAGIC = "RENPY JOURNAL 1"
+
+def journal_header(data):
+    """
+    Returns the header of a journal that applies to a persistent file
+    containing `data`.
+    """
+
+    return "%s %08x %d\n" % (JOURNAL_MAGIC, zlib.crc32(data) & 0xffffffff, len(data))
+
+def journal_entry(records):
+    """
+    Returns the journal entry containing `records`.
+    """
+
+    data = dumps(records, 2).encode("zlib")
+    return struct.pack("<I", len(data)) + data
+
+def read_journal(filename, data):
+    """
+    Reads the journal in `filename`, which should apply to the persistent
+    file containing `data`. Yields a list of records for each entry in the
+    journal. If the journal doesn't exist or doesn't apply to `data`,
+    nothing is yielded.
+    """
+
+    try:
+        f = file(filename, "rb")
+    except:
+        return
+
+    with f:
+
+        if f.readline() != journal_header(data):
+            return
+
+        while True:
+            length = f.read(4)
+
+            # Stop at the end of the file, or at an entry that was only
+            # partially written.
+            if len(length) < 4:
+                return
+
+            length = struct.unpack("<I", length)[0]
+            entry = f.read(length)
+
+            if len(entry) < length:
+                return
+
+            yield loads(entry.decode("zlib"))
+
+def journal_records():
+    """
+    Returns a list of records that make the changes in `changes`.
+    """
+
+    persistent = renpy.game.persistent
+    pvars = vars(persistent)
+
+    rv = [ ]
+
+    for f, keys in changes.iteritems():
+
+        if f not in pvars:
+            rv.append(("remove", f))
+
+        elif keys is None:
+            rv.append(("field", f, pvars[f]))
+
+        else:
+            value = pvars[f]
+
+            for k in keys:
+                if k in value:
+                    rv.append(("set", f, k, value[k]))
+                else:
+                    rv.append(("del", f, k))
+
+        rv.append(("changed", f, persistent._changed.get(f, 0)))
+
+    return rv
+
+def apply_journal(persistent, records):
+    """
+    Applies the journal `records` to `persistent`.
+    """
+
+    pvars = vars(persistent)
+
+    for r in records:
+        kind = r[0]
+
+        if kind == "field":
+            pvars[r[1]] = r[2]
+
+        elif kind == "remove":
+            pvars.pop(r[1], None)
+
+        elif kind == "set":
+            if pvars.get(r[1], None) is None:
+                pvars[r[1]] = { }
+
+            pvars[r[1]][r[2]] = r[3]
+
+        elif kind == "del":
+            if pvars.get(r[1], None) is not None:
+                pvars[r[1]].pop(r[2], None)
+
+        elif kind == "changed":
+            if persistent._changed is None:
+                persistent._changed = { }
+
+            persistent._changed[r[1]] = r[2]
+
+
 def init():
     """
     Loads the persistent data from disk.
@@ -203,7 +459,7 @@ def init():
     v = vars(persistent)
 
     for k, v in vars(persistent).iteritems():
-        backup[k] = safe_deepcopy(v)
+        backup[k] = make_backup(v)
 
     return persistent
 
@@ -295,9 +551,12 @@ def merge(other):
 
         val = merge_func(old, new, pval)
         pvars[f] = val
-        backup[f] = safe_deepcopy(val)
+        backup[f] = make_backup(val)
         persistent._changed[f] = t
 
+        # Journal the merged field, so it reaches our own save location.
+        changes[f] = None
+
 # The mtime of the most recently processed savefile.
 persistent_mtime = None
 
@@ -354,14 +613,35 @@ def update(force_save=False):
         save()
 
 
+def dump_persistent():
+    """
+    Returns the persistent data, pickled but not compressed.
+    """
+
+    return dumps(renpy.game.persistent)
+
+
 def save():
     """
-    Saves the persistent data to disk.
+    Saves the persistent data to disk. If journaling is enabled, only the
+    changes since the last save are written.
     """
 
     try:
-        data = dumps(renpy.game.persistent).encode("zlib")
-        renpy.loadsave.location.save_persistent(data)
+        if renpy.config.persistent_journal_size is not None:
+            records = journal_records()
+
+            if records:
+                entry = journal_entry(records)
+            else:
+                entry = None
+
+            renpy.loadsave.location.journal_persistent(entry, dump_persistent)
+        else:
+            data = dump_persistent().encode("zlib")
+            renpy.loadsave.location.save_persistent(data)
+
+        changes.clear()
     except:
         if renpy.config.developer:
             raise
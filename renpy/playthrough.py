@@ -0,0 +1,254 @@
+# Copyright 2004-2014 Tom Rothamel <pytom@bishoujo.us>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# This code implements the playthrough command, which runs the game without
+# user input, and reports the time spent in each statement.
+
+import renpy
+import os
+import random
+import time
+
+# True if a playthrough is running.
+enabled = False
+
+# A map from (filename, linenumber, statement type) to a list giving the
+# number of times the statement was executed, and the time spent executing
+# it, in interactions, rendering, and prediction. (Rendering and prediction
+# happen during interactions, so they're included in the interaction time.)
+timings = { }
+
+# A stack of [ timing, start time, time to exclude ] lists, for the
+# statements being executed. A statement can run other statements, for
+# example by calling a label in a new context.
+stack = [ ]
+
+# The timing used for time spent outside of any statement.
+outside = [ 0, 0.0, 0.0, 0.0, 0.0 ]
+
+# The number of statements that have been executed, and the maximum number
+# that may be, or None for no limit.
+statements = 0
+max_statements = None
+
+# How menu choices are made, and the number of menus seen so far.
+choice_mode = "first"
+menus = 0
+choice_random = random.Random()
+
+# The longest an interaction may take, in seconds, before it's ended.
+interact_timeout = 1.0
+
+# The file the report is written to, or None to print it.
+output = None
+
+# The time the playthrough started.
+start_time = 0
+
+# The index of each field in a timing.
+COUNT = 0
+EXECUTE = 1
+INTERACT = 2
+RENDER = 3
+PREDICT = 4
+
+def begin(node):
+    """
+    Called before `node` is executed.
+    """
+
+    global statements
+
+    statements += 1
+
+    if max_statements is not None and statements > max_statements:
+        raise renpy.game.QuitException()
+
+    key = (node.filename, node.linenumber, type(node).__name__)
+
+    timing = timings.get(key, None)
+
+    if timing is None:
+        timing = timings[key] = [ 0, 0.0, 0.0, 0.0, 0.0 ]
+
+    timing[COUNT] += 1
+
+    stack.append([ timing, time.time(), 0.0 ])
+
+def end():
+    """
+    Called after a node has been executed, even if it raised an exception.
+    """
+
+    timing, start, excluded = stack.pop()
+
+    elapsed = time.time() - start
+    timing[EXECUTE] += elapsed - excluded
+
+    if stack:
+        stack[-1][2] += elapsed
+
+def add(field, seconds):
+    """
+    Adds `seconds` to `field` of the timing of the statement that is being
+    executed.
+    """
+
+    if not stack:
+        outside[field] += seconds
+        return
+
+    stack[-1][0][field] += seconds
+
+    if field == INTERACT:
+        stack[-1][2] += seconds
+
+def choose(choices):
+    """
+    Returns the choice that's made at a menu, from the list of values in
+    `choices`.
+    """
+
+    global menus
+
+    menus += 1
+
+    if choice_mode == "random":
+        return choice_random.choice(choices)
+    elif choice_mode == "cycle":
+        return choices[(menus - 1) % len(choices)]
+    else:
+        return choices[0]
+
+def start_interact():
+    """
+    Called at the start of each interaction, to keep skipping enabled and to
+    make sure the interaction ends.
+    """
+
+    renpy.config.skipping = "slow"
+    renpy.ui.pausebehavior(interact_timeout, True)
+
+def command():
+    """
+    The playthrough command.
+    """
+
+    global enabled
+    global max_statements
+    global choice_mode
+    global output
+    global interact_timeout
+    global start_time
+
+    ap = renpy.arguments.ArgumentParser(description="Plays through the game without user input, and reports the time spent in each statement.")
+    ap.add_argument("--output", default=None, help="The file the report is written to. If not given, the report is printed.")
+    ap.add_argument("--choice", default="first", choices=[ "first", "cycle", "random" ], help="How menu choices are made: the first choice, the next choice each menu, or a random choice.")
+    ap.add_argument("--seed", type=int, default=0, help="The random seed used for random choices.")
+    ap.add_argument("--statements", type=int, default=None, help="The maximum number of statements to run.")
+    ap.add_argument("--timeout", type=float, default=1.0, help="The number of seconds after which an interaction that doesn't end on its own is ended.")
+    args = ap.parse_args()
+
+    output = args.output
+    choice_mode = args.choice
+    choice_random.seed(args.seed)
+    max_statements = args.statements
+    interact_timeout = args.timeout
+
+    os.environ["RENPY_SKIP_SPLASHSCREEN"] = "1"
+    os.environ["RENPY_SKIP_MAIN_MENU"] = "1"
+
+    # Say statements are skipped as soon as they are shown, and menus are
+    # chosen automatically.
+    renpy.config.skip_delay = 0
+    renpy.config.auto_choice_delay = 0.001
+    renpy.config.start_interact_callbacks.append(start_interact)
+
+    enabled = True
+    start_time = time.time()
+
+    return True
+
+def report_lines(rows, key_name):
+    """
+    Formats a sorted list of (key, timing) pairs as lines of a table.
+    """
+
+    rv = [ "%-40s %8s %10s %10s %10s %10s" % (key_name, "count", "execute", "interact", "render", "predict") ]
+
+    for key, t in rows:
+        rv.append("%-40s %8d %10.4f %10.4f %10.4f %10.4f" % (key, t[COUNT], t[EXECUTE], t[INTERACT], t[RENDER], t[PREDICT]))
+
+    return rv
+
+def finish():
+    """
+    Called when Ren'Py is about to quit. Writes the report, if a playthrough
+    was running.
+    """
+
+    global enabled
+
+    if not enabled:
+        return
+
+    enabled = False
+
+    elapsed = time.time() - start_time
+
+    def total(t):
+        return t[EXECUTE] + t[INTERACT]
+
+    # The timings of each statement.
+    nodes = [ ("%s:%d %s" % k, v) for k, v in timings.iteritems() ]
+    nodes.sort(key=lambda i : total(i[1]), reverse=True)
+
+    # The timings of each file.
+    files = { }
+
+    for (filename, _line, _kind), t in timings.iteritems():
+        ft = files.get(filename, None)
+
+        if ft is None:
+            ft = files[filename] = [ 0, 0.0, 0.0, 0.0, 0.0 ]
+
+        for i in range(len(t)):
+            ft[i] += t[i]
+
+    files = files.items()
+    files.sort(key=lambda i : total(i[1]), reverse=True)
+
+    lines = [ ]
+
+    lines.append("Played through %d statements and %d menus in %.2f seconds." % (statements, menus, elapsed))
+    lines.append("Outside of statements: %.4f seconds interacting, %.4f rendering, %.4f predicting." % (outside[INTERACT], outside[RENDER], outside[PREDICT]))
+    lines.append("")
+    lines.extend(report_lines(files, "File"))
+    lines.append("")
+    lines.extend(report_lines(nodes, "Statement"))
+
+    if output is not None:
+        with open(output, "w") as f:
+            for l in lines:
+                f.write(l + "\n")
+    else:
+        for l in lines:
+            print l
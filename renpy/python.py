@@ -32,6 +32,7 @@ import weakref
 import re
 import sets
 import sys
+import types
 
 import renpy.audio
 
@@ -245,63 +246,142 @@ class NoRollback(object):
     pass
 
 
-# parents = [ ]
+# Flags that tell reached how to look inside an object of a given type.
+
+# The object can't contain other objects, and isn't recorded.
+REACHED_IGNORE = 1
+
+# The object inherits from NoRollback.
+REACHED_NOROLLBACK = 2
+
+# Look at the values of the object's fields.
+REACHED_VARS = 4
+
+# Look at the objects the object iterates over.
+REACHED_ITER = 8
+
+# Look at the values of the object, treated as a dict.
+REACHED_VALUES = 16
+
+# Try each of the above, for old-style instances.
+REACHED_GENERIC = 32
+
+# Types that can't contain other objects.
+REACHED_ATOMIC_TYPES = set([
+    type(None),
+    bool,
+    int,
+    long,
+    float,
+    complex,
+    str,
+    unicode,
+    ])
+
+# A map from type to the flags used when an object of that type is reached.
+reached_types = { }
+
+def reached_type(t):
+    """
+    Computes and caches the REACHED_ flags for objects of type `t`.
+    """
+
+    if t in REACHED_ATOMIC_TYPES:
+        rv = REACHED_IGNORE
+
+    elif t is types.InstanceType:
+        rv = REACHED_GENERIC
+
+    elif issubclass(t, NoRollback):
+        rv = REACHED_NOROLLBACK
+
+    # Since the store module is the roots, there's no need to
+    # look into it.
+    elif issubclass(t, StoreModule):
+        rv = 0
+
+    else:
+        rv = 0
+
+        if t.__dictoffset__:
+            rv |= REACHED_VARS
+
+        if hasattr(t, "__iter__") and not issubclass(t, basestring):
+            rv |= REACHED_ITER
+
+        if hasattr(t, "itervalues"):
+            rv |= REACHED_VALUES
+
+    reached_types[t] = rv
+    return rv
 
 def reached(obj, reachable, wait):
     """
     @param obj: The object that was reached.
-    @param path: The path from the store via which it was reached.
 
     `reachable`
         A map from id(obj) to int. The int is 1 if the object was reached
         normally, and 0 if it was reached, but inherits from NoRollback.
+        (Objects of types that can't contain other objects, like numbers
+        and strings, are not recorded.)
 
+    This walks the objects reachable from `obj` using an explicit stack,
+    so deeply nested data can't exceed the recursion limit.
     """
 
-    if wait:
-        wait()
+    stack = [ obj ]
+    pop = stack.pop
+    extend = stack.extend
 
-    idobj = id(obj)
+    while stack:
 
-    if idobj in reachable:
-        return
+        if wait:
+            wait()
 
-    if isinstance(obj, NoRollback):
-        reachable[idobj] = 0
-        return
+        obj = pop()
+        idobj = id(obj)
 
-    reachable[idobj] = 1
+        if idobj in reachable:
+            continue
 
-    # Since the store module is the roots, there's no need to
-    # look into it.
-    if isinstance(obj, StoreModule):
-        return
+        t = type(obj)
 
-    # parents.append(obj)
+        flags = reached_types.get(t, None)
+        if flags is None:
+            flags = reached_type(t)
 
-    try:
-        # Treat as fields, indexed by strings.
-        for v in vars(obj).itervalues():
-            reached(v, reachable, wait)
-    except:
-        pass
+        if flags & REACHED_IGNORE:
+            continue
 
-    try:
-        # Treat as iterable
-        if not isinstance(obj, basestring):
-            for v in obj.__iter__():
-                reached(v, reachable, wait)
-    except:
-        pass
+        if flags & REACHED_NOROLLBACK:
+            reachable[idobj] = 0
+            continue
 
-    try:
-        # Treat as dict.
-        for v in obj.itervalues():
-            reached(v, reachable, wait)
-    except:
-        pass
+        reachable[idobj] = 1
+
+        if flags & REACHED_GENERIC:
+            flags = REACHED_VARS | REACHED_ITER | REACHED_VALUES
+
+        try:
+            # Treat as fields, indexed by strings.
+            if flags & REACHED_VARS:
+                extend(vars(obj).itervalues())
+        except:
+            pass
+
+        try:
+            # Treat as iterable
+            if flags & REACHED_ITER:
+                extend(obj.__iter__())
+        except:
+            pass
 
-    # parents.pop()
+        try:
+            # Treat as dict.
+            if flags & REACHED_VALUES:
+                extend(obj.itervalues())
+        except:
+            pass
 
 def reached_vars(store, reachable, wait):
     """
@@ -525,6 +605,7 @@ class RevertableList(list):
     __delitem__ = mutator(list.__delitem__)
     __delslice__ = mutator(list.__delslice__)
     __setitem__ = mutator(list.__setitem__)
+    __setslice__ = mutator(list.__setslice__)
     __iadd__ = mutator(list.__iadd__)
     __imul__ = mutator(list.__imul__)
     append = mutator(list.append)
@@ -554,6 +635,9 @@ class RevertableList(list):
     def rollback(self, old):
         self[:] = old
 
+    def get_rollback_delta(self, old):
+        return ListDelta(old, self)
+
 def revertable_range(*args):
     return RevertableList(range(*args))
 
@@ -576,6 +660,7 @@ class RevertableDict(dict):
     pop = mutator(dict.pop)
     popitem = mutator(dict.popitem)
     setdefault = mutator(dict.setdefault)
+    update = mutator(dict.update)
 
     def list_wrapper(method): # E0213 @NoSelf
         def newmethod(*args, **kwargs):
@@ -603,6 +688,9 @@ class RevertableDict(dict):
         for k, v in old:
             self[k] = v
 
+    def get_rollback_delta(self, old):
+        return DictDelta(old, self)
+
 class RevertableSet(sets.Set):
 
     def __init__(self, *args):
@@ -659,6 +747,9 @@ class RevertableSet(sets.Set):
         sets.Set.clear(self)
         sets.Set.update(self, old)
 
+    def get_rollback_delta(self, old):
+        return SetDelta(old, self)
+
 
 class RevertableObject(object):
 
@@ -688,6 +779,194 @@ class RevertableObject(object):
         self.__dict__.update(old)
 
 
+##### Compact representations of the rollback information for revertable
+##### objects, used when config.rollback_deltas is true.
+
+def rollback_size(roll):
+    """
+    Returns the approximate number of bytes used by `roll`, the rollback
+    information for an object. Objects referred to by `roll` are not
+    counted, as they're shared with the object itself.
+    """
+
+    if isinstance(roll, RollbackDelta):
+        return roll.get_size()
+
+    rv = sys.getsizeof(roll)
+
+    if isinstance(roll, list):
+        for i in roll:
+            if type(i) is tuple:
+                rv += sys.getsizeof(i)
+
+    return rv
+
+class RollbackDelta(object):
+    """
+    The base class for objects that record how to rebuild the state an
+    object had at the start of a rollback step from the state it has at
+    the end of that step. This is stored in place of the full rollback
+    information when it's smaller.
+    """
+
+    # The size of the full rollback information this replaces.
+    full_size = 0
+
+    def rebuild(self, new):
+        """
+        Given `new`, the object or its state at the end of the step,
+        returns the rollback information for the start of the step, in
+        the form get_rollback would have returned it.
+        """
+
+        raise Exception("Not implemented.")
+
+    def get_size(self):
+        """
+        Returns the approximate number of bytes used by this delta.
+        """
+
+        rv = sys.getsizeof(self) + sys.getsizeof(self.__dict__)
+
+        for v in self.__dict__.itervalues():
+            if isinstance(v, (list, dict)):
+                rv += sys.getsizeof(v)
+
+        return rv
+
+class ListDelta(RollbackDelta):
+    """
+    The change to a list, stored as the slice that was replaced.
+    """
+
+    def __init__(self, old, new):
+
+        oldlen = len(old)
+        newlen = len(new)
+
+        start = 0
+        limit = min(oldlen, newlen)
+
+        while start < limit and old[start] is new[start]:
+            start += 1
+
+        end = 0
+        limit -= start
+
+        while end < limit and old[oldlen - end - 1] is new[newlen - end - 1]:
+            end += 1
+
+        # The slice [start:end] of the new list is replaced with middle.
+        self.start = start
+        self.end = newlen - end
+        self.middle = old[start:oldlen - end]
+
+    def rebuild(self, new):
+        rv = list(new)
+        rv[self.start:self.end] = self.middle
+        return rv
+
+class DictDelta(RollbackDelta):
+    """
+    The change to a dict, stored as the old values of the keys that were
+    changed or removed, and the keys that were added.
+    """
+
+    def __init__(self, old, new):
+
+        old = dict(old)
+
+        self.changed = dict((k, v) for k, v in old.iteritems() if (k not in new) or (new[k] is not v))
+        self.added = [ k for k in new if k not in old ]
+
+    def rebuild(self, new):
+        rv = dict(new)
+
+        for k in self.added:
+            del rv[k]
+
+        rv.update(self.changed)
+
+        return rv.items()
+
+class SetDelta(RollbackDelta):
+    """
+    The change to a set, stored as the items that were removed and the
+    items that were added.
+    """
+
+    def __init__(self, old, new):
+
+        old = set(old)
+
+        self.removed = [ i for i in old if i not in new ]
+        self.added = [ i for i in new if i not in old ]
+
+    def rebuild(self, new):
+        rv = set(new)
+        rv.difference_update(self.added)
+        rv.update(self.removed)
+        return list(rv)
+
+class ChainDelta(RollbackDelta):
+    """
+    A delta that applies the rollback information for several steps in
+    turn. This is created when purge_unreachable removes the rollback
+    information for an object from newer steps, but it's still needed by
+    an older step.
+    """
+
+    def __init__(self, chain):
+
+        # A list of rollback information, from newest to oldest.
+        self.chain = chain
+
+    def rebuild(self, new):
+        for i in self.chain:
+            if isinstance(i, RollbackDelta):
+                new = i.rebuild(new)
+            else:
+                new = i
+
+        return new
+
+    def get_size(self):
+        return sys.getsizeof(self) + sum(rollback_size(i) for i in self.chain)
+
+def make_delta(obj, roll):
+    """
+    Returns a delta that rebuilds `roll`, the rollback information for
+    `obj`, from the current state of `obj`, if one can be made and is
+    smaller than `roll`. Otherwise, returns `roll`.
+    """
+
+    get_rollback_delta = getattr(obj, "get_rollback_delta", None)
+    if get_rollback_delta is None:
+        return roll
+
+    delta = get_rollback_delta(roll)
+    delta.full_size = rollback_size(roll)
+
+    if delta.get_size() >= delta.full_size:
+        return roll
+
+    return delta
+
+def chain_rollback(chain, roll):
+    """
+    Returns rollback information that applies `chain`, a list of rollback
+    information from newer steps, before `roll`.
+    """
+
+    if not isinstance(roll, RollbackDelta):
+        return roll
+
+    rv = ChainDelta(chain + [ roll ])
+    rv.full_size = roll.full_size
+
+    return rv
+
+
 ##### An object that handles deterministic randomness, or something.
 
 class DetRandom(random.Random):
@@ -794,17 +1073,25 @@ class Rollback(renpy.object.Object):
             self.retain_after_load = False
 
 
-    def purge_unreachable(self, reachable, wait):
+    def purge_unreachable(self, reachable, wait, pending):
         """
         Adds objects that are reachable from the store of this
         rollback to the set of reachable objects, and purges
         information that is stored about totally unreachable objects.
 
+        `pending`
+            A map from the id of an object to an (object, chain) tuple,
+            where chain is a list of rollback information purged from
+            newer rollbacks. When this rollback keeps information about
+            the object, the chain is applied before it. When this rollback
+            purges information, it's added to the chain.
+
         Returns True if this is the first time this method has been
         called, or False if it has already been called once before.
         """
 
         if self.purged:
+            self.take_pending(pending)
             return False
 
         self.purged = True
@@ -830,18 +1117,40 @@ class Rollback(renpy.object.Object):
 
         for o, rb in self.objects:
             if reachable.get(id(o), 0):
+
+                if id(o) in pending:
+                    rb = chain_rollback(pending.pop(id(o))[1], rb)
+
                 new_objects.append((o, rb))
                 reached(rb, reachable, wait)
             else:
                 if renpy.config.debug:
                     print "Removing unreachable:", o
 
-                    pass
+                # An older rollback may still need this information, if it
+                # only stores a delta.
+                if isinstance(rb, RollbackDelta):
+                    pending.setdefault(id(o), (o, [ ]))[1].append(rb)
+                else:
+                    pending[id(o)] = (o, [ rb ])
 
         self.objects = new_objects
 
         return True
 
+    def take_pending(self, pending):
+        """
+        Applies the chains in `pending` to the information about the
+        objects this rollback keeps. (See purge_unreachable.)
+        """
+
+        if not pending:
+            return
+
+        for i, (o, rb) in enumerate(self.objects):
+            if id(o) in pending:
+                self.objects[i] = (o, chain_rollback(pending.pop(id(o))[1], rb))
+
 
     def rollback(self):
         """
@@ -851,6 +1160,10 @@ class Rollback(renpy.object.Object):
 
         for obj, roll in reversed(self.objects):
             if roll is not None:
+
+                if isinstance(roll, RollbackDelta):
+                    roll = roll.rebuild(obj)
+
                 obj.rollback(roll)
 
         for name, changes in self.stores.iteritems():
@@ -1007,6 +1320,8 @@ class RollbackLog(renpy.object.Object):
         # Update the list of mutated objects and what we need to do to
         # restore them.
 
+        deltas = renpy.config.rollback_deltas
+
         for _i in xrange(4):
 
             self.current.objects = [ ]
@@ -1023,6 +1338,9 @@ class RollbackLog(renpy.object.Object):
                     if obj is None:
                         continue
 
+                    if deltas:
+                        roll = make_delta(obj, roll)
+
                     self.current.objects.append((obj, roll))
 
                 break
@@ -1034,6 +1352,36 @@ class RollbackLog(renpy.object.Object):
 
 
 
+    def get_stats(self):
+        """
+        Returns a dictionary giving the amount of memory used by the
+        rollback information for objects. (See renpy.get_rollback_stats.)
+        """
+
+        rv = {
+            "entries" : len(self.log),
+            "objects" : 0,
+            "deltas" : 0,
+            "size" : 0,
+            "full_size" : 0,
+            }
+
+        for i in self.log:
+            for _o, roll in i.objects:
+
+                size = rollback_size(roll)
+
+                rv["objects"] += 1
+                rv["size"] += size
+
+                if isinstance(roll, RollbackDelta):
+                    rv["deltas"] += 1
+                    rv["full_size"] += roll.full_size
+                else:
+                    rv["full_size"] += size
+
+        return rv
+
     def get_roots(self):
         """
         Return a map giving the current roots of the store. This is a
@@ -1069,10 +1417,22 @@ class RollbackLog(renpy.object.Object):
         revlog = self.log[:]
         revlog.reverse()
 
+        # Rollback information purged from newer rollbacks, that older
+        # rollbacks may need.
+        pending = { }
+
         for i in revlog:
-            if not i.purge_unreachable(reachable, wait):
+            if not i.purge_unreachable(reachable, wait, pending):
                 break
 
+        # Older rollbacks have already been purged, but may still need
+        # information that was purged now.
+        for i in revlog:
+            if not pending:
+                break
+
+            i.take_pending(pending)
+
     def in_rollback(self):
         if self.forward:
             return True
@@ -27,6 +27,7 @@
 import os
 import zipfile
 import json
+import traceback
 
 import renpy.display
 import threading
@@ -74,6 +75,22 @@ class FileLocation(object):
         # The data loaded from the persistent file.
         self.persistent_data = None
 
+        # The journal of changes to the persistent file.
+        self.persistent_journal = self.persistent + ".journal"
+
+        # The header of the journal that applies to the persistent file we
+        # last wrote, and the mtime of that file. These are None until we
+        # write the persistent file, as changes can only be appended to
+        # the journal of a file we know the contents of.
+        self.persistent_header = None
+        self.persistent_written_mtime = None
+
+        # Incremented each time the persistent file is written.
+        self.persistent_generation = 0
+
+        # The thread that is compacting the journal, if one is running.
+        self.compact_thread = None
+
 
     def filename(self, slotname):
         """
@@ -123,6 +140,9 @@ class FileLocation(object):
             if os.path.exists(self.persistent):
                 mtime = os.path.getmtime(self.persistent)
 
+                if os.path.exists(self.persistent_journal):
+                    mtime = max(mtime, os.path.getmtime(self.persistent_journal))
+
                 if mtime != self.persistent_mtime:
                     data = renpy.persistent.load(self.persistent)
                     self.persistent_mtime = mtime
@@ -307,13 +327,120 @@ class FileLocation(object):
             if not self.active:
                 return
 
-            fn = self.persistent
-            fn_new = fn + ".new"
+            self.write_persistent(data)
+
+    def write_persistent(self, data, tail=None):
+        """
+        Writes `data` to the persistent file. If `tail` is None, the journal
+        is removed. Otherwise, the journal is replaced with one containing
+        `tail`, a string of journal entries. This must be called with
+        disk_lock held.
+        """
+
+        fn = self.persistent
+        fn_new = fn + ".new"
+
+        with open(fn_new, "wb") as f:
+            f.write(data)
+
+        safe_rename(fn_new, fn)
+
+        self.persistent_header = renpy.persistent.journal_header(data)
+        self.persistent_written_mtime = os.path.getmtime(fn)
+        self.persistent_generation += 1
+
+        fn = self.persistent_journal
+
+        if tail is None:
+            if os.path.exists(fn):
+                os.unlink(fn)
+
+            return
+
+        fn_new = fn + ".new"
+
+        with open(fn_new, "wb") as f:
+            f.write(self.persistent_header)
+            f.write(tail)
+
+        safe_rename(fn_new, fn)
+
+    def journal_persistent(self, entry, dump):
+        """
+        Appends `entry`, a journal entry, to the persistent journal. `dump`
+        is a function that returns the uncompressed persistent data, which
+        is called when the whole persistent file needs to be written. That
+        happens when we haven't written the persistent file ourselves, and
+        when the journal needs to be compacted.
+        """
+
+        with disk_lock:
+
+            if not self.active:
+                return
+
+            try:
+                mtime = os.path.getmtime(self.persistent)
+            except:
+                mtime = None
+
+            if (self.persistent_header is None) or (mtime != self.persistent_written_mtime):
+                self.write_persistent(dump().encode("zlib"))
+                return
+
+            if entry is None:
+                return
+
+            fn = self.persistent_journal
+
+            with open(fn, "ab") as f:
+                if not f.tell():
+                    f.write(self.persistent_header)
+
+                f.write(entry)
+                size = f.tell()
+
+            if self.compact_thread is not None:
+                return
+
+            if size < renpy.config.persistent_journal_size:
+                return
+
+            self.compact_thread = threading.Thread(
+                target=self.compact_journal,
+                args=(dump(), size, self.persistent_generation))
+
+            self.compact_thread.start()
+
+    def compact_journal(self, data, offset, generation):
+        """
+        Compacts the journal, by writing `data` (the uncompressed persistent
+        data as of when the journal was `offset` bytes long) as the
+        persistent file. Entries after `offset` are kept in the journal. This
+        runs in a background thread, and does nothing if the persistent
+        file has been written since `generation`.
+        """
+
+        try:
+            data = data.encode("zlib")
+
+            with disk_lock:
+
+                if generation != self.persistent_generation:
+                    return
+
+                with open(self.persistent_journal, "rb") as f:
+                    f.seek(offset)
+                    tail = f.read()
 
-            with open(fn_new, "wb") as f:
-                f.write(data)
+                self.write_persistent(data, tail)
 
-            safe_rename(fn_new, fn)
+        except:
+            if renpy.config.developer:
+                traceback.print_exc()
+
+        finally:
+            self.compact_thread = None
 
     def unlink_persistent(self):
 
@@ -325,6 +452,11 @@ class FileLocation(object):
         except:
             pass
 
+        try:
+            os.unlink(self.persistent_journal)
+        except:
+            pass
+
     def __eq__(self, other):
         if not isinstance(other, FileLocation):
             return False
@@ -444,6 +576,21 @@ class MultiLocation(object):
         for l in self.active_locations():
             l.save_persistent(data)
 
+    def journal_persistent(self, entry, dump):
+
+        # Only dump the persistent data once, no matter how many locations
+        # need it.
+        dumped = [ ]
+
+        def dump_once():
+            if not dumped:
+                dumped.append(dump())
+
+            return dumped[0]
+
+        for l in self.active_locations():
+            l.journal_persistent(entry, dump_once)
+
 
     def unlink_persistent(self):
 
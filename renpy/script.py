@@ -30,6 +30,8 @@ import difflib
 import md5
 import time
 import marshal
+import zlib
+import bisect
 
 from cPickle import loads, dumps
 
@@ -39,9 +41,21 @@ script_version = renpy.script_version
 # The version of the bytecode cache.
 BYTECODE_VERSION = 1
 
+# The directory, relative to the game directory, that the bytecode cache is
+# stored in. The cache is divided into one file per source file.
+BYTECODE_DIR = "cache/bytecode"
+
 # The python magic code.
 MAGIC = imp.get_magic()
 
+# The number of worker processes used to parse .rpy files that need to be
+# compiled. If this is less than 2, files are parsed serially.
+compile_processes = int(os.environ.get("RENPY_COMPILE_PROCESSES", "0"))
+
+# If true, .rpyc files are written so that top-level labels can be loaded
+# on demand, and such labels are loaded when first reached.
+lazy_script = "RENPY_LAZY_SCRIPT" in os.environ
+
 class ScriptError(Exception):
     """
     Exception that is raised if the script is somehow inconsistent,
@@ -67,6 +81,254 @@ def collapse_stmts(stmts):
     return all_stmts
 
 
+def can_load_lazily(node):
+    """
+    Returns true if `node`, a top-level statement, is a label that can be
+    loaded on demand. Such a label may not contain anything that needs to
+    run at init time or when the script is loaded.
+    """
+
+    if not isinstance(node, renpy.ast.Label) or node.hide:
+        return False
+
+    exclude = (
+        renpy.ast.Init,
+        renpy.ast.EarlyPython,
+        renpy.ast.Image,
+        renpy.ast.Transform,
+        renpy.ast.Define,
+        renpy.ast.Screen,
+        renpy.ast.Style,
+        renpy.ast.Translate,
+        renpy.ast.TranslateString,
+        renpy.ast.TranslatePython,
+        renpy.ast.TranslateBlock,
+        )
+
+    for i in collapse_stmts([ node ]):
+
+        if i.get_init() is not None:
+            return False
+
+        if isinstance(i, exclude):
+            return False
+
+        if isinstance(i, renpy.ast.Python) and i.store != "store":
+            return False
+
+    return True
+
+
+def can_follow_lazy(node):
+    """
+    Returns true if `node`, a top-level statement, can follow a label that
+    is loaded on demand. The node must not be affected by the label when
+    translation identifiers are assigned, which is true of other labels
+    and statements that contain nothing translatable.
+    """
+
+    if node is None:
+        return True
+
+    if isinstance(node, renpy.ast.Label):
+        return not node.hide
+
+    for i in collapse_stmts([ node ]):
+        if isinstance(i, renpy.ast.Say) or i.translatable:
+            return False
+
+    return True
+
+
+def split_lazy(stmts):
+    """
+    Splits `stmts`, the top-level statements of a file, into the part that
+    is loaded eagerly and a list of separately pickled labels that are
+    loaded on demand. Returns the list of eager statements, in which the
+    labels are replaced by LazyLabel nodes, and the list of pickled labels.
+    """
+
+    eager = [ ]
+    segments = [ ]
+    offset = 0
+
+    for i, node in enumerate(stmts):
+
+        if i + 1 < len(stmts):
+            follower = stmts[i + 1]
+        else:
+            follower = None
+
+        if not (can_load_lazily(node) and can_follow_lazy(follower)):
+            eager.append(node)
+            continue
+
+        data = dumps([ node ], 2).encode("zlib")
+        names = [ j.name for j in collapse_stmts([ node ]) ]
+
+        stub = renpy.ast.LazyLabel((node.filename, node.linenumber), names, offset, len(data))
+        stub.name = ("lazy", node.name)
+
+        eager.append(stub)
+        segments.append(data)
+        offset += len(data)
+
+    return eager, segments
+
+
+def parse_worker(fn):
+    """
+    Parses the .rpy file `fn`. This is called in a worker process, and
+    returns the pickled list of statements, or None if the file could not
+    be parsed cleanly. (Files that return None are parsed again, serially,
+    so errors are reported in the usual way.)
+    """
+
+    renpy.parser.parse_errors = [ ]
+
+    try:
+        stmts = renpy.parser.parse(fn)
+    except:
+        return None
+
+    if stmts is None or renpy.parser.parse_errors:
+        return None
+
+    return dumps(stmts, 2)
+
+
+def parse_files(filenames, processes):
+    """
+    Parses each of the .rpy files in `filenames` using a pool of
+    `processes` worker processes. Returns a dictionary mapping each
+    filename to the pickled statements produced by parse_worker, leaving
+    out files that failed to parse.
+
+    The workers are forked from the current process, so they see the
+    statements that have been registered so far. On platforms without
+    fork, this returns an empty dictionary.
+    """
+
+    if not hasattr(os, "fork"):
+        return { }
+
+    import multiprocessing
+
+    pool = multiprocessing.Pool(processes)
+
+    try:
+        results = pool.map(parse_worker, filenames, 1)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return dict((fn, data) for fn, data in zip(filenames, results) if data is not None)
+
+
+class DecompressedFile(object):
+    """
+    A file-like object that decompresses the zlib-compressed file `f` as
+    it is read, so the start of a large file can be read cheaply.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.decompressor = zlib.decompressobj()
+        self.buffer = ""
+
+    def fill(self, n):
+        while len(self.buffer) < n:
+            data = self.f.read(4096)
+
+            if not data:
+                break
+
+            self.buffer += self.decompressor.decompress(data)
+
+    def read(self, n):
+        self.fill(n)
+
+        rv = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return rv
+
+    def readline(self):
+        rv = ""
+
+        while not rv.endswith("\n"):
+            c = self.read(1)
+
+            if not c:
+                break
+
+            rv += c
+
+        return rv
+
+
+# The pickle opcodes that give the simple values stored in the data
+# dictionary of a .rpyc file.
+RPYC_DATA_OPCODES = set([
+    "SHORT_BINSTRING",
+    "BINSTRING",
+    "STRING",
+    "BINUNICODE",
+    "BININT",
+    "BININT1",
+    "BININT2",
+    "INT",
+    "LONG1",
+    ])
+
+def read_rpyc_data(fn):
+    """
+    Returns the data dictionary at the start of the .rpyc file `fn`,
+    without unpickling the statements that follow it. Returns None if the
+    dictionary can't be read.
+    """
+
+    import pickletools
+
+    try:
+        f = file(fn, "rb")
+    except:
+        return None
+
+    values = [ ]
+    in_dict = False
+
+    try:
+        for opcode, arg, _pos in pickletools.genops(DecompressedFile(f)):
+
+            name = opcode.name
+
+            if name == "EMPTY_DICT":
+                in_dict = True
+
+            elif not in_dict or name in ("PROTO", "MARK", "BINPUT", "LONG_BINPUT", "PUT"):
+                continue
+
+            elif name in RPYC_DATA_OPCODES:
+                values.append(arg)
+
+            elif name in ("SETITEM", "SETITEMS"):
+                return dict(zip(values[0::2], values[1::2]))
+
+            else:
+                return None
+
+    except:
+        return None
+
+    finally:
+        f.close()
+
+    return None
+
+
 class Script(object):
     """
     This class represents a Ren'Py script, which is parsed out of a
@@ -105,14 +367,44 @@ class Script(object):
             self.key = None
 
         self.namemap = { }
+
+        # A map from the name of a statement that has not been loaded yet
+        # to the LazyLabel that will load it.
+        self.lazy_names = { }
+
+        # Should labels be loaded on demand?
+        self.lazy = lazy_script and (renpy.game.args.command == "run") #@UndefinedVariable
+
         self.all_stmts = [ ]
         self.all_pycode = [ ]
         self.record_pycode = True
 
-        # Bytecode caches.
+        # Bytecode caches. Each maps the name of a shard (a digest of the
+        # source filename) to a map from PyCode hash to bytecode.
         self.bytecode_oldcache = { }
         self.bytecode_newcache = { }
-        self.bytecode_dirty = False
+
+        # Maps from the name of a shard to a map from the name of a
+        # top-level statement to the set of hashes of the code it contains.
+        self.bytecode_oldowners = { }
+        self.bytecode_newowners = { }
+
+        # The set of shards that have been updated since the cache was last
+        # saved. They're written out if their contents have changed.
+        self.bytecode_dirty = set()
+
+        # True once the bytecode cache has been saved after init. Code
+        # compiled after this, for labels that are loaded on demand, is
+        # saved as soon as it's compiled.
+        self.bytecode_saved = False
+
+        # The contents of the old, single-file bytecode cache, if it has
+        # been loaded.
+        self.bytecode_legacy = None
+
+        # A map from the full filename of a .rpy file to its pickled
+        # statements, if it was parsed in parallel ahead of time.
+        self.parsed = { }
 
         self.translator = renpy.translation.ScriptTranslator()
 
@@ -128,8 +420,9 @@ class Script(object):
         Scan the directories for script files.
         """
 
-        # A list of all files in the search directories.
-        dirlist = renpy.loader.listdirfiles()
+        # A list of all files in the search directories, and the compiled
+        # scripts in archives.
+        dirlist = renpy.loader.listdirfiles(archived="scripts")
 
         # A list of directory, filename w/o extension pairs. This is
         # what we will load immediately.
@@ -173,9 +466,22 @@ class Script(object):
 
         initcode = [ ]
 
+        if compile_processes > 1:
+            self.parse_parallel(script_files)
+
         for fn, dir in script_files: #@ReservedAssignment
+
+            if self.parsed:
+                registry = dict(renpy.statements.registry)
+
             self.load_appropriate_file(".rpyc", ".rpy", dir, fn, initcode)
 
+            # If the file registered (or replaced) a statement in early
+            # python, the files parsed in parallel may have been parsed
+            # incorrectly, so parse them again.
+            if self.parsed and registry != renpy.statements.registry:
+                self.parsed.clear()
+
         # Make the sort stable.
         initcode = [ (prio, index, code) for index, (prio, code) in
                      enumerate(initcode) ]
@@ -185,6 +491,38 @@ class Script(object):
         self.initcode = [ (prio, code) for prio, index, code in initcode ]
 
 
+    def parse_parallel(self, script_files):
+        """
+        Parses the .rpy files in `script_files` that will need to be
+        compiled in parallel, storing the results in self.parsed. The
+        results are consumed by load_file_core in sorted order, so names
+        are assigned and init code is ordered exactly as if the files
+        were parsed serially.
+        """
+
+        filenames = [ ]
+
+        for fn, dir in script_files: #@ReservedAssignment
+            if dir is None:
+                continue
+
+            rpyfn = dir + "/" + fn + ".rpy"
+            rpycfn = rpyfn + "c"
+
+            if not os.path.exists(rpyfn):
+                continue
+
+            if self.needs_compile(rpyfn, rpycfn) or not self.rpyc_current(rpycfn):
+                filenames.append(rpyfn)
+
+        if len(filenames) < 2:
+            return
+
+        try:
+            self.parsed = parse_files(filenames, compile_processes)
+        except:
+            self.parsed = { }
+
     def load_module(self, name):
 
         files = [ (fn, dir) for fn, dir in self.module_files if fn == name ] #@ReservedAssignment
@@ -247,7 +585,12 @@ class Script(object):
 
             fullfn = dir + "/" + fn
 
-            stmts = renpy.parser.parse(fullfn)
+            pickled = self.parsed.pop(fullfn, None)
+
+            if pickled is not None:
+                stmts = loads(pickled)
+            else:
+                stmts = renpy.parser.parse(fullfn)
 
             data = { }
             data['version'] = script_version
@@ -261,6 +604,7 @@ class Script(object):
             try:
                 self.record_pycode = False
                 old_data, old_stmts = self.load_file_core(dir, fn + "c")
+                old_stmts = self.expand_lazy(old_stmts)
                 self.merge_names(old_stmts, stmts)
                 del old_data
                 del old_stmts
@@ -272,9 +616,20 @@ class Script(object):
             self.assign_names(stmts, fullfn)
 
             try:
+                if lazy_script:
+                    eager, segments = split_lazy(stmts)
+                else:
+                    eager, segments = stmts, [ ]
+
                 rpydigest = md5.md5(file(fullfn, "rU").read()).digest()
                 f = file(dir + "/" + fn + "c", "wb")
-                f.write(dumps((data, stmts), 2).encode('zlib'))
+                f.write(dumps((data, eager), 2).encode('zlib'))
+
+                # Labels that can be loaded on demand follow the first part
+                # of the file.
+                for i in segments:
+                    f.write(i)
+
                 f.write(rpydigest)
                 f.close()
             except:
@@ -285,7 +640,9 @@ class Script(object):
             f = renpy.loader.load(fn)
 
             try:
-                data, stmts = loads(f.read().decode('zlib'))
+                raw = f.read()
+                d = zlib.decompressobj()
+                data, stmts = loads(d.decompress(raw) + d.flush())
             except:
                 return None, None
 
@@ -299,6 +656,17 @@ class Script(object):
                 return None, None
 
             f.close()
+
+            # The offset of the end of the first part of the file.
+            base = len(raw) - len(d.unused_data)
+
+            for i in stmts:
+                if isinstance(i, renpy.ast.LazyLabel):
+                    i.rpyc = fn
+                    i.base = base
+
+            if not self.lazy:
+                stmts = self.expand_lazy(stmts)
         else:
             return None, None
 
@@ -383,24 +751,28 @@ class Script(object):
             # report the error.
             name = node.name
 
-            if name in self.namemap and check_names:
-                old = self.namemap[name]
-
-                raise ScriptError("Name %s is defined twice: at %s:%d and %s:%d." %
-                                  (repr(name),
-                                   old.filename, old.linenumber,
-                                   node.filename, node.linenumber))
+            if check_names:
+                self.check_name(name, node)
 
             # Otherwise, add the name to the namemap.
             self.namemap[name] = node
 
+            # Note the names of the statements in a label that will be
+            # loaded on demand.
+            if isinstance(node, renpy.ast.LazyLabel):
+                for i in node.names:
+                    if check_names:
+                        self.check_name(i, node)
+
+                    self.lazy_names[i] = node
+
             # Add any init nodes to self.initcode.
             init = node.get_init()
             if init:
                 initcode.append(init)
 
         # Compile bytecode from the file.
-        self.update_bytecode()
+        self.update_bytecode(stmts)
 
         # Exec early python.
         for node in all_stmts:
@@ -411,6 +783,126 @@ class Script(object):
 
         return stmts
 
+    def check_name(self, name, node):
+        """
+        Raises a ScriptError if `name`, the name of `node`, has already been
+        defined.
+        """
+
+        old = self.namemap.get(name, None)
+
+        if old is None:
+            old = self.lazy_names.get(name, None)
+
+        if old is None:
+            return
+
+        raise ScriptError("Name %s is defined twice: at %s:%d and %s:%d." %
+                          (repr(name),
+                           old.filename, old.linenumber,
+                           node.filename, node.linenumber))
+
+    def read_lazy(self, stub):
+        """
+        Reads and unpickles the label stored for the LazyLabel `stub`,
+        returning a list containing the label.
+        """
+
+        f = renpy.loader.load(stub.rpyc)
+        f.seek(stub.base + stub.offset)
+        data = f.read(stub.length)
+        f.close()
+
+        return loads(data.decode("zlib"))
+
+    def expand_lazy(self, stmts):
+        """
+        Returns a copy of the top-level statements `stmts`, with each
+        LazyLabel replaced by the label it stands in for.
+        """
+
+        rv = [ ]
+
+        for i in stmts:
+            if isinstance(i, renpy.ast.LazyLabel):
+                rv.extend(self.read_lazy(i))
+            else:
+                rv.append(i)
+
+        return rv
+
+    def load_lazy(self, stub):
+        """
+        Loads the label the LazyLabel `stub` stands in for, if it hasn't
+        been loaded yet, and returns the loaded block.
+        """
+
+        if stub.block is not None:
+            return stub.block
+
+        old_ei = renpy.game.exception_info
+        renpy.game.exception_info = "While loading label %s from %s." % (stub.name[1], stub.rpyc)
+
+        stmts = self.read_lazy(stub)
+
+        renpy.translation.restructure(stmts)
+        all_stmts = collapse_stmts(stmts)
+        self.translator.take_translates(all_stmts)
+
+        renpy.ast.chain_block(stmts, stub.next)
+
+        for node in all_stmts:
+            self.namemap[node.name] = node
+
+        for i in stub.names:
+            self.lazy_names.pop(i, None)
+
+        self.update_bytecode(stmts)
+        self.translator.chain_translates()
+
+        if self.bytecode_saved:
+            self.save_bytecode()
+
+        if self.all_stmts is not None:
+            self.all_stmts.extend(all_stmts)
+
+        stub.block = stmts
+
+        renpy.game.exception_info = old_ei
+
+        return stmts
+
+    def load_all_lazy(self):
+        """
+        Loads every label that has not been loaded yet.
+        """
+
+        for stub in set(self.lazy_names.values()):
+            self.load_lazy(stub)
+
+    def lookup_lazy(self, name):
+        """
+        Loads the label containing the statement `name`, if it hasn't been
+        loaded yet. Returns the statement, or None if it's not known.
+        """
+
+        stub = self.lazy_names.get(name, None)
+
+        # Statements created when the label is loaded, like translate
+        # blocks, have names derived from the names of other statements.
+        prefix = name
+
+        while stub is None and isinstance(prefix, tuple) and prefix:
+            prefix = prefix[:-1]
+            stub = self.lazy_names.get(prefix, None)
+
+        if stub is None:
+            return None
+
+        self.load_lazy(stub)
+
+        return self.namemap.get(name, None)
+
     def load_appropriate_file(self, compiled, source, dir, fn, initcode): #@ReservedAssignment
         # This can only be a .rpyc file, since we're loading it
         # from an archive.
@@ -427,14 +919,8 @@ class Script(object):
         renpy.loader.add_auto(rpyfn)
 
         if os.path.exists(rpyfn) and os.path.exists(rpycfn):
-            rpydigest = md5.md5(file(rpyfn, "rU").read()).digest()
-            f = file(rpycfn, "rb")
-            f.seek(-md5.digest_size, 2)
-            rpycdigest = f.read(md5.digest_size)
-            f.close()
 
-            if rpydigest == rpycdigest and \
-                not (renpy.game.args.command == "compile" or renpy.game.args.compile): #@UndefinedVariable
+            if not self.needs_compile(rpyfn, rpycfn):
 
                 if self.load_file(dir, fn + compiled, initcode):
                     return
@@ -453,36 +939,148 @@ class Script(object):
                 raise Exception("Could not load file %s." % rpyfn)
 
 
+    def needs_compile(self, rpyfn, rpycfn):
+        """
+        Returns true if the source file `rpyfn` needs to be parsed, rather
+        than loading the compiled file `rpycfn`.
+        """
+
+        if not os.path.exists(rpyfn):
+            return False
+
+        if not os.path.exists(rpycfn):
+            return True
+
+        if renpy.game.args.command == "compile" or renpy.game.args.compile: #@UndefinedVariable
+            return True
+
+        rpydigest = md5.md5(file(rpyfn, "rU").read()).digest()
+        f = file(rpycfn, "rb")
+        f.seek(-md5.digest_size, 2)
+        rpycdigest = f.read(md5.digest_size)
+        f.close()
+
+        return rpydigest != rpycdigest
+
+    def rpyc_current(self, rpycfn):
+        """
+        Returns true if the .rpyc file `rpycfn` was written by this version
+        of Ren'Py with the current key, and so can be loaded rather than
+        parsing the .rpy file again. Only the start of the file is read.
+        """
+
+        data = read_rpyc_data(rpycfn)
+
+        if data is None:
+            return False
+
+        if self.key and data.get('key', 'unlocked') != self.key:
+            return False
+
+        return data.get('version', None) == script_version
+
     def init_bytecode(self):
         """
-        Init/Loads the bytecode cache.
+        Init/Loads the bytecode cache. The shards of the cache are loaded
+        as they are needed, by load_bytecode_shard.
         """
 
-        # Load the oldcache.
-        try:
-            version, cache = loads(renpy.loader.load("bytecode.rpyb").read().decode("zlib"))
-            if version == BYTECODE_VERSION:
-                self.bytecode_oldcache = cache
-        except:
-            pass
+        self.bytecode_oldcache = { }
+        self.bytecode_oldowners = { }
+        self.bytecode_legacy = None
+
+    def bytecode_shard(self, filename):
+        """
+        Returns the name of the bytecode cache shard for code found in
+        `filename`.
+        """
+
+        if isinstance(filename, unicode):
+            filename = filename.encode("utf-8")
+
+        return md5.md5(filename).hexdigest()
+
+    def load_bytecode_shard(self, shard):
+        """
+        Returns the map from PyCode hash to bytecode stored in `shard`,
+        loading it if necessary. The shard also records the top-level
+        statement each piece of code belongs to, which is stored in
+        self.bytecode_oldowners.
+        """
+
+        rv = self.bytecode_oldcache.get(shard, None)
+
+        if rv is None:
+            rv = { }
+            owners = { }
+
+            try:
+                version, cache, cache_owners = loads(renpy.loader.load(BYTECODE_DIR + "/" + shard + ".rpyb").read().decode("zlib"))
+                if version == BYTECODE_VERSION:
+                    rv = cache
+                    owners = cache_owners
+            except:
+                pass
+
+            self.bytecode_oldcache[shard] = rv
+            self.bytecode_oldowners[shard] = owners
 
-    def update_bytecode(self):
+        return rv
+
+    def load_bytecode_legacy(self):
+        """
+        Returns the contents of the old single-file bytecode cache, which is
+        only loaded when a shard is missing code.
+        """
+
+        if self.bytecode_legacy is None:
+            self.bytecode_legacy = { }
+
+            try:
+                version, cache = loads(renpy.loader.load("bytecode.rpyb").read().decode("zlib"))
+                if version == BYTECODE_VERSION:
+                    self.bytecode_legacy = cache
+            except:
+                pass
+
+        return self.bytecode_legacy
+
+    def update_bytecode(self, stmts=[ ]):
         """
         Compiles the PyCode objects in self.all_pycode, updating the
         cache. Clears out self.all_pycode.
+
+        `stmts`
+            The top-level statements that were loaded with the code. Each
+            piece of code is recorded as belonging to the statement that
+            contains it, so the code of labels that haven't been loaded can
+            be kept when the cache is saved.
         """
 
+        # Maps from filename to the line numbers and the names of the
+        # top-level statements in that file, in line number order.
+        lines = { }
+        names = { }
+
+        for i in sorted(stmts, key=lambda n : n.linenumber):
+            lines.setdefault(i.filename, [ ]).append(i.linenumber)
+            names.setdefault(i.filename, [ ]).append(i.name)
+
         # Update all of the PyCode objects in the system with the loaded
         # bytecode.
         for i in self.all_pycode:
 
             key = i.get_hash() + MAGIC
+            shard = self.bytecode_shard(i.location[0])
+
+            self.bytecode_dirty.add(shard)
 
-            code = self.bytecode_oldcache.get(key, None)
+            code = self.load_bytecode_shard(shard).get(key, None)
 
             if code is None:
+                code = self.load_bytecode_legacy().get(key, None)
 
-                self.bytecode_dirty = True
+            if code is None:
 
                 old_ei = renpy.game.exception_info
                 renpy.game.exception_info = "While compiling python block starting at line %d of %s." % (i.location[1], i.location[0])
@@ -519,22 +1117,85 @@ class Script(object):
 
                 renpy.game.exception_info = old_ei
 
-            self.bytecode_newcache[key] = code
+            filename, line = i.location[:2]
+            n = bisect.bisect_right(lines.get(filename, [ ]), line) - 1
+
+            if n >= 0:
+                owner = names[filename][n]
+            else:
+                owner = None
+
+            self.bytecode_newcache.setdefault(shard, { })[key] = code
+            self.bytecode_newowners.setdefault(shard, { }).setdefault(owner, set()).add(key)
             i.bytecode = marshal.loads(code)
 
         self.all_pycode = [ ]
 
 
     def save_bytecode(self):
+        """
+        Writes out the shards of the bytecode cache that have changed.
+        """
 
-        if self.bytecode_dirty:
-            try:
-                data = (BYTECODE_VERSION, self.bytecode_newcache)
-                f = file(os.path.join(renpy.config.searchpath[0], "bytecode.rpyb"), "wb")
+        self.bytecode_saved = True
+
+        if not self.bytecode_dirty:
+            return
+
+        gamedir = renpy.config.searchpath[0]
+
+        try:
+            dirname = os.path.join(gamedir, BYTECODE_DIR)
+
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+
+            for shard in self.bytecode_dirty:
+
+                old = self.load_bytecode_shard(shard)
+                oldowners = self.bytecode_oldowners[shard]
+                new = self.bytecode_newcache.get(shard, { })
+
+                # Labels that haven't been loaded haven't had their code
+                # compiled, so keep their code. The code of every other
+                # statement is replaced by the code compiled for it, which
+                # drops the code of statements that were changed or removed.
+                owners = dict((k, v) for k, v in oldowners.iteritems() if k in self.lazy_names)
+                owners.update((k, set(v)) for k, v in self.bytecode_newowners.get(shard, { }).iteritems())
+
+                if owners == oldowners:
+                    continue
+
+                cache = { }
+
+                for keys in owners.itervalues():
+                    for key in keys:
+                        code = new.get(key, None)
+
+                        if code is None:
+                            code = old.get(key, None)
+
+                        if code is not None:
+                            cache[key] = code
+
+                self.bytecode_oldcache[shard] = cache
+                self.bytecode_oldowners[shard] = owners
+
+                data = (BYTECODE_VERSION, cache, owners)
+                f = file(os.path.join(dirname, shard + ".rpyb"), "wb")
                 f.write(dumps(data, 2).encode("zlib"))
                 f.close()
-            except:
-                pass
+
+            self.bytecode_dirty = set()
+
+            # The old cache is no longer needed.
+            legacy = os.path.join(gamedir, "bytecode.rpyb")
+
+            if os.path.exists(legacy):
+                os.unlink(legacy)
+
+        except:
+            pass
 
 
     def lookup(self, label):
@@ -545,10 +1206,15 @@ class Script(object):
 
         label = renpy.config.label_overrides.get(label, label)
 
-        if label not in self.namemap:
+        rv = self.namemap.get(label, None)
+
+        if rv is None:
+            rv = self.lookup_lazy(label)
+
+        if rv is None:
             raise ScriptError("could not find label '%s'." % str(label))
 
-        return self.namemap[label]
+        return rv
 
     def has_label(self, label):
         """
@@ -557,4 +1223,4 @@ class Script(object):
 
         label = renpy.config.label_overrides.get(label, label)
 
-        return label in self.namemap
+        return (label in self.namemap) or (label in self.lazy_names)
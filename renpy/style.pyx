@@ -737,6 +737,9 @@ def rebuild():
     build_styles()
     renpy.display.screen.prepare_screens()
 
+    # Layouts may have been made with the old styles.
+    renpy.text.text.layout_cache_clear()
+
 def copy_properties(p):
     """
     Makes a copy of the properties dict p.
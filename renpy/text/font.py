@@ -561,7 +561,12 @@ def load_face(fn):
     if font_file is None:
         raise Exception("Could not find font {0!r}.".format(orig_fn))
 
-    rv = ftfont.FTFace(font_file, index) #@UndefinedVariable
+    # The face keeps the font data in memory (or mapped), so the file
+    # itself isn't needed once the face has been created.
+    try:
+        rv = ftfont.FTFace(font_file, index) #@UndefinedVariable
+    finally:
+        font_file.close()
 
     face_cache[orig_fn] = rv
 
@@ -592,12 +597,28 @@ def get_font(fn, size, bold, italics, outline, antialias, vertical):
     # If we made it here, we need to load a ttf.
     face = load_face(fn)
 
-    rv = ftfont.FTFont(face, size, bold, italics, outline, antialias, vertical) #@UndefinedVariable
+    rv = ftfont.FTFont(face, size, bold, italics, outline, antialias, vertical, renpy.config.font_glyph_cache_size) #@UndefinedVariable
 
     font_cache[key] = rv
 
     return rv
 
+def get_glyph_cache_stats():
+    """
+    Returns a dictionary giving the number of glyph lookups that were found
+    in the glyph caches of the loaded fonts, and the number that had to be
+    rendered.
+    """
+
+    hits = 0
+    misses = 0
+
+    for f in font_cache.itervalues():
+        hits += f.cache_hits
+        misses += f.cache_misses
+
+    return { "fonts" : len(font_cache), "hits" : hits, "misses" : misses }
+
 def free_memory():
     """
     Clears the font cache.
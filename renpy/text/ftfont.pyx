@@ -24,7 +24,11 @@ from pygame cimport *
 from freetype cimport *
 from ttgsubtable cimport *
 from textsupport cimport Glyph, SPLIT_INSTEAD
-import traceback
+from libc.stdlib cimport calloc, free
+import mmap
+
+cdef extern from "Python.h":
+    int PyObject_AsReadBuffer(object obj, const void **buffer, Py_ssize_t *buffer_len) except -1
 
 cdef extern from "ftsupport.h":
     char *freetype_error_to_string(int error)
@@ -46,6 +50,14 @@ cdef struct glyph_cache:
     int bitmap_left
     int bitmap_top
 
+    # The value of the font's clock when this glyph was last used.
+    unsigned int used
+
+# The number of glyphs that share a set in the glyph cache. A glyph can be
+# stored in any of the entries of the set selected by its index, and the
+# least recently used entry is replaced on a miss.
+DEF GLYPH_CACHE_WAYS = 4
+
 
 class FreetypeError(Exception):
     def __init__(self, code):
@@ -59,51 +71,27 @@ def init():
     if error:
         raise FreetypeError(error)
 
-cdef unsigned long io_func(FT_Stream stream, unsigned long offset, unsigned char *buffer, unsigned long count):
+def face_data(f):
     """
-    Seeks to offset, and then reads count bytes from the stream into buffer.
+    Returns an object supporting the buffer interface that contains the
+    contents of the font file `f`. Where possible, this shares memory with
+    the file on disk or the archive the font is stored in, rather than
+    making a copy.
     """
 
-    cdef FTFace face
-    cdef char *cbuf
+    getbuffer = getattr(f, "getbuffer", None)
 
-    face = <FTFace> stream.descriptor.pointer
-    f = face.f
-
-    if face.offset != offset:
+    if getbuffer is not None:
+        return getbuffer()
 
+    if isinstance(f, file):
         try:
-            f.seek(offset)
-            face.offset = offset
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
         except:
-            traceback.print_exc()
-            return -1
+            pass
 
-    if count != 0:
-        try:
-            buf = f.read(count)
-            cbuf = buf
-            count = len(buf)
-
-            for i from 0 <= i < count:
-                buffer[i] = cbuf[i]
-        except:
-            traceback.print_exc()
-            return -1
-
-    face.offset += count
-
-    return count
-
-cdef void close_func(FT_Stream stream):
-    """
-    Close the stream.
-
-    Currently does nothing, closing is taken care of at the Font
-    object level.
-    """
-
-    return
+    f.seek(0)
+    return f.read()
 
 
 cdef class FTFace:
@@ -112,41 +100,27 @@ cdef class FTFace:
     """
 
     cdef:
-        FT_StreamRec stream
         FT_Open_Args open_args
         FT_Face face
 
         float size
 
-        # The file the font is read from.
-        object f
-
-        # The offset in that file.
-        unsigned long offset
+        # The contents of the font file. Freetype reads from this memory
+        # directly, so it has to live as long as the face does.
+        object data
 
     def __init__(self, f, index):
 
         cdef int error
-        cdef unsigned long size
-
-        # The file that the font is opened from.
-        self.f = f
-
-        f.seek(0, 2)
-        size = f.tell()
-        f.seek(0, 0)
+        cdef const void *base
+        cdef Py_ssize_t length
 
-        # The offset within the stream we're currently at.
-        self.offset = 0
+        self.data = face_data(f)
+        PyObject_AsReadBuffer(self.data, &base, &length)
 
-        self.open_args.flags = FT_OPEN_STREAM
-        self.open_args.stream = &self.stream
-
-        self.stream.size = size
-        self.stream.pos = 0
-        self.stream.descriptor.pointer = <void *> self
-        self.stream.read = io_func
-        self.stream.close = close_func
+        self.open_args.flags = FT_OPEN_MEMORY
+        self.open_args.memory_base = <FT_Byte *> base
+        self.open_args.memory_size = length
 
         error = FT_Open_Face(library, &self.open_args, index, &self.face)
         if error:
@@ -193,21 +167,34 @@ cdef class FTFont:
         public int height
         public int lineskip
 
-        glyph_cache cache[256]
+        # The glyph cache, an array of cache_sets * GLYPH_CACHE_WAYS
+        # entries.
+        glyph_cache *cache
+        int cache_sets
+
+        # Incremented each time a glyph is looked up.
+        unsigned int cache_clock
+
+        # The number of glyph lookups that were found in the cache, and
+        # that had to be rendered.
+        public unsigned long cache_hits
+        public unsigned long cache_misses
 
         # Have we been setup at least once?
         bint has_setup
 
     def __cinit__(self):
-        for i from 0 <= i < 256:
-            self.cache[i].index = -1
-            FT_Bitmap_New(&(self.cache[i].bitmap))
+        self.cache = NULL
+        self.cache_sets = 0
 
         init_gsubtable(&self.gsubtable)
 
     def __dealloc__(self):
-        for i from 0 <= i < 256:
-            FT_Bitmap_Done(library, &(self.cache[i].bitmap))
+        if self.cache != NULL:
+            for i from 0 <= i < self.cache_sets * GLYPH_CACHE_WAYS:
+                FT_Bitmap_Done(library, &(self.cache[i].bitmap))
+
+            free(self.cache)
 
         if self.stroker != NULL:
             FT_Stroker_Done(self.stroker)
@@ -215,11 +202,30 @@ cdef class FTFont:
         free_gsubtable(&self.gsubtable)
 
 
-    def __init__(self, face, float size, float bold, bint italic, int outline, bint antialias, bint vertical):
+    def __init__(self, face, float size, float bold, bint italic, int outline, bint antialias, bint vertical, int cache_size=256):
+        """
+        `cache_size`
+            The number of rendered glyphs this font keeps. This is rounded
+            up to a power of two, and to at least GLYPH_CACHE_WAYS glyphs.
+        """
 
         if size < 1:
             size = 1
 
+        if self.cache == NULL:
+
+            self.cache_sets = 1
+            while self.cache_sets * GLYPH_CACHE_WAYS < cache_size:
+                self.cache_sets *= 2
+
+            self.cache = <glyph_cache *> calloc(self.cache_sets * GLYPH_CACHE_WAYS, sizeof(glyph_cache))
+            if self.cache == NULL:
+                raise MemoryError()
+
+            for i from 0 <= i < self.cache_sets * GLYPH_CACHE_WAYS:
+                self.cache[i].index = -1
+                FT_Bitmap_New(&(self.cache[i].bitmap))
+
         self.face_object = face
         self.face = self.face_object.face
 
@@ -309,7 +315,9 @@ cdef class FTFont:
 
         cdef int error
         cdef glyph_cache *rv
+        cdef glyph_cache *entries
         cdef uint32_t vindex
+        cdef int i
 
         cdef int overhang
         cdef FT_Glyph_Metrics metrics
@@ -327,11 +335,26 @@ cdef class FTFont:
         else:
             glyph_rotate = 0
 
-        rv = &(self.cache[index & 255])
-        if rv.index == index:
-            return rv
+        self.cache_clock += 1
+
+        entries = &(self.cache[(index & (self.cache_sets - 1)) * GLYPH_CACHE_WAYS])
+        rv = entries
+
+        for i from 0 <= i < GLYPH_CACHE_WAYS:
+
+            if entries[i].index == index:
+                self.cache_hits += 1
+                entries[i].used = self.cache_clock
+                return &(entries[i])
+
+            # Replace the least recently used entry.
+            if entries[i].used < rv.used:
+                rv = &(entries[i])
+
+        self.cache_misses += 1
 
         rv.index = index
+        rv.used = self.cache_clock
 
         error = FT_Load_Glyph(face, index, FT_LOAD_FORCE_AUTOHINT)
         if error:
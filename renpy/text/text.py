@@ -20,6 +20,7 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import math
+import collections
 import renpy.display
 
 from renpy.text.textsupport import TAG, TEXT, PARAGRAPH, DISPLAYABLE
@@ -1077,15 +1078,180 @@ LAYOUT_CACHE_SIZE = 50
 layout_cache_old = { }
 layout_cache_new = { }
 
+# A map from the parent, name, and prefix of a style without properties of
+# its own to its style key. This lasts for a single interaction.
+style_key_cache = { }
+
+# The style properties that can change how text is laid out.
+LAYOUT_STYLE_PROPERTIES = (
+    "antialias",
+    "vertical",
+    "font",
+    "size",
+    "bold",
+    "italic",
+    "underline",
+    "strikethrough",
+    "color",
+    "black_color",
+    "kerning",
+    "slow_cps",
+    "slow_cps_multiplier",
+    "language",
+    "layout",
+    "first_indent",
+    "rest_indent",
+    "newline_indent",
+    "line_spacing",
+    "line_leading",
+    "line_overlap_split",
+    "min_width",
+    "text_align",
+    "justify",
+    "outlines",
+    "drop_shadow",
+    "drop_shadow_color",
+    "hyperlink_functions",
+    )
+
+# The properties of the ruby style that can change how text is laid out.
+# Ruby text is placed using the yoffset of the ruby style.
+RUBY_STYLE_PROPERTIES = LAYOUT_STYLE_PROPERTIES + (
+    "yoffset",
+    )
+
+def hashable(value):
+    """
+    Converts lists in `value` (like the lists of outlines) into tuples, so
+    it can be used as part of a dictionary key.
+    """
+
+    if isinstance(value, list):
+        return tuple(hashable(i) for i in value)
+
+    return value
+
+def style_key(style):
+    """
+    Returns a tuple giving the values of the properties of `style` that
+    affect layout.
+    """
+
+    rv = tuple(hashable(getattr(style, i)) for i in LAYOUT_STYLE_PROPERTIES)
+
+    # Ruby doesn't nest, so the ruby_style of the ruby style (often the
+    # ruby style itself) isn't used.
+    ruby_style = style.ruby_style
+
+    if ruby_style is not None:
+        rv += tuple(hashable(getattr(ruby_style, i)) for i in RUBY_STYLE_PROPERTIES)
+
+    return rv
+
+def cached_style_key(style):
+    """
+    Returns the style key of `style`. Every displayable has its own style
+    object, but the ones created without properties of their own lay out
+    text the same way as other styles with the same parent and prefix, so
+    their style key is computed once per interaction.
+    """
+
+    if style.properties:
+        return style_key(style)
+
+    group = (style.parent, style.name, style.prefix)
+
+    try:
+        rv = style_key_cache.get(group, None)
+    except TypeError:
+        return style_key(style)
+
+    if rv is None:
+        rv = style_key_cache[group] = style_key(style)
+
+    return rv
+
+class LayoutCache(object):
+    """
+    A least-recently-used cache of layouts, keyed by the tokens and style
+    of a Text, and the width it was laid out at. This lets Text objects that
+    show the same text in the same way share a layout, even when the Text
+    objects are re-created, as happens when a screen is updated.
+    """
+
+    def __init__(self):
+
+        # A map from key to layout, with the most recently used layout
+        # last.
+        self.layouts = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.layouts.clear()
+
+    def get(self, key):
+        """
+        Returns the layout for `key`, or None if it isn't in the cache.
+        """
+
+        rv = self.layouts.pop(key, None)
+
+        if rv is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.layouts[key] = rv
+
+        return rv
+
+    def peek(self, key):
+        """
+        Returns the layout for `key`, or None if it isn't in the cache,
+        without changing the order of the cache or the statistics.
+        """
+
+        return self.layouts.get(key, None)
+
+    def add(self, key, layout):
+        """
+        Adds `layout` to the cache, evicting the least recently used
+        layouts if the cache is too big.
+        """
+
+        self.layouts[key] = layout
+
+        while len(self.layouts) > renpy.config.text_layout_cache_size:
+            self.layouts.popitem(False)
+
+    def get_stats(self):
+        return { "layouts" : len(self.layouts), "hits" : self.hits, "misses" : self.misses }
+
+# The shared cache of layouts.
+layout_cache = LayoutCache()
+
 def layout_cache_clear():
     """
-    Clears the old and new layout caches.
+    Clears the old and new layout caches, and the shared layout cache.
     """
 
     global layout_cache_old, layout_cache_new
     layout_cache_old = { }
     layout_cache_new = { }
 
+    style_key_cache.clear()
+    layout_cache.clear()
+
+def get_layout_cache_stats():
+    """
+    Returns a dictionary giving the number of layouts in the shared layout
+    cache, and the number of times a layout was and was not found there.
+    """
+
+    return layout_cache.get_stats()
+
 def layout_cache_tick():
     """
     Called once per interaction, to merge the old and new layout caches.
@@ -1095,6 +1261,8 @@ def layout_cache_tick():
     layout_cache_old = layout_cache_new
     layout_cache_new = { }
 
+    style_key_cache.clear()
+
 VERT_REVERSE = renpy.display.render.Matrix2D(0, -1, 1, 0)
 VERT_FORWARD = renpy.display.render.Matrix2D(0, 1, -1, 0)
 
@@ -1360,6 +1528,30 @@ class Text(renpy.display.core.Displayable):
         layout_cache_old.pop(key, None)
         layout_cache_new.pop(key, None)
 
+    def layout_key(self, width, height):
+        """
+        Returns the key used to find the layout of this Text in the shared
+        layout cache, or None if the layout can't be shared.
+        """
+
+        # Layouts that contain displayables refer to the renders of those
+        # displayables, so they can't be shared.
+        if self.displayables:
+            return None
+
+        # The height is only used to log overflows, so layouts made at
+        # different heights are the same unless that's being done.
+        if not renpy.config.debug_text_overflow:
+            height = None
+
+        try:
+            rv = (tuple(self.tokens), cached_style_key(self.style), renpy.game.preferences.text_cps, width, height)
+            hash(rv)
+        except TypeError:
+            return None
+
+        return rv
+
     def get_layout(self):
         """
         Gets the layout of this Text, creating a new layout object if
@@ -1470,6 +1662,14 @@ class Text(renpy.display.core.Displayable):
         for i in self.displayables:
             renders[i] = renpy.display.render.render(i, width, self.style.size, st, at)
 
+        key = self.layout_key(width, height)
+
+        if key is not None:
+            layout = layout_cache.peek(key)
+
+            if layout is not None:
+                return layout.size
+
         layout = Layout(self, width, height, renders, size_only=True)
 
         return layout.size
@@ -1498,8 +1698,22 @@ class Text(renpy.display.core.Displayable):
         # Find the layout, and update to the new size and width if necessary.
         layout = self.get_layout()
 
-        if layout is None or layout.width != width or layout.height != height:
-            layout = Layout(self, width, height, renders)
+        if layout is None or layout.width != width or (layout.height != height and renpy.config.debug_text_overflow):
+
+            key = self.layout_key(width, height)
+
+            if key is not None:
+                layout = layout_cache.get(key)
+            else:
+                layout = None
+
+            if layout is None:
+                layout = Layout(self, width, height, renders)
+
+                # Hyperlinks are styled and focused per-Text, so layouts
+                # containing them aren't shared.
+                if key is not None and not layout.has_hyperlinks:
+                    layout_cache.add(key, layout)
 
             if len(layout_cache_new) > LAYOUT_CACHE_SIZE:
                 layout_cache_new.clear()
@@ -1663,6 +1877,90 @@ class Text(renpy.display.core.Displayable):
 
         return new_tokens, displayables
 
+def layout_texts(texts, width, height):
+    """
+    Lays out the Text objects in `texts` in a single pass, as they will be
+    laid out when rendered at `width` and `height`. This is called by boxes
+    that give each child the same width, like the vbox of a history screen,
+    before they render their children. (Texts nested in other displayables,
+    like the windows of NVL mode, still share their style keys through
+    cached_style_key.)
+
+    Texts with the same tokens and style share a layout, and the layouts
+    are stored in the layout caches, where rendering the texts finds them.
+    Other displayables in `texts`, and texts that can't be laid out in
+    advance, are skipped.
+    """
+
+    # A map from layout key to a layout made or found in this pass.
+    layouts = { }
+
+    # A list of (text, layout) pairs.
+    laid_out = [ ]
+
+    for t in texts:
+
+        if not isinstance(t, Text):
+            continue
+
+        style = t.style
+
+        if style.vertical:
+            continue
+
+        # Apply xmaximum the way renpy.display.render.render will. A float
+        # is applied at single precision, so the width can't be predicted.
+        xmaximum = style.xmaximum
+
+        if xmaximum is None:
+            w = width
+        elif isinstance(xmaximum, float):
+            continue
+        else:
+            w = min(xmaximum, width)
+
+        w = max(w, 0)
+
+        if t.dirty or t.displayables is None:
+            t.update()
+
+        layout = t.get_layout()
+
+        if layout is not None and layout.width == w:
+            continue
+
+        key = t.layout_key(w, height)
+
+        if key is None:
+            continue
+
+        layout = layouts.get(key, None)
+
+        if layout is None:
+            layout = layout_cache.get(key)
+
+        if layout is None:
+            layout = Layout(t, w, height, { })
+
+            # Hyperlinks are styled and focused per-Text, so layouts
+            # containing them aren't shared.
+            if layout.has_hyperlinks:
+                laid_out.append((t, layout))
+                continue
+
+            layout_cache.add(key, layout)
+
+        layouts[key] = layout
+        laid_out.append((t, layout))
+
+    # The whole pass is kept, even if it's larger than LAYOUT_CACHE_SIZE,
+    # so that rendering the texts finds all of their layouts.
+    if len(layout_cache_new) + len(laid_out) > LAYOUT_CACHE_SIZE:
+        layout_cache_new.clear()
+
+    for t, layout in laid_out:
+        layout_cache_new[id(t)] = layout
+
 language_tailor = textsupport.language_tailor
 
 # Compatibility, in case one of these was pickled.
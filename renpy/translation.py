@@ -815,7 +815,7 @@ def translate_command():
     else:
         filter = null_filter #@ReservedAssignment
 
-    for dirname, filename in renpy.loader.listdirfiles():
+    for dirname, filename in renpy.loader.listdirfiles(archived=False):
         if dirname is None:
             continue
 
@@ -1012,7 +1012,7 @@ def dialogue_command():
 
             f.write("\t".join(line).encode("utf-8") + "\n")
 
-    for dirname, filename in renpy.loader.listdirfiles():
+    for dirname, filename in renpy.loader.listdirfiles(archived=False):
         if dirname is None:
             continue
 
@@ -51,6 +51,9 @@ def warp():
     if not renpy.config.developer:
         raise Exception("Can't warp, developer mode disabled.")
 
+    # Warping needs to see every statement.
+    renpy.game.script.load_all_lazy()
+
     # First, compute for each statement reachable from a scene statement,
     # one statement that reaches that statement.
 
@@ -0,0 +1,172 @@
+#@PydevCodeAnalysisIgnore
+import unittest
+import tempfile
+import shutil
+import os
+import zlib
+import md5
+from cPickle import dumps
+
+import renpy
+renpy.import_all()
+
+import renpy.loader as loader
+
+
+def write_rpa3(fn, files):
+    """
+    Writes an RPA-3.0 archive containing `files`, a map from name to data.
+    """
+
+    key = 0x42424242
+
+    f = open(fn, "wb")
+    f.write("RPA-3.0 XXXXXXXXXXXXXXXX XXXXXXXX\n")
+
+    index = { }
+
+    for name, data in sorted(files.items()):
+        index[name] = [ (f.tell() ^ key, len(data) ^ key) ]
+        f.write(data)
+
+    offset = f.tell()
+    f.write(dumps(index, 2).encode("zlib"))
+
+    f.seek(0)
+    f.write("RPA-3.0 %016x %08x\n" % (offset, key))
+    f.close()
+
+
+def write_rpa4(fn, files):
+    """
+    Writes an RPA-4.0 archive containing `files`, a map from name to data,
+    in the same way as the launcher's archiver.
+    """
+
+    f = open(fn, "wb")
+    f.write("RPA-4.0 XXXXXXXXXXXXXXXX XXXXXXXX XXXXXXXX\n")
+
+    index = { }
+
+    for name, data in files.items():
+        stored = zlib.compress(data)
+        index[name.encode("utf-8")] = (f.tell(), len(stored), len(data), md5.md5(data).digest())
+        f.write(stored)
+
+    def key(name):
+        name = name.decode("utf-8")
+        return (name.lower(), name)
+
+    indexoff = f.tell()
+
+    names = [ ]
+    name_offset = 0
+    scripts = [ ]
+
+    for i, name in enumerate(sorted(index, key=key)):
+        offset, stored, length, digest = index[name]
+
+        f.write(loader.RPA4_ENTRY.pack(name_offset, len(name), offset, stored, length, digest, loader.RPA4_ZLIB))
+
+        if name.endswith(loader.SCRIPT_EXTENSIONS):
+            scripts.append(i)
+
+        names.append(name)
+        name_offset += len(name)
+
+    for i in scripts:
+        f.write(loader.RPA4_SCRIPT.pack(i))
+
+    f.write("".join(names))
+
+    f.seek(0)
+    f.write("RPA-4.0 %016x %08x %08x\n" % (indexoff, len(index), len(scripts)))
+    f.close()
+
+
+FILES = {
+    u"script.rpyc" : "script",
+    u"images/Eileen Happy.png" : "happy",
+    u"images/eileen concerned.png" : "concerned",
+    u"images/EILEEN CONCERNED.png" : "CONCERNED",
+    u"music/\u00e9t\u00e9.ogg" : "summer",
+    u"sub/options.rpymc" : "options",
+    }
+
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.old_archives = renpy.config.archives
+        self.old_searchpath = renpy.config.searchpath
+        self.old_basedir = renpy.config.basedir
+        self.old_loader_archives = loader.archives
+
+        self.gamedir = tempfile.mkdtemp()
+
+        renpy.config.basedir = self.gamedir
+        renpy.config.searchpath = [ self.gamedir ]
+        renpy.config.archives = [ "rpa3", "rpa4" ]
+
+        write_rpa3(os.path.join(self.gamedir, "rpa3.rpa"), { u"three.txt" : "three" })
+        write_rpa4(os.path.join(self.gamedir, "rpa4.rpa"), FILES)
+
+        loader.old_config_archives = None
+        loader.index_archives()
+
+    def tearDown(self):
+        renpy.config.archives = self.old_archives
+        renpy.config.searchpath = self.old_searchpath
+        renpy.config.basedir = self.old_basedir
+
+        loader.archives = self.old_loader_archives
+        loader.old_config_archives = None
+        loader.lower_map.clear()
+        loader.loadable_cache.clear()
+
+        shutil.rmtree(self.gamedir)
+
+    def test_index_not_read(self):
+        for archive in loader.archives:
+            assert archive._index is None
+
+    def test_scripts(self):
+
+        # The scripts in an RPA-4.0 archive are listed without walking
+        # its names.
+        loader.archives[1].names = None
+
+        files = loader.listdirfiles(archived="scripts")
+        assert loader.archives[0]._index is not None
+
+        archived = sorted(fn for dn, fn in files if dn is None)
+        assert archived == [ u"script.rpyc", u"sub/options.rpymc" ]
+
+    def test_names(self):
+        names = sorted(loader.archives[1].names())
+        assert names == sorted(FILES)
+
+    def test_find(self):
+        archive = loader.archives[1]
+
+        for name in FILES:
+            assert archive.find(name) == name
+            assert archive.load(name).read() == FILES[name]
+
+        assert archive.find("images/eileen happy.png") == u"images/Eileen Happy.png"
+        assert archive.find(u"MUSIC/\u00c9T\u00c9.ogg") == u"music/\u00e9t\u00e9.ogg"
+        assert archive.find("images/Eileen Concerned.png") in (u"images/eileen concerned.png", u"images/EILEEN CONCERNED.png")
+
+        assert archive.find("images/eileen") is None
+        assert archive.find("zzz") is None
+        assert archive.find("") is None
+
+    def test_load(self):
+        assert loader.load("Three.TXT").read() == "three"
+        assert loader.load("IMAGES/EILEEN HAPPY.PNG").read() == "happy"
+        assert loader.loadable("Script.rpyc")
+        assert not loader.loadable("missing.rpyc")
+
+
+if __name__ == "__main__":
+    unittest.main()
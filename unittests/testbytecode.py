@@ -0,0 +1,170 @@
+#@PydevCodeAnalysisIgnore
+import unittest
+import tempfile
+import shutil
+
+import renpy
+renpy.import_all()
+
+from renpy.script import Script, MAGIC, dumps, loads
+from renpy.ast import PyCode
+
+
+class CacheScript(Script):
+    """
+    A script that only has the parts needed to use the bytecode cache.
+    """
+
+    def __init__(self, label=None):
+        renpy.game.script = self
+
+        # The pickled label read by read_lazy.
+        self.label = label
+
+        self.lazy = True
+        self.namemap = { }
+        self.lazy_names = { }
+        self.all_stmts = None
+        self.all_pycode = [ ]
+        self.record_pycode = True
+        self.bytecode_newcache = { }
+        self.bytecode_newowners = { }
+        self.bytecode_dirty = set()
+        self.bytecode_saved = False
+
+        self.translator = renpy.translation.ScriptTranslator()
+
+        self.init_bytecode()
+
+    def read_lazy(self, stub):
+        return [ loads(self.label) ]
+
+
+class TestBytecode(unittest.TestCase):
+
+    def setUp(self):
+        self.old_searchpath = renpy.config.searchpath
+        self.old_basedir = renpy.config.basedir
+        self.old_script = renpy.game.script
+        self.old_preferences = renpy.game.preferences
+
+        self.gamedir = tempfile.mkdtemp()
+        renpy.config.searchpath = [ self.gamedir ]
+        renpy.config.basedir = self.gamedir
+        renpy.game.preferences = renpy.preferences.Preferences()
+
+    def tearDown(self):
+        renpy.config.searchpath = self.old_searchpath
+        renpy.config.basedir = self.old_basedir
+        renpy.game.script = self.old_script
+        renpy.game.preferences = self.old_preferences
+
+        shutil.rmtree(self.gamedir)
+
+    def make_label(self, source="lazy = 1"):
+        CacheScript()
+
+        loc = ("test.rpy", 10)
+        label = renpy.ast.Label(loc, "lazy", [ renpy.ast.Python(loc, source) ], None)
+
+        return dumps(label, 2)
+
+    def cached(self, script, code):
+        shard = script.bytecode_shard(code.location[0])
+        return (code.get_hash() + MAGIC) in script.load_bytecode_shard(shard)
+
+    def add_stub(self, script):
+        stub = renpy.ast.LazyLabel(("test.rpy", 10), [ "lazy" ], 0, 0)
+        stub.name = ("lazy", "lazy")
+        stub.rpyc = "test.rpyc"
+        stub.next = None
+
+        script.lazy_names["lazy"] = stub
+
+    def load_lazy(self, script):
+        self.add_stub(script)
+        return script.lookup_lazy("lazy").block[0].code
+
+    def test_lazy_label_cached(self):
+
+        label = self.make_label()
+
+        # The first run compiles the code in the label when it's loaded,
+        # after init.
+        script = CacheScript(label)
+        script.save_bytecode()
+
+        code = self.load_lazy(script)
+        assert script.bytecode_dirty == set()
+
+        # The second run finds it in the cache.
+        script = CacheScript(label)
+        script.save_bytecode()
+
+        assert self.cached(script, code)
+
+        self.load_lazy(script)
+        assert script.bytecode_dirty == set()
+
+    def test_keep_unloaded_code(self):
+
+        label = self.make_label()
+
+        # A run that loads the label.
+        script = CacheScript(label)
+        code = self.load_lazy(script)
+        script.save_bytecode()
+
+        # A run that doesn't load the label, but compiles b from the same
+        # file.
+        script = CacheScript(label)
+        self.add_stub(script)
+        b = PyCode("b = 2", ("test.rpy", 2))
+        script.update_bytecode()
+        script.save_bytecode()
+
+        script = CacheScript()
+        assert self.cached(script, code)
+        assert self.cached(script, b)
+
+    def test_drop_removed_code(self):
+
+        label = self.make_label()
+
+        # A run that loads a and the label.
+        script = CacheScript(label)
+        a = PyCode("a = 1", ("test.rpy", 1))
+        script.update_bytecode()
+        code = self.load_lazy(script)
+        script.save_bytecode()
+
+        # A run after a and the label have been removed.
+        script = CacheScript()
+        b = PyCode("b = 2", ("test.rpy", 2))
+        script.update_bytecode()
+        script.save_bytecode()
+
+        script = CacheScript()
+        assert not self.cached(script, a)
+        assert not self.cached(script, code)
+        assert self.cached(script, b)
+
+    def test_drop_changed_label_code(self):
+
+        # A run that loads the label.
+        script = CacheScript(self.make_label())
+        old = self.load_lazy(script)
+        script.save_bytecode()
+
+        # A run that loads the label after it's been changed.
+        script = CacheScript(self.make_label("lazy = 2"))
+        new = self.load_lazy(script)
+        script.save_bytecode()
+
+        script = CacheScript()
+        assert not self.cached(script, old)
+        assert self.cached(script, new)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+#@PydevCodeAnalysisIgnore
+import unittest
+
+import renpy
+renpy.import_all()
+from renpy.display.focus import Focus, FocusIndex
+
+
+class TestFocusIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.focuses = [
+            Focus("default", None, None, None, None, None),
+            Focus("a", None, 0, 0, 200, 100),
+            Focus("b", None, 100, 50, 50, 50),
+            Focus("b", 1, 300, 300, 10, 10),
+            ]
+
+        self.index = FocusIndex(self.focuses)
+
+    def test_at_point(self):
+        assert self.index.at_point(10, 10).widget == "a"
+        assert self.index.at_point(120, 60).widget == "b"
+        assert self.index.at_point(150, 60).widget == "a"
+        assert self.index.at_point(305, 305).arg == 1
+        assert self.index.at_point(500, 500) is None
+
+    def test_find(self):
+        assert self.index.find("b", 1) is self.focuses[3]
+        assert self.index.find("default", None) is self.focuses[0]
+        assert self.index.find("c", None) is None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+#@PydevCodeAnalysisIgnore
+import unittest
+import threading
+import time
+
+import renpy
+renpy.import_all()
+
+import pygame
+from renpy.display.im import Cache, ImageBase
+
+
+class FakeDraw(object):
+
+    def __init__(self):
+        self.textures = [ ]
+
+    def mutated_surface(self, surf):
+        pass
+
+    def load_texture(self, surf, transient=False):
+        self.textures.append(surf)
+
+
+class CountingImage(ImageBase):
+    """
+    An image that records how many times it has been loaded.
+    """
+
+    loads = [ ]
+    lock = threading.Lock()
+
+    def __init__(self, name, size=4):
+        super(CountingImage, self).__init__(name, size)
+        self.name = name
+        self.size = size
+
+    def load(self):
+        with self.lock:
+            self.loads.append(self.name)
+
+        time.sleep(.001)
+
+        return pygame.Surface((self.size, self.size), pygame.SRCALPHA, 32)
+
+
+class TestImageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.old_draw = renpy.display.draw
+        self.old_preload_threads = renpy.config.preload_threads
+        self.old_priority = renpy.display.predict.priority
+        renpy.display.draw = FakeDraw()
+
+        CountingImage.loads = [ ]
+
+        self.cache = Cache()
+        self.cache.cache_limit = 1000000
+
+    def tearDown(self):
+        self.cache.quit()
+        renpy.display.draw = self.old_draw
+        renpy.config.preload_threads = self.old_preload_threads
+        renpy.display.predict.priority = self.old_priority
+
+    def check_consistent(self):
+        cache = self.cache
+
+        assert cache.total_cache_size == sum(ce.size for ce in cache.cache.values())
+        assert cache.total_cache_bytes == sum(ce.bytes for ce in cache.cache.values())
+
+        in_generations = { }
+
+        for t, generation in cache.generations.items():
+            assert generation
+
+            for image, ce in generation.items():
+                assert ce.time == t
+                in_generations[image] = ce
+
+        assert in_generations == cache.cache
+
+    def run_threads(self, function, count=8):
+        threads = [ threading.Thread(target=function) for _i in range(count) ]
+
+        for t in threads:
+            t.start()
+
+        for t in threads:
+            t.join()
+
+    def test_concurrent_get(self):
+
+        def get():
+            for i in range(200):
+                self.cache.get(CountingImage(i % 25))
+
+        self.run_threads(get)
+
+        # Each image is loaded once, even though many threads asked for it
+        # at the same time.
+        assert sorted(CountingImage.loads) == range(25)
+
+        # Hits are counted without the lock, as only the main thread
+        # counts them outside of this test, so only the misses are exact.
+        stats = self.cache.get_stats()
+        assert stats["misses"] == 25
+        assert stats["entries"] == 25
+
+        self.check_consistent()
+
+    def test_concurrent_eviction(self):
+
+        self.cache.cache_limit = 20 * 16
+
+        def get():
+            for i in range(100):
+                self.cache.get(CountingImage(i))
+
+                if i % 10 == 0:
+                    with self.cache.lock:
+                        self.cache.tick()
+                        self.cache.cleanout()
+
+        self.run_threads(get, 4)
+
+        with self.cache.lock:
+            self.cache.tick()
+            self.cache.cleanout()
+
+        assert self.cache.total_cache_size <= self.cache.cache_limit
+        assert self.cache.get_stats()["evictions"] > 0
+
+        self.check_consistent()
+
+    def test_preload_threads(self):
+
+        renpy.config.preload_threads = 4
+        self.cache.init()
+
+        assert len(self.cache.preload_threads) == 4
+
+        for i in range(50):
+            self.cache.preload_image(CountingImage(i))
+
+        self.wait_for_preloads(50)
+        assert sorted(CountingImage.loads) == range(50)
+
+        # Textures are only loaded on the main thread.
+        assert not renpy.display.draw.textures
+        assert len(self.cache.pending_textures) == 50
+
+        self.cache.load_pending_textures()
+        assert len(renpy.display.draw.textures) == 50
+
+        self.check_consistent()
+
+    def wait_for_preloads(self, count):
+        deadline = time.time() + 10
+
+        while len(self.cache.cache) < count and time.time() < deadline:
+            self.cache.start_prediction()
+            time.sleep(.01)
+
+        assert len(self.cache.cache) == count
+
+    def test_preload_priority(self):
+
+        renpy.config.preload_threads = 1
+        self.cache.init()
+
+        # Queue up every image before the preload thread can take any of
+        # them, so it chooses between all of them.
+        with self.cache.lock:
+            for i in range(50):
+                renpy.display.predict.priority = i % 5
+                self.cache.preload_image(CountingImage(i))
+
+        self.wait_for_preloads(50)
+
+        # Images with a lower priority are loaded first, and images with
+        # the same priority in the order they were predicted.
+        assert CountingImage.loads == sorted(range(50), key=lambda i : (i % 5, i))
+
+        # Textures are only loaded on the main thread.
+        assert not renpy.display.draw.textures
+        assert len(self.cache.pending_textures) == 50
+
+        self.cache.load_pending_textures()
+        assert len(renpy.display.draw.textures) == 50
+
+        self.check_consistent()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+#@PydevCodeAnalysisIgnore
+import unittest
+import tempfile
+import shutil
+import os
+import md5
+
+import renpy
+renpy.import_all()
+
+import renpy.script
+from renpy.script import Script, dumps
+
+
+class Args(object):
+    command = "run"
+    compile = False
+
+
+class TestParseParallel(unittest.TestCase):
+
+    def setUp(self):
+        self.old_args = renpy.game.args
+        self.old_parse_files = renpy.script.parse_files
+        self.old_script_version = renpy.script.script_version
+
+        renpy.game.args = Args()
+        renpy.script.parse_files = self.parse_files
+        self.parsed = None
+
+        self.gamedir = tempfile.mkdtemp()
+
+        for fn in [ "a", "b" ]:
+            source = "label %s:\n    return\n" % fn
+            data = { "version" : renpy.script.script_version, "key" : "unlocked" }
+
+            with open(os.path.join(self.gamedir, fn + ".rpy"), "wb") as f:
+                f.write(source)
+
+            with open(os.path.join(self.gamedir, fn + ".rpyc"), "wb") as f:
+                f.write(dumps((data, [ ]), 2).encode("zlib"))
+                f.write(md5.md5(source).digest())
+
+    def tearDown(self):
+        renpy.game.args = self.old_args
+        renpy.script.parse_files = self.old_parse_files
+        renpy.script.script_version = self.old_script_version
+
+        shutil.rmtree(self.gamedir)
+
+    def parse_files(self, filenames, processes):
+        self.parsed = filenames
+        return { }
+
+    def parse_parallel(self):
+        script = Script.__new__(Script)
+        script.key = None
+        script.parsed = { }
+
+        script.parse_parallel([ ("a", self.gamedir), ("b", self.gamedir) ])
+
+        if self.parsed is None:
+            return None
+
+        return [ os.path.basename(i) for i in self.parsed ]
+
+    def test_current(self):
+        assert self.parse_parallel() is None
+
+    def test_script_version(self):
+        renpy.script.script_version += 1
+        assert self.parse_parallel() == [ "a.rpy", "b.rpy" ]
+
+    def test_compile(self):
+        renpy.game.args.compile = True
+        assert self.parse_parallel() == [ "a.rpy", "b.rpy" ]
+
+    def test_changed(self):
+        with open(os.path.join(self.gamedir, "b.rpy"), "ab") as f:
+            f.write("label c:\n    return\n")
+
+        with open(os.path.join(self.gamedir, "a.rpy"), "ab") as f:
+            f.write("label d:\n    return\n")
+
+        assert self.parse_parallel() == [ "a.rpy", "b.rpy" ]
+
+
+if __name__ == "__main__":
+    unittest.main()
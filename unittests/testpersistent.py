@@ -0,0 +1,208 @@
+#@PydevCodeAnalysisIgnore
+import unittest
+import cPickle
+import tempfile
+import shutil
+import os
+
+import renpy
+renpy.import_all()
+
+import renpy.persistent
+from renpy.persistent import Persistent, TrackedDict
+from renpy.savelocation import FileLocation
+
+
+class TestPersistent(unittest.TestCase):
+
+    def setUp(self):
+        self.persistent = renpy.game.persistent = Persistent()
+
+        renpy.persistent.backup.clear()
+        renpy.persistent.changes.clear()
+
+        for k, v in vars(self.persistent).iteritems():
+            renpy.persistent.backup[k] = renpy.persistent.make_backup(v)
+
+    def test_tracked_keys(self):
+        self.persistent._seen_ever["start"] = True
+
+        assert renpy.persistent.find_changes()
+        assert renpy.persistent.changes["_seen_ever"] == set([ "start" ])
+
+        renpy.persistent.changes.clear()
+        assert not renpy.persistent.find_changes()
+
+    def test_untracked_field(self):
+        self.persistent.endings = [ "good" ]
+
+        assert renpy.persistent.find_changes()
+        assert renpy.persistent.changes["endings"] is None
+
+        self.persistent.endings.append("bad")
+        assert renpy.persistent.find_changes()
+
+    def test_pickle(self):
+        self.persistent._seen_images[("eileen", "happy")] = True
+
+        other = cPickle.loads(cPickle.dumps(self.persistent))
+        assert type(other._seen_images) is dict
+
+        other._update()
+        assert isinstance(other._seen_images, TrackedDict)
+        assert ("eileen", "happy") in other._seen_images
+
+    def test_journal(self):
+        other = cPickle.loads(cPickle.dumps(self.persistent))
+
+        self.persistent._seen_ever["start"] = True
+        self.persistent.endings = [ "good" ]
+        renpy.persistent.find_changes()
+
+        records = renpy.persistent.journal_records()
+        renpy.persistent.apply_journal(other, records)
+
+        assert other._seen_ever == { "start" : True }
+        assert other.endings == [ "good" ]
+        assert other._changed == self.persistent._changed
+
+    def test_merge(self):
+        other = Persistent()
+        other.endings = [ "good" ]
+        other._changed["endings"] = 1
+
+        renpy.persistent.merge(other)
+
+        assert self.persistent.endings == [ "good" ]
+        assert renpy.persistent.changes["endings"] is None
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.old_location = renpy.loadsave.location
+        self.old_journal_size = renpy.config.persistent_journal_size
+
+        self.directory = tempfile.mkdtemp()
+        self.location = FileLocation(self.directory)
+
+        renpy.loadsave.location = self.location
+        renpy.config.persistent_journal_size = 1024 * 1024
+
+        self.persistent = renpy.game.persistent = Persistent()
+
+        renpy.persistent.backup.clear()
+        renpy.persistent.changes.clear()
+
+        for k, v in vars(self.persistent).iteritems():
+            renpy.persistent.backup[k] = renpy.persistent.make_backup(v)
+
+        # The first save writes the whole file.
+        renpy.persistent.save()
+
+    def tearDown(self):
+        renpy.loadsave.location = self.old_location
+        renpy.config.persistent_journal_size = self.old_journal_size
+
+        shutil.rmtree(self.directory)
+
+    def change(self, **kwargs):
+        for k, v in kwargs.iteritems():
+            setattr(self.persistent, k, v)
+
+        renpy.persistent.find_changes()
+        renpy.persistent.save()
+
+    def load(self):
+        return renpy.persistent.load(self.location.persistent)
+
+    def journal_size(self):
+        return os.path.getsize(self.location.persistent_journal)
+
+    def test_journal(self):
+        self.change(a=1)
+        self.change(b=2)
+
+        assert os.path.exists(self.location.persistent_journal)
+
+        other = self.load()
+        assert other.a == 1
+        assert other.b == 2
+
+    def test_header(self):
+        self.change(a=1)
+
+        # The journal doesn't apply to a persistent file with different
+        # contents.
+        replaced = Persistent()
+        replaced.c = 3
+
+        with open(self.location.persistent, "wb") as f:
+            f.write(cPickle.dumps(replaced).encode("zlib"))
+
+        other = self.load()
+        assert other.a is None
+        assert other.c == 3
+
+    def test_partial_entry(self):
+        self.change(a=1)
+
+        entry = renpy.persistent.journal_entry([ ("field", "b", 2) ])
+
+        with open(self.location.persistent_journal, "ab") as f:
+            f.write(entry[:-4])
+
+        other = self.load()
+        assert other.a == 1
+        assert other.b is None
+
+    def test_compact(self):
+        self.change(a=1)
+
+        data = renpy.persistent.dump_persistent()
+        offset = self.journal_size()
+
+        self.change(b=2)
+
+        size = self.journal_size()
+
+        self.location.compact_journal(data, offset, self.location.persistent_generation)
+
+        # The persistent file contains a, and the journal only b.
+        header = renpy.persistent.journal_header(data.encode("zlib"))
+
+        with open(self.location.persistent_journal, "rb") as f:
+            assert f.readline() == header
+
+        assert self.journal_size() == len(header) + size - offset
+
+        other = self.load()
+        assert other.a == 1
+        assert other.b == 2
+
+    def test_replaced(self):
+        self.change(a=1)
+
+        # Another process replaces the persistent file.
+        other = Persistent()
+        other.c = 3
+
+        with open(self.location.persistent, "wb") as f:
+            f.write(cPickle.dumps(other).encode("zlib"))
+
+        mtime = os.path.getmtime(self.location.persistent) - 10
+        os.utime(self.location.persistent, (mtime, mtime))
+
+        # So the next save writes the whole file, rather than journaling.
+        self.change(b=2)
+
+        assert not os.path.exists(self.location.persistent_journal)
+
+        other = self.load()
+        assert other.a == 1
+        assert other.b == 2
+        assert other.c is None
+
+
+if __name__ == "__main__":
+    unittest.main()
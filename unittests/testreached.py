@@ -0,0 +1,64 @@
+#@PydevCodeAnalysisIgnore
+import unittest
+
+import renpy
+renpy.import_all()
+from renpy.python import reached, NoRollback, RevertableObject, RevertableDict
+
+
+class Hidden(NoRollback):
+    pass
+
+
+class TestReached(unittest.TestCase):
+
+    def setUp(self):
+        self.old_log = renpy.game.log
+
+        # Changes to revertable objects are recorded in the log.
+        renpy.game.log = renpy.python.RollbackLog()
+
+    def tearDown(self):
+        renpy.game.log = self.old_log
+
+    def test_containers(self):
+        o = RevertableObject()
+        o.hidden = Hidden()
+        o.values = [ RevertableObject() ]
+
+        key = RevertableObject()
+        d = RevertableDict()
+        d[key] = RevertableObject()
+
+        reachable = { }
+        reached((o, d), reachable, None)
+
+        assert reachable[id(o)] == 1
+        assert reachable[id(o.hidden)] == 0
+        assert reachable[id(o.values[0])] == 1
+        assert reachable[id(key)] == 1
+        assert reachable[id(d[key])] == 1
+
+    def test_deep(self):
+        head = None
+
+        for _i in range(50000):
+            o = RevertableObject()
+            o.next = head
+            head = o
+
+        reachable = { }
+        reached(head, reachable, None)
+
+        assert len(reachable) == 50000
+
+    def test_wait(self):
+        calls = [ ]
+
+        reached([ RevertableObject(), RevertableObject() ], { }, lambda : calls.append(1))
+
+        assert calls
+
+
+if __name__ == "__main__":
+    unittest.main()
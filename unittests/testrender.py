@@ -0,0 +1,151 @@
+#@PydevCodeAnalysisIgnore
+import unittest
+import random
+import collections
+
+import renpy
+renpy.import_all()
+
+import renpy.display.render as render
+from renpy.display.render import Render
+
+
+class TestMarkSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.old_screen_render = render.screen_render
+
+        render.screen_render = None
+        render.mark_sweep()
+
+    def tearDown(self):
+        render.screen_render = None
+        render.mark_sweep()
+
+        render.screen_render = self.old_screen_render
+
+    def check(self, renders):
+        """
+        Checks the results of mark_sweep against a full walk of the renders
+        reachable from the screen.
+        """
+
+        reachable = set()
+        refcounts = collections.Counter()
+
+        if render.screen_render is not None:
+            worklist = [ render.screen_render ]
+            refcounts[render.screen_render] += 1
+        else:
+            worklist = [ ]
+
+        while worklist:
+            r = worklist.pop()
+
+            if r in reachable:
+                continue
+
+            reachable.add(r)
+
+            for j in r.depends_on_list:
+                refcounts[j] += 1
+                worklist.append(j)
+
+        for r in renders:
+            if r in reachable:
+                assert r.live
+                assert r.refcount == refcounts[r]
+            else:
+                assert not r.live
+                assert r.cache_killed
+                assert r.refcount == 0
+
+        assert render.get_render_stats()["live"] == len(reachable)
+
+        return reachable
+
+    def test_random_frames(self):
+
+        rng = random.Random(0)
+
+        renders = [ ]
+        reachable = [ ]
+        root = None
+
+        # Every render only depends on renders of a lower rank, so there
+        # are no cycles.
+        rank = { }
+
+        for _frame in range(200):
+
+            # The renders that are found in the render cache this frame.
+            cached = [ r for r in reachable if rng.random() < .7 ]
+
+            # New renders are built from the bottom up, from cached renders
+            # and renders made earlier in the frame.
+            new = [ ]
+
+            for _i in range(rng.randint(0, 20)):
+                r = Render(10, 10)
+                rank[r] = 0
+
+                for c in rng.sample(cached + new, min(3, len(cached + new))):
+                    if rng.random() < .5:
+                        r.blit(c, (0, 0))
+                    else:
+                        r.depends_on(c)
+
+                    rank[r] = max(rank[r], rank[c] + 1)
+
+                new.append(r)
+
+            # A cached render that comes to depend on a new render, or on
+            # an older cached render.
+            if cached and rng.random() < .2:
+                r = Render(1, 1)
+                c = rng.choice(cached)
+                c.depends_on(r)
+                rank[r] = rank[c] - 1
+                new.append(r)
+
+            if len(cached) > 1 and rng.random() < .2:
+                a, b = sorted(rng.sample(cached, 2), key=rank.get)
+
+                if rank[a] < rank[b]:
+                    b.depends_on(a)
+
+            # A cached render that comes to depend on a render that has
+            # died, which was kept by something other than the cache.
+            if cached and len(renders) > len(reachable) and rng.random() < .2:
+                a = rng.choice(renders)
+                b = rng.choice(cached)
+
+                if not a.live and rank[a] < rank[b]:
+                    b.depends_on(a)
+
+            choice = rng.random()
+
+            if choice < .1:
+                render.screen_render = None
+            elif choice < .2 and root is not None and not root.cache_killed:
+                render.screen_render = root
+            else:
+                root = Render(100, 100)
+                rank[root] = 0
+
+                for c in rng.sample(cached + new, min(5, len(cached + new))):
+                    root.blit(c, (0, 0))
+                    rank[root] = max(rank[root], rank[c] + 1)
+
+                new.append(root)
+
+                render.screen_render = root
+
+            render.mark_sweep()
+
+            renders.extend(new)
+            reachable = list(self.check(renders))
+
+
+if __name__ == "__main__":
+    unittest.main()
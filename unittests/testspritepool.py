@@ -0,0 +1,88 @@
+#@PydevCodeAnalysisIgnore
+import unittest
+
+import renpy
+renpy.import_all()
+from renpy.display.layout import Null
+from renpy.display.particle import SpritePool, SnowBlossomPool
+
+
+class TestSpritePool(unittest.TestCase):
+
+    def test_add_remove(self):
+        pool = SpritePool(Null())
+
+        a = pool.add(0, 0, 10, 10, 0)
+        b = pool.add(0, 0, 10, 10, 0)
+        pool.add(0, 0, 10, 10, 0)
+        assert pool.count() == 3
+
+        pool.remove(a)
+        pool.remove(a)
+        assert pool.count() == 2
+
+        # Removed slots are reused.
+        assert pool.add(0, 0, 10, 10, 1) == a
+        assert pool.count() == 3
+
+        pool.remove(b)
+        pool.clear()
+        assert pool.count() == 0
+
+    def test_expired(self):
+        pool = SpritePool(Null())
+
+        a = pool.add(0, 0, 10, 10, 0, 1.0)
+        b = pool.add(0, 0, 10, 10, 0)
+        c = pool.add(0, 0, 10, 10, 1.0, 1.0)
+
+        assert pool.expired(0.5) == [ ]
+        assert pool.expired(1.5) == [ a ]
+
+        pool.remove(a)
+        assert pool.expired(2.0) == [ c ]
+        assert b not in pool.expired(1000.0)
+
+
+class TestSnowBlossomPool(unittest.TestCase):
+
+    def make_pool(self, start, fast=False):
+        return SnowBlossomPool(Null(), 10, (20, 50), (100, 200), 50, start, fast, False)
+
+    def test_one_per_update(self):
+        pool = self.make_pool(0)
+
+        pool.update(0)
+        assert pool.count() == 1
+
+        for i in range(1, 10):
+            pool.update(i / 60.0)
+            assert pool.count() == i + 1
+
+        pool.update(10 / 60.0)
+        assert pool.count() == 10
+
+    def test_start(self):
+        pool = self.make_pool(5)
+
+        pool.update(0)
+        assert pool.count() == 0
+
+        # The update function is kept, so the pool is rendered again while
+        # it is empty.
+        assert pool.update_function is not None
+
+        for i in range(10):
+            pool.update(5.0 + i / 60.0)
+
+        assert pool.count() == 10
+
+    def test_fast(self):
+        pool = self.make_pool(0, True)
+
+        pool.update(0)
+        assert pool.count() == 10
+
+
+if __name__ == "__main__":
+    unittest.main()